@@ -0,0 +1,130 @@
+import argparse
+import json
+import os
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from sqlalchemy import text
+from sqlalchemy.dialects.sqlite import insert
+
+from app import app
+from models import db, ReviewAnalysis
+from text_analysis import ANALYSIS_VERSION, analyze_chunk
+
+# Reviews with no analysis yet, or one made from other content or by an older version, in id order
+# from `after` on. Read a chunk at a time so the whole corpus is never in memory.
+PENDING_QUERY = text("""
+    SELECT place_reviews.id, place_reviews.content_hash, place_reviews.review_content, place_reviews.owner_response
+    FROM place_reviews LEFT JOIN review_analysis ON review_analysis.review_id = place_reviews.id
+    WHERE place_reviews.id > :after
+      AND (:redo OR review_analysis.review_id IS NULL OR review_analysis.version != :version
+           OR review_analysis.content_hash IS NOT place_reviews.content_hash)
+    ORDER BY place_reviews.id
+    LIMIT :limit""")
+
+
+def pending_chunks(connection, chunk_size, redo=False):
+    after = 0
+    while True:
+        rows = connection.execute(PENDING_QUERY, {'after': after, 'redo': redo, 'version': ANALYSIS_VERSION,
+                                                  'limit': chunk_size}).all()
+        if not rows:
+            return
+        after = rows[-1].id
+        yield [tuple(row) for row in rows]
+
+
+def save_results(connection, results):
+    table = ReviewAnalysis.__table__
+    statement = insert(table)
+    statement = statement.on_conflict_do_update(
+        index_elements=[table.c.review_id],
+        set_={column: statement.excluded[column]
+              for column in ('content_hash', 'version', 'language', 'sentiment', 'response_sentiment', 'keywords',
+                             'token_count', 'analyzed_at')})
+    analyzed_at = time.time()
+    connection.execute(statement, [dict(result, keywords=json.dumps(result['keywords'], ensure_ascii=False),
+                                         version=ANALYSIS_VERSION, analyzed_at=analyzed_at) for result in results])
+    connection.commit()
+
+
+def analyze_pending(workers=None, chunk_size=2000, redo=False):
+    # Chunks of pending reviews go to a process pool, at most two per worker at a time; this process
+    # reads the next chunks and writes each finished one in its own transaction
+    workers = workers or os.cpu_count() or 1
+    analyzed = 0
+    start = time.perf_counter()
+    with db.engine.connect() as connection, ProcessPoolExecutor(workers) as pool:
+        chunks = pending_chunks(connection, chunk_size, redo)
+        running = set()
+
+        def submit_next():
+            chunk = next(chunks, None)
+            if chunk is not None:
+                running.add(pool.submit(analyze_chunk, chunk))
+
+        for _ in range(workers * 2):
+            submit_next()
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                running.discard(future)
+                results = future.result()
+                save_results(connection, results)
+                analyzed += len(results)
+                submit_next()
+
+    elapsed = time.perf_counter() - start
+    print(f"Analyzed {analyzed} reviews in {elapsed:.2f}s with {workers} workers "
+          f"({analyzed / elapsed if elapsed else 0:.0f} reviews/s)")
+    return analyzed
+
+
+def place_summaries(top=10):
+    # Language split, average sentiment and most common keywords of every place's analyzed reviews
+    rows = db.session.execute(text("""
+        SELECT places.name AS place_name, review_analysis.language, review_analysis.sentiment,
+               review_analysis.keywords
+        FROM review_analysis
+        JOIN place_reviews ON place_reviews.id = review_analysis.review_id
+        JOIN places ON places.place_id = place_reviews.place_id
+        ORDER BY places.name"""))
+    places = {}
+    for row in rows:
+        place = places.setdefault(row.place_name, {'reviews': 0, 'sentiment': 0.0, 'languages': Counter(),
+                                                   'keywords': Counter()})
+        place['reviews'] += 1
+        place['sentiment'] += row.sentiment
+        place['languages'][row.language] += 1
+        place['keywords'].update(json.loads(row.keywords))
+    return [{
+        'place_name': name,
+        'reviews': place['reviews'],
+        'average_sentiment': round(place['sentiment'] / place['reviews'], 3),
+        'languages': dict(place['languages'].most_common()),
+        'keywords': [keyword for keyword, _ in place['keywords'].most_common(top)]
+    } for name, place in places.items()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Detect the language, sentiment and keywords of saved reviews.")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: one per CPU)")
+    parser.add_argument('--chunk-size', type=int, default=2000, help="reviews sent to a worker at a time")
+    parser.add_argument('--all', action='store_true', help="redo reviews that are already analyzed")
+    parser.add_argument('--summary', type=int, metavar='N', default=0,
+                        help="then print each place's sentiment and N most common keywords")
+    args = parser.parse_args()
+
+    with app.app_context():
+        analyze_pending(args.workers, args.chunk_size, args.all)
+        if args.summary:
+            for place in place_summaries(args.summary):
+                languages = ', '.join(f"{language} {count}" for language, count in place['languages'].items())
+                print(f"\n{place['place_name']}: {place['reviews']} reviews ({languages}), "
+                      f"average sentiment {place['average_sentiment']}")
+                print(f"  {', '.join(place['keywords'])}")
+
+
+if __name__ == '__main__':
+    main()
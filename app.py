@@ -1,28 +1,41 @@
 import csv
+import json
 import os
-import re
 import time
-from datetime import datetime, timedelta
+from datetime import datetime
+from urllib.parse import quote
 
 import bcrypt
+from markupsafe import Markup, escape
 import googlemaps
 from bs4 import BeautifulSoup
-from flask import Flask, request, render_template, redirect, url_for, flash
+from flask import Flask, Response, stream_with_context, request, render_template, redirect, url_for, flash, jsonify, abort
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
-from selenium import webdriver
 from selenium.common.exceptions import TimeoutException, NoSuchElementException
 from selenium.webdriver.common.action_chains import ActionChains
 from selenium.webdriver.common.by import By
-from selenium.webdriver.firefox.service import Service
 from selenium.webdriver.firefox.options import Options
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.common.keys import Keys
 from sqlalchemy.exc import NoResultFound
 
+from checkpoints import Checkpointer, load_checkpoint
+from driver_pool import pool_from_config
+from exports import EXPORT_FORMATS, available_formats, export_stream, iter_review_chunks
 from forms import LoginForm, RegisterForm, AccountForm
-from models import db, DBUser, Reviews, create_all
-import random
+from identity import UserCache
+from jobs import JobManager
+from metrics import PHASE_ERRORS, PLACE_LOOKUPS, REVIEW_ERRORS, REVIEWS_SCRAPED, SCRAPES, STALLED_WAITS, Gauge, registry, \
+    timed, tracing
+from network_capture import collect_captured, decode_bodies, install_capture, record_bodies
+from models import db, DBUser, UserReview, create_all, make_review_key, rebuild_review_summary
+from place_cache import PlaceCache
+from review_dates import DateNormalizer
+from snapshots import changes_since, report_dict
+from storage import SORT_COLUMNS, HIGHLIGHT_START, HIGHLIGHT_END, ReviewWriter, fresh_place, known_review_keys, \
+    mark_place_scraped, review_analytics, review_page, search_reviews, shared_reviews, user_place_id, user_place_names
+from review_parser import REVIEW_CARD_CSS, STAR_IMAGE_SRC, expand_all_reviews, fetch_review_cards_html, \
+    harvest_review_cards, parse_review_cards, rating_from_label, scroll_to_last_card, skip_review_cards
+from waits import ReviewWaiter, StallPolicy
 
 app = Flask(__name__)
 login_manager = LoginManager()
@@ -30,13 +43,86 @@ login_manager.init_app(app)
 login_manager.login_view = 'login'
 app.config['SQLALCHEMY_DATABASE_URI'] = r'sqlite:///users.sqlite'
 app.config['DEBUG'] = True
+# Scraper waits: seconds to wait for page elements, seconds to wait for each new batch of reviews,
+# and how many empty waits in a row end a scrape
+app.config['SCRAPE_PAGE_TIMEOUT'] = 10
+app.config['SCRAPE_WAIT_TIMEOUT'] = 2.0
+app.config['SCRAPE_MAX_STALLED_WAITS'] = 5
+# "New reviews only" refreshes stop after seeing this many reviews that are already saved
+app.config['REFRESH_STOP_AFTER_KNOWN'] = 3
+# Browser pool: number of Firefox instances, and when to replace one
+app.config['DRIVER_POOL_SIZE'] = 2
+app.config['DRIVER_POOL_HEADLESS'] = True
+app.config['DRIVER_POOL_MAX_USES'] = 20
+app.config['DRIVER_POOL_MAX_MEMORY_MB'] = 1500
+# Lean browsers skip images, web fonts and map tiles, which the scraper never looks at
+app.config['DRIVER_POOL_LEAN'] = True
+# Place lookup cache lifetime in seconds, for found places and for "No place found" answers
+app.config['PLACE_CACHE_TTL'] = 30 * 24 * 3600
+app.config['PLACE_CACHE_NEGATIVE_TTL'] = 24 * 3600
+# Reviews per page in All Reviews, by default and at most
+app.config['REVIEWS_PAGE_SIZE'] = 100
+app.config['REVIEWS_MAX_PAGE_SIZE'] = 500
+# Review writer: saves allowed to wait in its queue before scrapers are held back, and the most
+# review rows written in one transaction
+app.config['REVIEW_WRITER_MAX_PENDING'] = 32
+app.config['REVIEW_WRITER_BATCH_ROWS'] = 5000
+# Long scrapes save their reviews and a checkpoint every this many reviews (0 turns it off); a
+# failed scrape of the same place is resumed from its checkpoint for this many seconds.
+# Checkpoints need reviews as they are read, so they only work with 'stream' and 'network' extraction,
+# and "new reviews only" refreshes, which read the newest reviews first, are never checkpointed.
+app.config['SCRAPE_CHECKPOINT_EVERY'] = 200
+app.config['SCRAPE_CHECKPOINT_MAX_AGE'] = 7 * 24 * 3600
+# A place that anyone scraped within this many seconds is served from the shared review store
+# without opening a browser (0 always scrapes)
+app.config['SHARED_STORE_MAX_AGE'] = 24 * 3600
+# Logged-in users kept in memory, and seconds before one is read from the database again
+app.config['USER_CACHE_SIZE'] = 1024
+app.config['USER_CACHE_TTL'] = 300
+# Maximum number of reviews a search returns
+app.config['SEARCH_RESULTS_LIMIT'] = 200
+# How review cards are read: 'stream' parses each batch as it loads, 'network' decodes the review
+# panel's own JSON responses instead of the rendered cards, and 'bulk' and 'element' read every card
+# at the end of the scrape. 'bulk' and 'element' can't be checkpointed: with SCRAPE_CHECKPOINT_EVERY
+# set they stream instead, so set it to 0 to use them.
+app.config['SCRAPE_EXTRACTION'] = 'stream'
+# Folder to keep the raw review responses of 'network' scrapes in, as decoder fixtures
+app.config['SCRAPE_CAPTURE_DIR'] = os.environ.get('SCRAPE_CAPTURE_DIR')
+# Folder for per-scrape trace logs (one JSON line per phase), off when not set
+app.config['SCRAPE_TRACE_DIR'] = os.environ.get('SCRAPE_TRACE_DIR')
 db.init_app(app)
 # Replace 'Your_API_Key' with your real google API key for testing
 gmaps = googlemaps.Client(key='Your_API_Key')
 app.secret_key = os.environ.get('SECRET_KEY', 'fallback_secret_key_if_env_var_not_set')
 
-if not os.path.isfile("users.sqlite"):
-    create_all(app)
+# Creates any tables that are missing from the database
+create_all(app)
+
+# Place lookups are cached in memory and in the place_lookups table
+with app.app_context():
+    place_cache = PlaceCache(gmaps, db.engine, ttl=app.config['PLACE_CACHE_TTL'],
+                             negative_ttl=app.config['PLACE_CACHE_NEGATIVE_TTL'])
+
+# All review writes go through one background writer thread
+review_writer = ReviewWriter(app, max_pending=app.config['REVIEW_WRITER_MAX_PENDING'],
+                             max_batch_rows=app.config['REVIEW_WRITER_BATCH_ROWS'])
+
+# Logged-in users are looked up once per USER_CACHE_TTL instead of on every request
+user_cache = UserCache(max_size=app.config['USER_CACHE_SIZE'], ttl=app.config['USER_CACHE_TTL'])
+
+# Set path to geckodriver with the GECKODRIVER_PATH environment variable, otherwise it is looked up on PATH
+driver_pool = pool_from_config(app.config)
+# 0 while browsers are failing to start, e.g. when geckodriver can't be found
+registry.register(Gauge('grs_driver_pool_healthy', 'Whether the browser pool can start browsers.',
+                        lambda: int(driver_pool.healthy)))
+# Scrapes run in the background, at most one per browser in the pool
+job_manager = JobManager(max_workers=app.config['DRIVER_POOL_SIZE'])
+
+
+@app.before_request
+def start_driver_pool():
+    # Start warming up browsers as soon as the app serves its first request
+    driver_pool.start()
 
 
 class User(UserMixin):
@@ -47,14 +133,10 @@ class User(UserMixin):
         self.password = password
 
 
-# this is used by flask_login to get a user object for the current user
+# this is used by flask_login to get a user object for the current user, on every request
 @login_manager.user_loader
 def load_user(user_id):
-    user = find_user(user_id)
-    if user:
-        db_user = DBUser.query.filter_by(username=user_id).first()
-        user.password = db_user.password
-    return user
+    return user_cache.get(user_id, find_user)
 
 
 def find_user(username):
@@ -66,139 +148,64 @@ def find_user(username):
     return user
 
 
-def relative_to_absolute_date(relative_date_str):
-    # Current date
-    now = datetime.now()
+def relative_to_absolute_date(relative_date_str, reference=None):
+    # Kept for callers that convert a single string; scrapes share one DateNormalizer instead
+    return DateNormalizer(reference).normalize(relative_date_str)
 
-    # Look for number and unit
-    match = re.search(r'(\d+)\s*(second|minute|hour|day|week|month|year)[s]* ago', relative_date_str)
 
-    if match is None:
-        # handle "a month ago" or "an hour ago"
-        match = re.search(r'(a|an)\s*(second|minute|hour|day|week|month|year)[s]* ago', relative_date_str)
-
-        if match is None:
-            return None
-        else:
-            number = 1  # "a" or "an" represents one unit
-            unit = match.group(2)
-    else:
-        number = int(match.group(1))
-        unit = match.group(2)
-
-    # Subtract the appropriate amount of time
-    if unit == "second":
-        return (now - timedelta(seconds=number)).date()
-    elif unit == "minute":
-        return (now - timedelta(minutes=number)).date()
-    elif unit == "hour":
-        return (now - timedelta(hours=number)).date()
-    elif unit == "day":
-        return (now - timedelta(days=number)).date()
-    elif unit == "week":
-        return (now - timedelta(weeks=number)).date()
-    elif unit == "month":
-        return (now - timedelta(days=30 * number)).date()  # Approximate
-    elif unit == "year":
-        return (now - timedelta(days=365 * number)).date()  # Approximate
-    return None
-
-
-def get_place_id(place_name):
+def get_place_id(place_name, limiter=None):
     try:
-        place_result = gmaps.places(place_name)
-        if place_result and 'results' in place_result and place_result['results']:
-            place_id = place_result['results'][0]['place_id']
-            official_place_name = place_result['results'][0]['name']  # Get the official name
+        with timed('place_lookup'):
+            place_id, official_place_name = place_cache.resolve(place_name, limiter)
+        if place_id:
+            PLACE_LOOKUPS.inc(result='found')
             print("Place Name: ", official_place_name)
             print("Place ID: ", place_id)
             return place_id, official_place_name
         else:
+            PLACE_LOOKUPS.inc(result='not_found')
             print(f"No place found for: {place_name}")
             return None, place_name
     except Exception as e:
+        PLACE_LOOKUPS.inc(result='error')
         print(f"Error occurred while fetching place_id for: {place_name}")
         print(f"Exception: {e}")
         return None, place_name
 
 
-def scrape_all_reviews(driver, number_reviews):
-    reviews = []
-
-    review_selector = "//div[contains(@class, 'jftiEf fontBodyMedium ')]"
-    scraped_count = 0
-    last_processed = None
-
-    # Counters to stop the loop in case of no progress
-    no_progress_count = 0
-    max_no_progress_attempts = 20  # Or any other number you find suitable
-
-    while scraped_count < number_reviews:
-        current_reviews = driver.find_elements(By.XPATH, review_selector)
-        if not current_reviews:
-            print("No reviews found. Waiting for the reviews to load...")
-            time.sleep(random.uniform(0.1, 0.5))
-            continue
-
-        # Scroll to the last review
-        driver.execute_script("arguments[0].scrollIntoView();", current_reviews[-1])
-
-        time.sleep(random.uniform(0.1, 0.5))
-
-        # Check if there are owner's responses and scroll to the end of them
-        try:
-            owner_response_elem = current_reviews[-1].find_element(By.XPATH, ".//span[text()='Response from the owner']"
-                                                                            "/following::div[@class='wiI7pd'][1]")
-            scroll_height_before = driver.execute_script('return document.documentElement.scrollHeight;')
-            driver.execute_script("arguments[0].scrollIntoView();", owner_response_elem)
-
-            time.sleep(random.uniform(0.1, 0.5))
-
-            scroll_height_after = driver.execute_script('return document.documentElement.scrollHeight;')
-
-            if scroll_height_before == scroll_height_after:
-                # If the page did not scroll down after trying to scroll to the owner's response, scroll down a bit more
-                actions = ActionChains(driver)
-                actions.send_keys(Keys.PAGE_DOWN)
-                actions.perform()
-
-                time.sleep(random.uniform(0.1, 0.5))
-        except NoSuchElementException:
-            # No owner response, continue to the next review
-            pass
-
-        new_reviews = driver.find_elements(By.XPATH, review_selector)
-        new_scraped_count = len(new_reviews)
-
-        # Check if there is any progress
-        if new_scraped_count > scraped_count:
-            # If progress, reset the no progress counter and print the progress
-            no_progress_count = 0
-            scraped_count = new_scraped_count
-            print(f"{scraped_count}/{number_reviews} reviews scraped, in progress...")
-        else:
-            # If no progress, increment the no progress counter
-            no_progress_count += 1
+def get_place_ids(place_names, limiter=None):
+    # Resolve many names at once: cached names cost nothing and the rest are looked up in parallel,
+    # each after limiter.acquire() when a rate limiter is given
+    try:
+        with timed('place_lookup', places=len(place_names)):
+            resolved = place_cache.resolve_many(place_names, limiter)
+        for place_id, _ in resolved.values():
+            PLACE_LOOKUPS.inc(result='found' if place_id else 'not_found')
+        return resolved
+    except Exception as e:
+        print("Error occurred while fetching place_ids, resolving one at a time")
+        print(f"Exception: {e}")
+        return {place_name: get_place_id(place_name, limiter) for place_name in place_names}
 
-        # If no progress for max_no_progress_attempts attempts, break the loop and save the already scraped reviews
-        if no_progress_count >= max_no_progress_attempts:
-            print(f"Scraping stopped due to no progress. {scraped_count} reviews scraped.")
-            break
 
-    print(f"{scraped_count}/{number_reviews} reviews scraped, done.\n")
+def parse_review_elements(new_reviews, dates=None):
+    # Per-element parsing through WebDriver, one round trip per field
+    dates = dates or DateNormalizer()
+    reviews = []
 
     # Parse each review
     for index, review in enumerate(new_reviews, start=1):
         try:
             reviewer = review.find_element(By.XPATH, ".//div[contains(@class, 'd4r55 ')]").text
-            rating_html = review.find_element(By.XPATH, ".//span[contains(@class, 'kvMYJc')]").get_attribute(
-                'innerHTML')
-            rating_soup = BeautifulSoup(rating_html, 'html.parser')
-            rating = len(
-                rating_soup.find_all('img', {'src': '//maps.gstatic.com/consumer/images/icons/2x/ic_star_rate_14.png'}))
+            rating_element = review.find_element(By.XPATH, ".//span[contains(@class, 'kvMYJc')]")
+            # "4 stars": images are off in lean browsers, so the label comes first
+            rating = rating_from_label(rating_element.get_attribute('aria-label'))
+            if rating is None:
+                rating_soup = BeautifulSoup(rating_element.get_attribute('innerHTML'), 'html.parser')
+                rating = len(rating_soup.find_all('img', {'src': STAR_IMAGE_SRC}))
             # Get review time
             review_time_relative = review.find_element(By.XPATH, ".//span[contains(@class, 'rsqaWe')]").text
-            review_time_absolute = relative_to_absolute_date(review_time_relative)  # Approximate
+            review_time_absolute = dates.normalize(review_time_relative)  # Approximate
 
             # Get review content
             try:
@@ -228,7 +235,9 @@ def scrape_all_reviews(driver, number_reviews):
                 'rating': rating,
                 'review_time': review_time_absolute,
                 'review_content': review_content,
-                'owner_response': owner_response
+                'owner_response': owner_response,
+                'review_key': review.get_attribute('data-review-id') or make_review_key(reviewer, review_content,
+                                                                                        rating)
             })
 
             # No need to print the json since we already have showing them on front end.
@@ -242,6 +251,7 @@ def scrape_all_reviews(driver, number_reviews):
             # print("\n")  # line break
 
         except Exception as e:
+            REVIEW_ERRORS.inc(parser='element')
             print("Problem occurred while processing a review.")
             print(f"Exception: {e}")
             continue
@@ -249,71 +259,275 @@ def scrape_all_reviews(driver, number_reviews):
     return reviews
 
 
-def get_all_reviews(place_url, number_reviews):
-    # Setup firefox options
-    firefox_options = webdriver.FirefoxOptions()
-    # firefox_options.add_argument("--headless")
+def build_review(index, card, review_time):
+    return {
+        'id': index,
+        'reviewer': card['reviewer'],
+        'rating': card['rating'],
+        'review_time': review_time,  # Approximate
+        'review_content': card['review_content'],
+        'owner_response': card['owner_response'],
+        'review_key': card['review_key'] or make_review_key(card['reviewer'], card['review_content'], card['rating'])
+    }
+
+
+def harvest_batch(driver, dates):
+    # The cards loaded since the last call, parsed from the DOM
+    with timed('harvest'):
+        cards_html = harvest_review_cards(driver)
+    with timed('parse') as phase:
+        batch = parse_review_cards(cards_html)
+        phase['cards'] = len(batch)
+    return list(zip(batch, dates.normalize_many(card['review_time'] for card in batch)))
+
+
+def capture_batcher(record_dir=None):
+    # Batches decoded from the review responses captured since the last call. Responses can
+    # overlap, so reviews are only handed out once.
+    handed_out = set()
+
+    def capture_batch(driver, dates):
+        with timed('collect'):
+            bodies = collect_captured(driver, REVIEW_CARD_CSS)
+        if record_dir and bodies:
+            record_bodies(record_dir, bodies)
+        batch = []
+        with timed('decode') as phase:
+            for card in decode_bodies(bodies):
+                if card['review_key'] and card['review_key'] in handed_out:
+                    continue
+                handed_out.add(card['review_key'])
+                # Exact dates from the response; the relative text only when there is no timestamp
+                batch.append((card, card['review_time'] or dates.normalize(card['relative_time'])))
+            phase['cards'] = len(batch)
+        return batch
+
+    return capture_batch
+
+
+def fast_forward(driver, waiter, seen_count, target):
+    # Resuming: scroll past the reviews a checkpoint already holds without reading them. Cards are
+    # only dropped while fewer than target have loaded, so nothing beyond the checkpoint is skipped.
+    while seen_count < target:
+        with timed('fast_forward'):
+            skip_review_cards(driver)
+            scroll_to_last_card(driver)
+            new_count = waiter.wait_for_more(seen_count)
+        if new_count == seen_count and waiter.is_stalled:
+            print(f"Could not scroll back to review {target}, continuing from review {seen_count}.")
+            break
+        seen_count = new_count
+    return seen_count
+
+
+def stream_reviews(driver, number_reviews, waiter=None, progress=None, known_keys=None, stop_after_known=3,
+                   dates=None, next_batch=harvest_batch, checkpoint=None):
+    # Parse each newly loaded batch right away and drop it from the DOM, so memory and the cost
+    # of every scroll step stay flat no matter how many reviews the place has.
+    # With known_keys (and the list sorted by newest) already stored reviews are skipped, and
+    # the scrape stops once stop_after_known of them have been seen. Reviews stored under their
+    # content key, such as migrated or imported ones, are recognized by it.
+    # next_batch(driver, dates) returns the new (card, review_time) pairs after each scroll.
+    # With a checkpoint every review is handed to it as well, and a resumed scrape skips what it holds.
+    waiter = waiter or ReviewWaiter(driver)
+    dates = dates or DateNormalizer()
+    seen_count = waiter.install()
+    scraped_count = 0
+    known_count = 0
+    if checkpoint is not None and checkpoint.resume_count:
+        scraped_count = checkpoint.resume_count
+        seen_count = fast_forward(driver, waiter, seen_count, checkpoint.resume_count)
+
+    while scraped_count < number_reviews:
+        batch = next_batch(driver, dates)
+
+        if batch:
+            for card, review_time in batch:
+                review = build_review(scraped_count + 1, card, review_time)
+                if checkpoint is not None and checkpoint.has(review['review_key']):
+                    continue
+                if known_keys is not None and (review['review_key'] in known_keys or make_review_key(
+                        review['reviewer'], review['review_content'], review['rating']) in known_keys):
+                    known_count += 1
+                    if known_count >= stop_after_known:
+                        break
+                    continue
+                scraped_count += 1
+                if checkpoint is not None:
+                    checkpoint.add(review)
+                yield review
+                if scraped_count >= number_reviews:
+                    break
+            if known_keys is not None and known_count >= stop_after_known:
+                print(f"Reached already saved reviews. {scraped_count} new reviews scraped.")
+                break
+            print(f"{scraped_count}/{number_reviews} reviews scraped, in progress...")
+            if progress:
+                progress(scraped_count, number_reviews)
+        elif waiter.is_stalled:
+            print(f"Scraping stopped due to no progress. {scraped_count} reviews scraped.")
+            break
+
+        if scraped_count < number_reviews:
+            with timed('scroll'):
+                scroll_to_last_card(driver)
+                seen_count = waiter.wait_for_more(seen_count)
+
+    print(f"{scraped_count}/{number_reviews} reviews scraped, done.\n")
+    print(waiter.finish())
+
+
+def scrape_all_reviews(driver, number_reviews, extraction='bulk', waiter=None, progress=None, known_keys=None,
+                       dates=None, checkpoint=None):
+    # Checkpointing needs reviews as they are read, so it always streams
+    dates = dates or DateNormalizer()
+    if extraction == 'network':
+        return list(stream_reviews(driver, number_reviews, waiter, progress, known_keys,
+                                   app.config['REFRESH_STOP_AFTER_KNOWN'], dates,
+                                   capture_batcher(app.config['SCRAPE_CAPTURE_DIR']), checkpoint))
+    if extraction == 'stream' or known_keys is not None or checkpoint is not None:
+        return list(stream_reviews(driver, number_reviews, waiter, progress, known_keys,
+                                   app.config['REFRESH_STOP_AFTER_KNOWN'], dates, checkpoint=checkpoint))
 
-    # Set the browser's zoom level to 50%
-    firefox_options.set_preference("layout.css.devPixelsPerPx", "0.5")
+    waiter = waiter or ReviewWaiter(driver)
+    scraped_count = waiter.install()
 
-    # Set path to geckodriver as per your configuration, change it to your path accordingly
-    webdriver_service = Service(r'D:\My Files\download\geckodriver.exe')
+    while scraped_count < number_reviews:
+        # Scroll to the last review and wait until the next page of reviews shows up
+        with timed('scroll'):
+            scroll_to_last_card(driver)
+            new_scraped_count = waiter.wait_for_more(scraped_count)
+
+        # Check if there is any progress
+        if new_scraped_count > scraped_count:
+            scraped_count = new_scraped_count
+            print(f"{scraped_count}/{number_reviews} reviews scraped, in progress...")
+            if progress:
+                progress(min(scraped_count, number_reviews), number_reviews)
+        elif waiter.is_stalled:
+            # If no progress for too long, break the loop and save the already scraped reviews
+            print(f"Scraping stopped due to no progress. {scraped_count} reviews scraped.")
+            break
 
-    driver = webdriver.Firefox(service=webdriver_service, options=firefox_options)
+    print(f"{scraped_count}/{number_reviews} reviews scraped, done.\n")
 
-    driver.get(place_url)
+    if extraction == 'element':
+        review_selector = "//div[contains(@class, 'jftiEf fontBodyMedium ')]"
+        with timed('parse', extraction='element') as phase:
+            reviews = parse_review_elements(driver.find_elements(By.XPATH, review_selector), dates)
+            phase['cards'] = len(reviews)
+        print(waiter.finish())
+        return reviews
+
+    # Expand every "More" button and pull all review cards in two round trips, then parse locally
+    with timed('expand') as phase:
+        phase['buttons'] = expand_all_reviews(driver)
+    with timed('fetch'):
+        cards_html = fetch_review_cards_html(driver)
+    with timed('parse') as phase:
+        cards = parse_review_cards(cards_html)
+        phase['cards'] = len(cards)
+    review_times = dates.normalize_many(card['review_time'] for card in cards)
+    reviews = [build_review(index, card, review_time)
+               for index, (card, review_time) in enumerate(zip(cards, review_times), start=1)]
+
+    print(waiter.finish())
+    return reviews
 
-    # Add a delay for the page to load
-    time.sleep(5)
 
-    # Find the Reviews button and click it
+def get_all_reviews(place_url, number_reviews, extraction='bulk', progress=None, known_keys=None, checkpoint=None):
+    # Check a warm browser out of the pool and hand it back when the scrape is over
+    with timed('scrape', extraction=extraction), driver_pool.driver() as driver:
+        return scrape_place(driver, place_url, number_reviews, extraction, progress, known_keys, checkpoint)
+
+
+def sort_by_newest(driver, waiter):
+    # Open the reviews' sort menu and pick "Newest", then wait for the re-sorted list to replace the old one
+    first_card = driver.find_elements(By.CSS_SELECTOR, REVIEW_CARD_CSS)[:1]
+    sort_button = waiter.until(
+        EC.element_to_be_clickable((By.XPATH, '//button[@aria-label="Sort reviews" or @data-value="Sort"]')),
+        app.config['SCRAPE_PAGE_TIMEOUT'])
+    sort_button.click()
+    newest = waiter.until(
+        EC.element_to_be_clickable((By.XPATH, '//div[@role="menuitemradio" and @data-index="1"]')),
+        app.config['SCRAPE_PAGE_TIMEOUT'])
+    newest.click()
+    if first_card:
+        waiter.until(EC.staleness_of(first_card[0]), app.config['SCRAPE_PAGE_TIMEOUT'])
+
+
+def scrape_place(driver, place_url, number_reviews, extraction='bulk', progress=None, known_keys=None,
+                 checkpoint=None):
+    # Returns (reviews, overall rating, number of reviews the place says it has)
+    # Every review date is relative to the moment the scrape started
+    dates = DateNormalizer()
+    waiter = ReviewWaiter(driver, StallPolicy(wait_timeout=app.config['SCRAPE_WAIT_TIMEOUT'],
+                                              max_stalled_waits=app.config['SCRAPE_MAX_STALLED_WAITS']))
+
+    with timed('page_load'):
+        driver.get(place_url)
+    if extraction == 'network':
+        # Before the Reviews tab is opened, so the first page of reviews is captured too
+        install_capture(driver)
+
+    # Find the Reviews button and click it as soon as the page has rendered it
     try:
-        reviews_button = WebDriverWait(driver, 5).until(
-            EC.presence_of_element_located(
-                (By.XPATH, '//button[starts-with(@aria-label, "Reviews for") and @role="tab"]')))
+        with timed('reviews_tab'):
+            reviews_button = waiter.until(
+                EC.element_to_be_clickable(
+                    (By.XPATH, '//button[starts-with(@aria-label, "Reviews for") and @role="tab"]')),
+                app.config['SCRAPE_PAGE_TIMEOUT'])
     except TimeoutException:
         print("No reviews to scrape. The location does not have any reviews.")
-        driver.quit()
         return [], None, None
 
     actions = ActionChains(driver)
     actions.move_to_element(reviews_button).perform()
     reviews_button.click()
-    time.sleep(3)
 
     # Get overall rating after clicking the Reviews button
     try:
-        rating_overall_element = WebDriverWait(driver, 5).until(
-            EC.presence_of_element_located((By.XPATH, '//div[@class="fontDisplayLarge"]')))
-        rating_overall = float(rating_overall_element.text)
-        total_reviews_element = WebDriverWait(driver, 5).until(
-            EC.presence_of_element_located((By.XPATH, '//div[@class="fontBodySmall" and contains(text(), "reviews")]')))
-        total_reviews_text = total_reviews_element.text.split()[0]
-        total_reviews = int(total_reviews_text.replace(',', ''))
+        with timed('summary'):
+            rating_overall_element = waiter.until(
+                EC.presence_of_element_located((By.XPATH, '//div[@class="fontDisplayLarge"]')),
+                app.config['SCRAPE_PAGE_TIMEOUT'])
+            rating_overall = float(rating_overall_element.text)
+            total_reviews_element = waiter.until(
+                EC.presence_of_element_located(
+                    (By.XPATH, '//div[@class="fontBodySmall" and contains(text(), "reviews")]')),
+                app.config['SCRAPE_PAGE_TIMEOUT'])
+            total_reviews_text = total_reviews_element.text.split()[0]
+            total_reviews = int(total_reviews_text.replace(',', ''))
         print(f"Overall rating: {rating_overall}\n")
         print(f"Total reviews: {total_reviews}\n")
     except TimeoutException:
         print("Could not find the overall rating or total reviews number.")
-        driver.quit()
         return [], None, None
 
-    # Add a delay for the reviews to load
-    time.sleep(2)
-
     if number_reviews > total_reviews:
         print("The specified number of reviews is greater than the total available reviews.")
         number_reviews = total_reviews
 
-    reviews = scrape_all_reviews(driver, number_reviews)
+    if known_keys is not None:
+        # Refreshing: new reviews come first, so stop as soon as the stored ones show up
+        if extraction == 'network':
+            # Drop the responses for the default order
+            collect_captured(driver, REVIEW_CARD_CSS)
+        try:
+            with timed('sort'):
+                sort_by_newest(driver, waiter)
+        except TimeoutException:
+            print("Could not sort the reviews by newest, checking them in the default order.")
 
-    driver.quit()
+    reviews = scrape_all_reviews(driver, number_reviews, extraction, waiter, progress, known_keys, dates, checkpoint)
+    STALLED_WAITS.inc(waiter.stats.stalled_waits)
+    REVIEWS_SCRAPED.inc(len(reviews), extraction=extraction)
 
     # If no reviews found...
     if len(reviews) == 0:
         return [], None, None
 
-    return reviews, rating_overall, number_reviews
+    return reviews, rating_overall, total_reviews
 
 
 def format_filename(official_place_name, overall_rating, total_reviews):
@@ -324,20 +538,220 @@ def format_filename(official_place_name, overall_rating, total_reviews):
     return filename
 
 
-@app.route('/', methods=['GET', 'POST'])
-@login_required
-def home():
+def save_reviews(reviews, place_name, user_id, place_id=None, also=(), snapshot=None):
+    # Raises when the reviews could not be saved, so the scrape job is marked failed
+    try:
+        saved = review_writer.save(reviews, place_name, user_id, also=also, place_id=place_id, snapshot=snapshot)
+        print(f"{saved} new reviews saved to the database.")
+    except Exception as e:
+        PHASE_ERRORS.inc(phase='save')
+        print(f"Error while saving review in the database: {e}")
+        raise RuntimeError(f"Reviews could not be saved: {e}") from e
+
+
+def export_reviews_csv(reviews, place_name, overall_rating, total_reviews):
+    try:
+        # Specify the folder path
+        folder = 'output_data'
+
+        # Create the folder if it doesn't exist
+        os.makedirs(folder, exist_ok=True)
+
+        filename = format_filename(place_name, overall_rating, total_reviews)
+        filepath = os.path.join(folder, filename)
+
+        with open(filepath, 'w', newline='', encoding='utf-8') as file:
+            writer = csv.writer(file)
+            writer.writerow(["ID", "Reviewer", "Rating", "Review Time", "Review Content", "Owner Response"])
+
+            for review in reviews:
+                writer.writerow([
+                    review['id'],
+                    review['reviewer'],
+                    review['rating'],
+                    review['review_time'],
+                    review['review_content'],
+                    review['owner_response'] if review['owner_response'] is not None else "None"
+                ])
+
+        print(f"Reviews exported to {filepath}")
+        return filepath
+    except Exception as e:
+        PHASE_ERRORS.inc(phase='export')
+        print(f"Error while writing to file: {e}")
+        return None
+
+
+def run_scrape(job, place_name, total_reviews, user_id, new_only=False):
+    # With SCRAPE_TRACE_DIR set, every phase of the scrape is also logged to <trace dir>/<job id>.jsonl
+    trace_dir = app.config['SCRAPE_TRACE_DIR']
+    if not trace_dir:
+        return scrape_and_save(job, place_name, total_reviews, user_id, new_only)
+    with tracing(os.path.join(trace_dir, f'{job.id}.jsonl'), job=job.id, place_name=place_name, user_id=user_id):
+        return scrape_and_save(job, place_name, total_reviews, user_id, new_only)
+
+
+def serve_shared(place_id, place_name, total_reviews, user_id):
+    # Answers a scrape from reviews someone else scraped recently, or returns None when the place
+    # has to be scraped. The reviews are added to the user's collection as a scrape would.
+    max_age = app.config['SHARED_STORE_MAX_AGE']
+    if not max_age:
+        return None
+    with app.app_context():
+        place = fresh_place(place_id, max_age)
+        if place is None:
+            return None
+        reviews = shared_reviews(place_id, total_reviews)
+        overall_rating, scraped_at = place.overall_rating, place.scraped_at
+    if reviews is None:
+        return None
+
+    minutes = round((time.time() - scraped_at) / 60)
+    messages = [(f"Served from reviews scraped {minutes} minutes ago.", "success")]
+    if not reviews:
+        messages.append((f"No reviews found for: {place_name}", "message"))
+    elif total_reviews > len(reviews):
+        messages.append((f"The specified number of reviews ({total_reviews}) is greater than the total number of available reviews ({len(reviews)}).", "message"))
+    total_reviews = len(reviews)
+    if reviews:
+        with timed('save', reviews=len(reviews)):
+            save_reviews(reviews, place_name, user_id, place_id)
+        with timed('export', reviews=len(reviews)):
+            export_reviews_csv(reviews, place_name, overall_rating, total_reviews)
+    SCRAPES.inc(result='shared')
+
+    return {
+        'place_name': place_name,
+        'place_id': place_id,
+        'place_url': f'https://www.google.com/maps/place/?q=place_id:{place_id}',
+        'overall_rating': overall_rating,
+        'total_reviews': total_reviews,
+        'reviews': reviews,
+        'messages': messages
+    }
+
+
+def scrape_and_save(job, place_name, total_reviews, user_id, new_only=False):
+    # Runs in a job worker thread: flash() is not available here, so messages are returned with the result
+    messages = []
     reviews = []
-    place_name = ''
-    place_id = ''
-    place_url = ''
-    error_message = ''
     overall_rating = ''
-    total_reviews = ''
+    place_url = ''
+    checkpoint = None
+
+    scraped = ()
+    snapshot = None
+
+    place_id, place_name = get_place_id(place_name)
+    if place_id:
+        shared = serve_shared(place_id, place_name, total_reviews, user_id)
+        if shared is not None:
+            return shared
+        place_url = f'https://www.google.com/maps/place/?q=place_id:{place_id}'
+        print("Place URL: ", place_url)
+        known_keys = None
+        if new_only:
+            with app.app_context():
+                known_keys = known_review_keys(place_id, place_name, user_id) or None
+        # Checkpoints hold reviews in the list's default order. A refresh reads it newest first, so it
+        # neither resumes from one nor leaves one behind for the next full scrape.
+        if app.config['SCRAPE_CHECKPOINT_EVERY'] and known_keys is None:
+            if app.config['SCRAPE_EXTRACTION'] in ('bulk', 'element'):
+                print(f"SCRAPE_EXTRACTION '{app.config['SCRAPE_EXTRACTION']}' can't be checkpointed, streaming "
+                      f"instead. Set SCRAPE_CHECKPOINT_EVERY to 0 to use it.")
+            with app.app_context():
+                state = load_checkpoint(place_id, user_id, app.config['SCRAPE_CHECKPOINT_MAX_AGE'])
+            checkpoint = Checkpointer(review_writer, place_id, place_name, user_id, total_reviews,
+                                      app.config['SCRAPE_CHECKPOINT_EVERY'], state)
+            if checkpoint.resume_count:
+                messages.append((f"Resumed an unfinished scrape after review {checkpoint.resume_count}.", "message"))
+        try:
+            reviews, overall_rating, place_total = get_all_reviews(
+                place_url, total_reviews, app.config['SCRAPE_EXTRACTION'], progress=job.update_progress,
+                known_keys=known_keys, checkpoint=checkpoint)
+        except Exception:
+            if checkpoint is not None:
+                # Keep what was read before the failure; the next scrape of this place resumes after it.
+                # A failed save is only logged, so the scrape's own error is the one the job reports.
+                try:
+                    checkpoint.flush()
+                except Exception as flush_error:
+                    PHASE_ERRORS.inc(phase='save')
+                    print(f"Could not save the checkpoint of the failed scrape: {flush_error}")
+            raise
+        if checkpoint is not None and overall_rating is not None and checkpoint.resume_count:
+            with app.app_context():
+                reviews = checkpoint.resumed_reviews() + reviews
+        messages.append(("Scraping finished!", "success"))
+
+        if not reviews and known_keys:
+            total_reviews = 0
+            messages.append((f"No new reviews for: {place_name}", "message"))
+        elif not reviews and overall_rating is None:
+            total_reviews = 0
+            messages.append((f"No reviews found for: {place_name}", "message"))
+        else:
+            total_available_reviews = len(reviews)
+            # Later requests for this place are served from the shared store for a while. A full
+            # scrape read all of the place's reviews only if it got as many as the place says it has;
+            # one that stalled or lost cards on the way is partial. A refresh leaves this as it was.
+            complete = None if known_keys else total_available_reviews >= place_total
+            scraped = [mark_place_scraped(place_id, place_name, overall_rating, complete)]
+            # Compared with the stored reviews when they are saved, to record what changed
+            snapshot = (reviews, bool(complete))
+            if total_reviews > total_available_reviews:
+                messages.append((f"The specified number of reviews ({total_reviews}) is greater than the total number of available reviews ({total_available_reviews}).", "message"))
+                total_reviews = total_available_reviews
+            reviews = reviews[:total_reviews]
+    else:
+        total_reviews = 0
+        messages.append((f"No place found for: {place_name}", "message"))
 
+    if checkpoint is not None and overall_rating is not None:
+        # Most reviews were saved along the way; write the rest and drop the checkpoint
+        with timed('save', reviews=len(checkpoint.pending)):
+            try:
+                checkpoint.finish(also=scraped, snapshot=snapshot)
+            except Exception as e:
+                # The checkpoint is kept, so the next scrape of this place resumes from it
+                PHASE_ERRORS.inc(phase='save')
+                print(f"Error while saving review in the database: {e}")
+                raise RuntimeError(f"Reviews could not be saved: {e}") from e
+
+    if len(reviews) > 0:
+        if checkpoint is None:
+            with timed('save', reviews=len(reviews)):
+                save_reviews(reviews, place_name, user_id, place_id, also=scraped, snapshot=snapshot)
+        with timed('export', reviews=len(reviews)):
+            export_reviews_csv(reviews, place_name, overall_rating, total_reviews)
+        SCRAPES.inc(result='saved')
+    else:
+        SCRAPES.inc(result='empty' if place_id else 'no_place')
+
+    return {
+        'place_name': place_name,
+        'place_id': place_id or '',
+        'place_url': place_url,
+        'overall_rating': overall_rating,
+        'total_reviews': total_reviews,
+        'reviews': reviews,
+        'messages': messages
+    }
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    # Prometheus scrape target: phase durations, lookups, scraped reviews and errors
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/', methods=['GET', 'POST'])
+@login_required
+def home():
     if request.method == 'POST':
         place_name = request.form.get('place_name')
         total_reviews = request.form.get('number_reviews')
+        new_only = request.form.get('new_only') == 'on'
 
         if not place_name or not total_reviews:
             flash("Please enter a place name and the number of reviews you want to scrape.")
@@ -351,87 +765,72 @@ def home():
                 flash("Invalid input for the number of reviews. Please enter a valid number.", category="error")
                 return redirect(url_for('home'))
 
-            place_id, place_name = get_place_id(place_name)
-            if place_id:
-                place_url = f'https://www.google.com/maps/place/?q=place_id:{place_id}'
-                print("Place URL: ", place_url)
-                reviews, overall_rating, _ = get_all_reviews(place_url, total_reviews)
-                flash("Scraping finished!", category="success")
-
-                if not reviews and overall_rating is None:
-                    total_reviews = 0
-                    flash(f"No reviews found for: {place_name}")
-                else:
-                    total_available_reviews = len(reviews)
-                    if total_reviews > total_available_reviews:
-                        flash(f"The specified number of reviews ({total_reviews}) is greater than the total number of available reviews ({total_available_reviews}).")
-                        total_reviews = total_available_reviews
-                    reviews = reviews[:total_reviews]
-
-            else:
-                total_reviews = 0
-                flash(f"No place found for: {place_name}")
-
-    # Save to Database
-    if len(reviews) > 0:
-        try:
-            for review_data in reviews:
-                # Check if a review with the same review_id and place_name already exists in the database
-                existing_review = Reviews.query.filter_by(review_id=review_data['id'], place_name=place_name).first()
+            # Scrape in the background and let the browser follow the job's progress
+            job = job_manager.submit(current_user.id, place_name, run_scrape, place_name, total_reviews,
+                                     current_user.id, new_only)
+            if request.accept_mimetypes.best == 'application/json':
+                return jsonify(job_id=job.id, status_url=url_for('job_status', job_id=job.id)), 202
+            return redirect(url_for('job_page', job_id=job.id))
 
-                if existing_review:
-                    # Skip saving the review if a duplicate already exists
-                    continue
+    return render_template('home.html', place_name='', place_id='', place_url='', error_message='',
+                           overall_rating='', total_reviews='', reviews=[])
 
-                # Save the review to the database
-                review = Reviews(
-                    review_id=review_data['id'],
-                    user_id=current_user.id,
-                    place_name=place_name,
-                    reviewer=review_data['reviewer'],
-                    rating=review_data['rating'],
-                    review_time=review_data['review_time'],
-                    review_content=review_data['review_content'],
-                    owner_response=review_data['owner_response']
-                )
-                db.session.add(review)
-                db.session.commit()
-        except Exception as e:
-            db.session.rollback()
-            print(f"Error while saving review in the database: {e}")
 
-        # Write to CSV
-        try:
-            # Specify the folder path
-            folder = 'output_data'
-
-            # Create the folder if it doesn't exist
-            os.makedirs(folder, exist_ok=True)
-
-            filename = format_filename(place_name, overall_rating, total_reviews)
-            filepath = os.path.join(folder, filename)
-
-            with open(filepath, 'w', newline='', encoding='utf-8') as file:
-                writer = csv.writer(file)
-                writer.writerow(["ID", "Reviewer", "Rating", "Review Time", "Review Content", "Owner Response"])
-
-                for review in reviews:
-                    writer.writerow([
-                        review['id'],
-                        review['reviewer'],
-                        review['rating'],
-                        review['review_time'],
-                        review['review_content'],
-                        review['owner_response'] if review['owner_response'] is not None else "None"
-                    ])
-
-            print(f"Reviews exported to {filepath}")
-        except Exception as e:
-            print(f"Error while writing to file: {e}")
+def get_job_or_404(job_id):
+    job = job_manager.get(job_id, current_user.id)
+    if job is None:
+        abort(404)
+    return job
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+@login_required
+def job_page(job_id):
+    job = get_job_or_404(job_id)
+    if job.status == 'finished':
+        return redirect(url_for('job_result', job_id=job.id))
+    return render_template('job.html', job=job)
+
+
+@app.route('/jobs/<job_id>/status', methods=['GET'])
+@login_required
+def job_status(job_id):
+    return jsonify(get_job_or_404(job_id).to_dict())
+
 
-    return render_template('home.html', place_name=place_name, place_id=place_id, place_url=place_url,
-                           error_message=error_message, overall_rating=overall_rating, total_reviews=total_reviews,
-                           reviews=reviews)
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+@login_required
+def job_events(job_id):
+    job = get_job_or_404(job_id)
+
+    # Server-sent events: push the job's state every time it changes until it is done
+    def stream():
+        version = None
+        while True:
+            version = job.wait_for_change(version)
+            yield f"data: {json.dumps(job.to_dict())}\n\n"
+            if job.done:
+                break
+
+    return Response(stream(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+@login_required
+def job_result(job_id):
+    job = get_job_or_404(job_id)
+    if job.status == 'failed':
+        flash(f"Scraping failed: {job.error}", category="error")
+        return redirect(url_for('home'))
+    if not job.done:
+        return redirect(url_for('job_page', job_id=job.id))
+
+    result = job.result
+    for message, category in result['messages']:
+        flash(message, category=category)
+    return render_template('home.html', place_name=result['place_name'], place_id=result['place_id'],
+                           place_url=result['place_url'], error_message='', overall_rating=result['overall_rating'],
+                           total_reviews=result['total_reviews'], reviews=result['reviews'])
 
 
 @app.route('/login', methods=['GET', 'POST'])
@@ -495,6 +894,8 @@ def account():
                     password_hash = bcrypt.hashpw(form.newPassword.data.encode(), bcrypt.gensalt())
                     user.password = password_hash.decode()
                 db.session.commit()  # Save the changes to the database
+                # The next request loads the new details instead of the cached ones
+                user_cache.invalidate(current_user.id)
                 flash('Your account has been updated!')
                 return redirect(url_for('home'))
             except NoResultFound:
@@ -508,9 +909,25 @@ def account():
 @app.route('/all_reviews', methods=['GET'])
 @login_required
 def all_reviews():
-    reviews = Reviews.query.filter_by(user_id=current_user.id).all()
+    option = request.args.get('option', 'id')
+    order = request.args.get('order', 'asc')
+    if option not in SORT_COLUMNS:
+        option = 'id'
+    try:
+        size = int(request.args.get('size', app.config['REVIEWS_PAGE_SIZE']))
+    except ValueError:
+        size = app.config['REVIEWS_PAGE_SIZE']
+    size = max(1, min(size, app.config['REVIEWS_MAX_PAGE_SIZE']))
 
-    return render_template('all_reviews.html', reviews=reviews)
+    reviews, next_cursor, previous_cursor = review_page(current_user.id, option, order,
+                                                        after=request.args.get('after'),
+                                                        before=request.args.get('before'), size=size)
+
+    page_args = {'option': option, 'order': order, 'size': size}
+    next_url = url_for('all_reviews', after=next_cursor, **page_args) if next_cursor else None
+    previous_url = url_for('all_reviews', before=previous_cursor, **page_args) if previous_cursor else None
+    return render_template('all_reviews.html', reviews=reviews, option=option, order=order,
+                           next_url=next_url, previous_url=previous_url, export_formats=available_formats())
 
 
 @app.route('/delete_reviews', methods=['POST'])
@@ -522,8 +939,10 @@ def delete_reviews():
             flash("No reviews selected for deletion.", category="error")
         else:
             try:
-                deleted_reviews = Reviews.query.filter(Reviews.user_id == current_user.id,
-                                                       Reviews.id.in_(review_ids)).delete(synchronize_session=False)
+                # Only takes them out of the user's collection; the shared copies stay for other users
+                deleted_reviews = UserReview.query.filter(UserReview.user_id == current_user.id,
+                                                          UserReview.review_id.in_(review_ids)).delete(
+                    synchronize_session=False)
                 db.session.commit()
                 flash(f"Successfully deleted {deleted_reviews} review(s).", category="success")
                 print(f"Successfully deleted {deleted_reviews} review(s).")
@@ -540,29 +959,100 @@ def delete_reviews():
 @app.route('/sort_reviews', methods=['GET'])
 @login_required
 def sort_reviews():
-    option = request.args.get('option')
-    order = request.args.get('order')
-
-    sort_options = {
-        'id': Reviews.id,
-        'place_name': Reviews.place_name,
-        'reviewer': Reviews.reviewer,
-        'rating': Reviews.rating,
-        'review_time': Reviews.review_time,
-        'review_content': Reviews.review_content,
-        'owner_response': Reviews.owner_response
-    }
+    # Sorting is part of the paginated listing now; keep this URL for the sort form and old links
+    return redirect(url_for('all_reviews', option=request.args.get('option'), order=request.args.get('order')))
 
-    if option in sort_options:
-        column = sort_options[option]
-        if order == 'desc':
-            column = column.desc()
 
-        reviews = Reviews.query.filter_by(user_id=current_user.id).order_by(column).all()
-    else:
-        reviews = Reviews.query.filter_by(user_id=current_user.id).all()
+@app.template_filter('highlight')
+def highlight(snippet):
+    # Escape the review text, then turn the search snippet's match markers into <mark> tags
+    if not snippet:
+        return ''
+    return Markup(str(escape(snippet)).replace(HIGHLIGHT_START, '<mark>').replace(HIGHLIGHT_END, '</mark>'))
+
+
+def rating_arg(name):
+    try:
+        return int(request.args[name])
+    except (KeyError, ValueError):
+        return None
+
+
+@app.route('/search', methods=['GET'])
+@login_required
+def search():
+    query = request.args.get('q', '').strip()
+    place_name = request.args.get('place') or None
+    min_rating = rating_arg('min_rating')
+    max_rating = rating_arg('max_rating')
+
+    results = []
+    if query:
+        results = search_reviews(current_user.id, query, place_name, min_rating, max_rating,
+                                 limit=app.config['SEARCH_RESULTS_LIMIT'])
+    return render_template('search.html', query=query, place_name=place_name, min_rating=min_rating,
+                           max_rating=max_rating, places=user_place_names(current_user.id), results=results)
+
 
-    return render_template('all_reviews.html', reviews=reviews)
+@app.route('/analytics', methods=['GET'])
+@login_required
+def analytics():
+    place_name = request.args.get('place') or None
+    places = review_analytics(current_user.id, place_name)
+    if request.args.get('format') == 'json':
+        return jsonify(places=places)
+    return render_template('analytics.html', places=places, place_name=place_name,
+                           place_names=user_place_names(current_user.id))
+
+
+@app.template_filter('timestamp')
+def format_timestamp(value):
+    return datetime.fromtimestamp(value).strftime('%Y-%m-%d %H:%M')
+
+
+@app.route('/changes', methods=['GET'])
+@login_required
+def changes():
+    # What changed at a place between its scrapes in the last `days` days: new, edited and removed reviews
+    place_names = user_place_names(current_user.id)
+    place_name = request.args.get('place') or (place_names[0] if place_names else None)
+    try:
+        days = max(1, int(request.args.get('days', 7)))
+    except ValueError:
+        days = 7
+    report = None
+    place_id = user_place_id(current_user.id, place_name) if place_name else None
+    if place_id:
+        report = changes_since(place_id, time.time() - days * 24 * 3600)
+    if request.args.get('format') == 'json':
+        return jsonify(place_name=place_name, days=days, changes=report_dict(report) if report else None)
+    return render_template('changes.html', report=report, place_name=place_name, place_names=place_names,
+                           days=days)
+
+
+@app.route('/export', methods=['GET'])
+@login_required
+def export():
+    # Streams the user's reviews straight from the database, so memory use doesn't depend on the export size
+    export_format = request.args.get('format', 'csv')
+    if export_format not in available_formats():
+        abort(400, description=f"Unsupported export format: {export_format}")
+    place_name = request.args.get('place') or None
+    since = request.args.get('since') or None
+    until = request.args.get('until') or None
+
+    mimetype, extension = EXPORT_FORMATS[export_format]
+    filename = f"{''.join((place_name or 'All').split())}_Reviews.{extension}"
+    chunks = iter_review_chunks(current_user.id, place_name, since, until)
+    return Response(stream_with_context(export_stream(export_format, chunks)), mimetype=mimetype,
+                    headers={'Content-Disposition': f"attachment; filename*=UTF-8''{quote(filename)}"})
+
+
+@app.cli.command('rebuild-summary')
+def rebuild_summary_command():
+    # flask --app app rebuild-summary: recompute review_summary from reviews after a backfill
+    rebuild_review_summary()
+    print("Review summary rebuilt.")
 
 
 if __name__ == '__main__':
@@ -0,0 +1,163 @@
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from app import app, gmaps, get_place_ids, scrape_place, save_reviews, export_reviews_csv, find_user, serve_shared
+from storage import mark_place_scraped
+from driver_pool import pool_from_config
+
+PLACE_ID_PREFIX = 'place_id:'
+
+
+class RateLimiter:
+    # Token bucket shared by all workers: at most `per_minute` Google requests, with short bursts allowed
+    def __init__(self, per_minute, burst=None):
+        if per_minute < 1:
+            raise ValueError(f"The request rate must be at least 1 per minute, not {per_minute}.")
+        self.rate = per_minute / 60.0
+        self.capacity = burst or max(1, per_minute // 6)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+
+
+def read_places(path):
+    # One place per line: a name to look up, or "place_id:<id>" for a known place ID
+    with open(path, encoding='utf-8') as file:
+        return [line.strip() for line in file if line.strip() and not line.startswith('#')]
+
+
+def resolve_places(entries, limiter):
+    # Names are resolved together through the place cache; place IDs only need their official name
+    names = [entry for entry in entries if not entry.startswith(PLACE_ID_PREFIX)]
+    resolved = get_place_ids(names, limiter) if names else {}
+    for entry in entries:
+        if not entry.startswith(PLACE_ID_PREFIX):
+            continue
+        place_id = entry[len(PLACE_ID_PREFIX):].strip()
+        limiter.acquire()
+        try:
+            result = gmaps.place(place_id, fields=['name'])
+            resolved[entry] = place_id, result['result']['name']
+        except Exception as e:
+            print(f"Error occurred while fetching the name for place_id: {place_id}")
+            print(f"Exception: {e}")
+            resolved[entry] = place_id, place_id
+    return resolved
+
+
+def scrape_one(entry, place_id, place_name, pool, limiter, number_reviews, retries, user_id):
+    if not place_id:
+        return {'entry': entry, 'place_name': place_name, 'reviews': 0, 'error': 'No place found'}
+
+    # Places scraped recently, by this batch or anyone else, come from the shared store
+    try:
+        shared = serve_shared(place_id, place_name, number_reviews, user_id)
+    except Exception as e:
+        return {'entry': entry, 'place_name': place_name, 'reviews': 0, 'error': str(e)}
+    if shared is not None:
+        return {'entry': entry, 'place_name': place_name, 'reviews': len(shared['reviews']), 'error': None}
+
+    place_url = f'https://www.google.com/maps/place/?q=place_id:{place_id}'
+    error = None
+    for attempt in range(retries + 1):
+        if attempt:
+            # Back off before retrying so a struggling place doesn't eat the rate budget
+            time.sleep(2 ** attempt)
+            print(f"Retrying {place_name} (attempt {attempt + 1}/{retries + 1})")
+        limiter.acquire()
+        try:
+            with pool.driver() as driver:
+                reviews, overall_rating, place_total = scrape_place(driver, place_url, number_reviews,
+                                                                    app.config['SCRAPE_EXTRACTION'])
+        except Exception as e:
+            error = str(e)
+            print(f"Error while scraping {place_name}: {e}")
+            continue
+
+        if not reviews:
+            error = 'No reviews scraped'
+            continue
+
+        # Only a scrape that got every review the place lists can tell which ones were removed
+        complete = len(reviews) >= place_total
+        # Saves go through the app's review writer, which writes for all workers in turn
+        scraped = mark_place_scraped(place_id, place_name, overall_rating, complete)
+        try:
+            save_reviews(reviews, place_name, user_id, place_id, also=[scraped], snapshot=(reviews, complete))
+        except Exception as e:
+            # Scraping again won't help a save that failed
+            return {'entry': entry, 'place_name': place_name, 'reviews': 0, 'error': str(e)}
+        export_reviews_csv(reviews, place_name, overall_rating, len(reviews))
+        return {'entry': entry, 'place_name': place_name, 'reviews': len(reviews), 'error': None}
+
+    return {'entry': entry, 'place_name': place_name, 'reviews': 0, 'error': error}
+
+
+def run_batch(entries, user_id, workers=2, number_reviews=1000, retries=2, requests_per_minute=30, headless=True):
+    # The web app's browser settings (GECKODRIVER_PATH, lean profile, recycling), sized for the batch
+    pool = pool_from_config(app.config, size=workers, headless=headless)
+    pool.warm()
+    limiter = RateLimiter(requests_per_minute)
+    results = []
+
+    start = time.perf_counter()
+    resolved = resolve_places(entries, limiter)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(scrape_one, entry, *resolved[entry], pool, limiter, number_reviews, retries,
+                                   user_id)
+                   for entry in entries]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            status = f"{result['reviews']} reviews" if not result['error'] else f"failed: {result['error']}"
+            print(f"[{len(results)}/{len(entries)}] {result['place_name']}: {status}")
+    elapsed = time.perf_counter() - start
+    pool.shutdown()
+
+    scraped = [result for result in results if not result['error']]
+    total_reviews = sum(result['reviews'] for result in scraped)
+    print(f"\nScraped {len(scraped)}/{len(entries)} places and {total_reviews} reviews in {elapsed:.1f}s")
+    print(f"Throughput: {len(scraped) / elapsed * 60:.2f} places/min, {total_reviews / elapsed:.2f} reviews/sec")
+    for result in results:
+        if result['error']:
+            print(f"Failed: {result['entry']} ({result['error']})")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scrape Google Maps reviews for many places in parallel.")
+    parser.add_argument('places_file', help="text file with one place name or place_id:<id> per line")
+    parser.add_argument('--user', required=True, help="username that will own the saved reviews")
+    parser.add_argument('--workers', type=int, default=2, help="number of browsers scraping at the same time")
+    parser.add_argument('--reviews', type=int, default=1000, help="maximum number of reviews per place")
+    parser.add_argument('--retries', type=int, default=2, help="retries per place after a failed scrape")
+    parser.add_argument('--rate', type=int, default=30, help="Google requests allowed per minute")
+    parser.add_argument('--show-browser', action='store_true', help="run Firefox with a visible window")
+    args = parser.parse_args()
+    if args.rate < 1:
+        parser.error("--rate must be at least 1 request per minute.")
+
+    with app.app_context():
+        if not find_user(args.user):
+            parser.error(f"User {args.user} does not exist.")
+
+    run_batch(read_places(args.places_file), args.user, workers=args.workers, number_reviews=args.reviews,
+              retries=args.retries, requests_per_minute=args.rate, headless=not args.show_browser)
+
+
+if __name__ == '__main__':
+    main()
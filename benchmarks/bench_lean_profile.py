@@ -0,0 +1,58 @@
+# Page load time, scrape time and bytes downloaded with a regular and a lean Firefox profile,
+# against the local Maps fixtures. The fixture pages carry map tiles, reviewer avatars and a web
+# font, which the lean profile should not download at all.
+#
+#   python -m benchmarks.bench_lean_profile [--sizes 200 2000] [--extraction stream]
+import argparse
+import os
+import time
+
+from app import scrape_place
+from benchmarks.maps_fixtures import FixtureServer, fixtures, recorded_rows
+from driver_pool import DriverPool
+
+LOAD_TIME_SCRIPT = "return performance.timing.loadEventEnd - performance.timing.navigationStart;"
+
+
+def bench_profile(server, fixture_list, lean, extraction):
+    pool = DriverPool(size=1, headless=True, geckodriver_path=os.environ.get('GECKODRIVER_PATH'), warm_url=None,
+                      lean=lean)
+    profile = 'lean' if lean else 'full'
+    try:
+        with pool.driver() as driver:
+            for fixture in fixture_list:
+                server.bytes_sent.clear()
+                start = time.perf_counter()
+                reviews, _, _ = scrape_place(driver, server.url(fixture), fixture.count, extraction)
+                elapsed = time.perf_counter() - start
+                load_ms = driver.execute_script(LOAD_TIME_SCRIPT)
+                total = sum(server.bytes_sent.values())
+                assets = total - server.bytes_sent['page'] - server.bytes_sent['listugcposts']
+                # Ratings must still come through with images off
+                unrated = sum(1 for review in reviews if not review['rating'])
+                print(f"{profile:>5} {fixture.name:>11} {load_ms:>8.0f} {elapsed:>9.2f} {len(reviews):>7} "
+                      f"{total / 1024:>9.0f} {assets / 1024:>9.0f} {unrated:>7}")
+    finally:
+        pool.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare a regular and a lean browser profile.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[200, 2000])
+    parser.add_argument('--extraction', default='stream', choices=['bulk', 'stream', 'network'])
+    parser.add_argument('--latency', type=float, default=0.05, help="seconds the server takes per page of cards")
+    args = parser.parse_args()
+
+    recorded_rows()
+    # Only the fixtures with owner responses and "More" buttons, the closer match to real pages
+    fixture_list = [fixture for fixture in fixtures(args.sizes) if fixture.more]
+
+    with FixtureServer(fixture_list, args.latency) as server:
+        print(f"{'':>5} {'fixture':>11} {'load ms':>8} {'scrape s':>9} {'reviews':>7} {'total KB':>9} "
+              f"{'assets KB':>9} {'unrated':>7}")
+        for lean in (False, True):
+            bench_profile(server, fixture_list, lean, args.extraction)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+# Insert rate of the per-review SELECT + commit loop that home() used to run, against the bulk
+# ON CONFLICT path in storage.py, on a throwaway SQLite file.
+#
+#   python -m benchmarks.bench_review_inserts [--sizes 2000 20000]
+import argparse
+import csv
+import glob
+import os
+import tempfile
+import time
+
+from flask import Flask
+
+from models import db, Place, PlaceReview, Reviews, UserReview, create_all, local_place_id
+from storage import bulk_save_reviews
+
+
+def sample_reviews(count):
+    # Real review text from output_data, repeated as needed to reach count
+    rows = []
+    for path in sorted(glob.glob('output_data/*.csv')):
+        with open(path, newline='', encoding='utf-8') as file:
+            rows.extend(csv.DictReader(file))
+    return [{
+        'id': index,
+        'reviewer': row['Reviewer'],
+        'rating': int(row['Rating']),
+        'review_time': row['Review Time'],
+        'review_content': row['Review Content'],
+        'owner_response': None if row['Owner Response'] == 'None' else row['Owner Response'],
+        'review_key': f"bench:{index}"
+    } for index, row in enumerate((rows[i % len(rows)] for i in range(count)), start=1)]
+
+
+def legacy_save(reviews, place_name, user_id):
+    # The old loop, written against the shared tables: one lookup and one commit per review
+    place_id = local_place_id(place_name)
+    if db.session.get(Place, place_id) is None:
+        db.session.add(Place(place_id=place_id, name=place_name))
+        db.session.commit()
+    for review_data in reviews:
+        existing_review = PlaceReview.query.filter_by(place_id=place_id, review_key=review_data['review_key']).first()
+        if existing_review:
+            continue
+        review = PlaceReview(
+            place_id=place_id,
+            review_key=review_data['review_key'],
+            position=review_data['id'],
+            reviewer=review_data['reviewer'],
+            rating=review_data['rating'],
+            review_time=review_data['review_time'],
+            review_content=review_data['review_content'],
+            owner_response=review_data['owner_response']
+        )
+        db.session.add(review)
+        db.session.flush()
+        db.session.add(UserReview(user_id=user_id, review_id=review.id, place_name=place_name,
+                                  reviewer=review.reviewer, rating=review.rating, review_time=review.review_time,
+                                  review_content=review.review_content, owner_response=review.owner_response or ''))
+        db.session.commit()
+
+
+def make_app(path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    db.init_app(app)
+    create_all(app)
+    return app
+
+
+def run(name, save, reviews):
+    with tempfile.TemporaryDirectory() as folder:
+        app = make_app(os.path.join(folder, 'bench.sqlite'))
+        with app.app_context():
+            start = time.perf_counter()
+            save(reviews, 'Bench Place', 'bench')
+            elapsed = time.perf_counter() - start
+            # A second save of the same scrape must not add rows
+            save(reviews, 'Bench Place', 'bench')
+            stored = Reviews.query.count()
+            db.engine.dispose()
+    print(f"{name:>6} {len(reviews):>7} reviews: {elapsed:8.3f}s  {len(reviews) / elapsed:>10.0f} reviews/s  "
+          f"({stored} rows stored)")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the per-review save loop with the bulk upsert.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[2000, 20000])
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        reviews = sample_reviews(size)
+        legacy = run('loop', legacy_save, reviews)
+        bulk = run('bulk', bulk_save_reviews, reviews)
+        print(f"{'':>6} speedup: {legacy / bulk:.1f}x\n")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+# End-to-end scraper benchmark that needs no network: scrape_place runs against the local Maps
+# fixtures in maps_fixtures.py with each extraction mode, then the reviews go through the same
+# save_reviews and export_reviews_csv calls home() makes, on a throwaway database and folder.
+# Saving goes through a ReviewWriter of its own, bound to the throwaway database.
+# Every phase reports wall time, WebDriver commands sent, reviews/s and peak memory of this
+# process (tracemalloc) and of the browser (RSS, sampled).
+#
+#   python -m benchmarks.bench_scraper [--sizes 200 2000 10000] [--extractions bulk stream]
+#   python -m benchmarks.bench_scraper --skip-browser    # only the save and export phases
+import argparse
+import os
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+from flask import Flask
+
+from app import build_review, export_reviews_csv, scrape_place
+from benchmarks.maps_fixtures import SIZES, Fixture, FixtureServer, fixtures, recorded_rows, render_card
+from driver_pool import DriverPool, _process_rss_mb
+from models import db, create_all
+from review_dates import DateNormalizer
+from review_parser import parse_review_cards
+from storage import ReviewWriter
+
+EXTRACTIONS = ['element', 'bulk', 'stream', 'network']
+
+
+def count_commands(driver):
+    # Every WebDriver command, element methods included, goes through driver.execute
+    counts = Counter()
+    execute = driver.execute
+
+    def counted(command, params=None):
+        counts[command] += 1
+        return execute(command, params)
+
+    driver.execute = counted
+    return counts
+
+
+class Phase:
+    def __init__(self, fixture, name, browser_pid=None, commands=None):
+        self.fixture = fixture
+        self.name = name
+        self.browser_pid = browser_pid
+        self.commands = commands
+        self.reviews = 0
+        self.browser_peak = None
+        self._sampling = False
+
+    def _sample(self):
+        while self._sampling:
+            rss = _process_rss_mb(self.browser_pid)
+            if rss is not None:
+                self.browser_peak = max(self.browser_peak or 0, rss)
+            time.sleep(0.2)
+
+    def __enter__(self):
+        if self.commands is not None:
+            self.commands.clear()
+        if self.browser_pid:
+            self._sampling = True
+            self._sampler = threading.Thread(target=self._sample, daemon=True)
+            self._sampler.start()
+        tracemalloc.start()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
+        self.python_peak = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+        tracemalloc.stop()
+        if self.browser_pid:
+            self._sampling = False
+            self._sampler.join()
+        self.calls = sum(self.commands.values()) if self.commands is not None else 0
+        print(self)
+
+    def __str__(self):
+        rate = self.reviews / self.elapsed if self.elapsed else 0
+        browser = f"{self.browser_peak:8.0f}" if self.browser_peak else f"{'-':>8}"
+        return (f"{self.fixture.name:>11} {self.name:>8} {self.elapsed:9.2f} {self.calls:>8} {self.reviews:>7} "
+                f"{rate:>10.0f} {self.python_peak:>9.1f} {browser}")
+
+
+HEADER = (f"{'fixture':>11} {'phase':>8} {'wall s':>9} {'wd calls':>8} {'reviews':>7} {'reviews/s':>10} "
+          f"{'py MB':>9} {'ff MB':>8}")
+
+
+def offline_reviews(fixture):
+    # What a scrape of the fixture returns, built without a browser; text comes out already expanded
+    expanded = Fixture(fixture.count, fixture.responses, more=False)
+    cards = parse_review_cards(''.join(render_card(expanded, index) for index in range(fixture.count)))
+    review_times = DateNormalizer().normalize_many(card['review_time'] for card in cards)
+    return [build_review(index, card, review_time)
+            for index, (card, review_time) in enumerate(zip(cards, review_times), start=1)]
+
+
+def bench_scrapes(server, fixture, driver, commands, extractions):
+    reviews = []
+    pid = driver.service.process.pid
+    for extraction in extractions:
+        with Phase(fixture, extraction, pid, commands) as phase:
+            reviews, _, _ = scrape_place(driver, server.url(fixture), fixture.count, extraction)
+            phase.reviews = len(reviews)
+        if len(reviews) != fixture.count:
+            print(f"{'':>11} {extraction} scraped {len(reviews)} of {fixture.count} reviews")
+    return reviews
+
+
+def bench_storage(fixture, reviews, folder):
+    # The database and CSV steps of home(), against a fresh database per fixture
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(folder, fixture.name + '.sqlite')}"
+    db.init_app(app)
+    create_all(app)
+    writer = ReviewWriter(app)
+    with Phase(fixture, 'save') as phase:
+        writer.save(reviews, 'Bench Place', 'bench')
+        phase.reviews = len(reviews)
+    writer.close()
+    with app.app_context():
+        db.engine.dispose()
+
+    cwd = os.getcwd()
+    os.chdir(folder)
+    try:
+        with Phase(fixture, 'export') as phase:
+            export_reviews_csv(reviews, 'Bench Place', fixture.overall_rating, fixture.count)
+            phase.reviews = len(reviews)
+    finally:
+        os.chdir(cwd)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark scraping, saving and exporting against offline fixtures.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--extractions', nargs='+', choices=EXTRACTIONS, default=EXTRACTIONS)
+    parser.add_argument('--latency', type=float, default=0.05, help="seconds the server takes per page of cards")
+    parser.add_argument('--skip-browser', action='store_true', help="only benchmark saving and exporting")
+    args = parser.parse_args()
+
+    # Loaded before the export phase changes directory
+    recorded_rows()
+    fixture_list = fixtures(args.sizes)
+
+    with tempfile.TemporaryDirectory() as folder, FixtureServer(fixture_list, args.latency) as server:
+        pool = None
+        if not args.skip_browser:
+            pool = DriverPool(size=1, headless=True, geckodriver_path=os.environ.get('GECKODRIVER_PATH'),
+                              warm_url=None)
+        try:
+            print(HEADER)
+            for fixture in fixture_list:
+                if pool:
+                    with pool.driver() as driver:
+                        commands = count_commands(driver)
+                        try:
+                            reviews = bench_scrapes(server, fixture, driver, commands, args.extractions)
+                        finally:
+                            del driver.execute
+                else:
+                    reviews = offline_reviews(fixture)
+                bench_storage(fixture, reviews, folder)
+        finally:
+            if pool:
+                pool.shutdown()
+
+
+if __name__ == '__main__':
+    main()
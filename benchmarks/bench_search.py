@@ -0,0 +1,81 @@
+# Full-text search through reviews_fts against a LIKE '%term%' scan, over every CSV in output_data
+# loaded into a throwaway SQLite file.
+#
+#   python -m benchmarks.bench_search [--terms washroom line ...]
+import argparse
+import csv
+import glob
+import os
+import tempfile
+import time
+
+from flask import Flask
+
+from models import db, create_all, make_review_key
+from storage import bulk_save_reviews, search_reviews
+
+USER = 'bench'
+
+
+def load_output_data():
+    total = 0
+    for path in sorted(glob.glob('output_data/*.csv')):
+        place_name = os.path.basename(path).split('_')[0]
+        with open(path, newline='', encoding='utf-8') as file:
+            reviews = [{
+                'id': int(row['ID']),
+                'reviewer': row['Reviewer'],
+                'rating': int(row['Rating']),
+                'review_time': row['Review Time'],
+                'review_content': row['Review Content'],
+                'owner_response': None if row['Owner Response'] == 'None' else row['Owner Response'],
+                'review_key': make_review_key(row['Reviewer'], row['Review Content'], row['Rating'])
+            } for row in csv.DictReader(file)]
+        total += bulk_save_reviews(reviews, place_name, USER)
+    return total
+
+
+def like_search(term, limit):
+    pattern = f'%{term}%'
+    return db.session.execute(db.text(
+        "SELECT * FROM reviews WHERE user_id = :user_id AND (review_content LIKE :pattern OR owner_response LIKE :pattern) "
+        "LIMIT :limit"), {'user_id': USER, 'pattern': pattern, 'limit': limit}).all()
+
+
+def best_of(runs, fn, *args):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = fn(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000, len(result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare FTS5 search with a LIKE scan.")
+    parser.add_argument('--terms', nargs='+', default=['washroom', 'line', 'parking', 'bagel', 'toilettes'])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--limit', type=int, default=100000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(folder, 'bench.sqlite')}"
+        db.init_app(app)
+        create_all(app)
+        with app.app_context():
+            start = time.perf_counter()
+            loaded = load_output_data()
+            print(f"Loaded {loaded} reviews in {time.perf_counter() - start:.2f}s\n")
+
+            print(f"{'term':>12} {'fts ms':>9} {'hits':>6} {'like ms':>9} {'hits':>6} {'speedup':>8}")
+            for term in args.terms:
+                fts_ms, fts_hits = best_of(args.runs, search_reviews, USER, term, None, None, None, args.limit)
+                like_ms, like_hits = best_of(args.runs, like_search, term, args.limit)
+                print(f"{term:>12} {fts_ms:>9.2f} {fts_hits:>6} {like_ms:>9.2f} {like_hits:>6} "
+                      f"{like_ms / fts_ms:>7.1f}x")
+            db.engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
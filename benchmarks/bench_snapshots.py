@@ -0,0 +1,79 @@
+# Snapshot diffing: time to compare a rescrape with the stored reviews and record what changed, and
+# the database growth per rescrape compared with storing every review again, on a throwaway SQLite file.
+#
+#   python -m benchmarks.bench_snapshots [--sizes 2000 20000] [--change-rate 0.01]
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.bench_review_inserts import make_app, sample_reviews
+from models import db, local_place_id
+from snapshots import record_snapshot
+from storage import bulk_save_reviews
+
+PLACE = 'Bench Place'
+
+
+def rescrape(reviews, change_rate, seed):
+    # The same place a week later: some reviews edited, some removed, some new ones on top
+    rng = random.Random(seed)
+    changes = max(1, int(len(reviews) * change_rate))
+    scraped = [dict(review) for review in reviews]
+    for review in rng.sample(scraped, changes):
+        review['review_content'] += ' (edited)'
+    for review in rng.sample(scraped, changes):
+        scraped.remove(review)
+    new = [dict(review, review_key=f"new:{seed}:{index}", id=0) for index, review in enumerate(reviews[:changes])]
+    return new + scraped
+
+
+def database_size(path):
+    db.session.execute(db.text("PRAGMA wal_checkpoint(TRUNCATE)"))
+    return os.path.getsize(path)
+
+
+def bench_size(size, change_rate, rounds):
+    reviews = sample_reviews(size)
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, 'bench.sqlite')
+        app = make_app(path)
+        with app.app_context():
+            place_id = local_place_id(PLACE)
+            bulk_save_reviews(reviews, PLACE, 'bench')
+            record_snapshot(db.session, place_id, reviews, True)
+            db.session.commit()
+            start_size = database_size(path)
+            for round_number in range(1, rounds + 1):
+                reviews = rescrape(reviews, change_rate, round_number)
+                start = time.perf_counter()
+                bulk_save_reviews(reviews, PLACE, 'bench')
+                record_snapshot(db.session, place_id, reviews, True)
+                db.session.commit()
+                elapsed = time.perf_counter() - start
+                growth = database_size(path) - start_size
+                start_size += growth
+                print(f"{size:>7} round {round_number}: {elapsed * 1000:8.1f} ms  "
+                      f"{len(reviews) / elapsed:>9.0f} reviews/s  +{growth / 1024:7.0f} KB")
+            versions = db.session.execute(db.text("SELECT COUNT(*) FROM review_versions")).scalar()
+            db.engine.dispose()
+
+    # What keeping a full copy of every rescrape would have stored instead
+    print(f"{size:>7} {versions} version rows after {rounds} rescrapes, instead of {size * rounds} re-stored rows\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time snapshot diffs and measure what they store.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[2000, 20000])
+    parser.add_argument('--change-rate', type=float, default=0.01,
+                        help="share of reviews edited, removed and added per rescrape")
+    parser.add_argument('--rounds', type=int, default=3)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        bench_size(size, args.change_rate, args.rounds)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+# Per-request cost of loading the logged-in user: the two unindexed users queries load_user used to
+# run, one lookup through the unique username index, and the index behind the in-process user cache,
+# on a throwaway SQLite file.
+#
+#   python -m benchmarks.bench_user_loader [--users 10000] [--requests 20000]
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.bench_review_inserts import make_app
+from identity import UserCache
+from models import db, DBUser
+
+
+def find_user(username):
+    res = DBUser.query.filter_by(username=username).first()
+    return (res.username, res.email, res.phone, res.password) if res else None
+
+
+def legacy_load_user(username):
+    # find_user() and then the same query again for the password
+    user = find_user(username)
+    if user:
+        db_user = DBUser.query.filter_by(username=username).first()
+        user = user[:3] + (db_user.password,)
+    return user
+
+
+def add_users(count):
+    db.session.execute(DBUser.__table__.insert(), [
+        {'username': f'user{index}', 'email': f'user{index}@example.com', 'phone': None, 'password': 'x' * 60}
+        for index in range(count)])
+    db.session.commit()
+
+
+def run(name, load, usernames):
+    start = time.perf_counter()
+    for username in usernames:
+        if load(username) is None:
+            raise RuntimeError(f"{username} was not found")
+        # A new session per request, as Flask-SQLAlchemy does
+        db.session.remove()
+    elapsed = time.perf_counter() - start
+    print(f"{name:>8}: {elapsed / len(usernames) * 1e6:8.1f} us/request")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time loading the logged-in user on each request.")
+    parser.add_argument('--users', type=int, default=10000, help="rows in the users table")
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--active', type=int, default=50, help="users making the requests")
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    usernames = [f'user{rng.randrange(args.users)}' for _ in range(args.active)]
+    requests = [rng.choice(usernames) for _ in range(args.requests)]
+
+    with tempfile.TemporaryDirectory() as folder:
+        app = make_app(os.path.join(folder, 'bench.sqlite'))
+        with app.app_context():
+            add_users(args.users)
+            db.session.execute(db.text("DROP INDEX ux_users_username"))
+            before = run('before', legacy_load_user, requests)
+            db.session.execute(db.text("CREATE UNIQUE INDEX ux_users_username ON users (username)"))
+            db.session.commit()
+            run('indexed', find_user, requests)
+            cache = UserCache()
+            cached = run('cached', lambda username: cache.get(username, find_user), requests)
+            db.engine.dispose()
+    print(f"{'':>8}  {before / cached:.0f}x faster with the index and cache")
+
+
+if __name__ == '__main__':
+    main()
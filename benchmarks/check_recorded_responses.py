@@ -0,0 +1,97 @@
+# Decoder check against real listugcposts responses. maps_fixtures builds its responses from
+# REVIEW_PATHS, so it can't tell when Google moves a field; this reads bodies recorded from Maps
+# (with SCRAPE_CAPTURE_DIR) from benchmarks/recorded/ instead.
+#
+# Each <name>.json may have a <name>.expected.json next to it: a list with the first reviews as the
+# Maps page showed them, written down by hand when the body was recorded, e.g.
+#   [{"reviewer": "Jane D", "rating": 4, "review_time": "2024-05-01",
+#     "review_content": "Start of the review text", "owner_response": null}]
+# review_content and owner_response are compared as prefixes, and a key left out isn't checked.
+#
+#   python -m benchmarks.check_recorded_responses [files...]
+import argparse
+import glob
+import json
+import os
+import sys
+
+from network_capture import RESPONSE_REVIEWS, XSSI_PREFIX, _at, decode_response
+
+RECORDED_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'recorded')
+
+
+def expected_path(path):
+    return path[:-len('.json')] + '.expected.json'
+
+
+def check_review(review, expected):
+    problems = []
+    for field in ('reviewer', 'rating', 'review_time'):
+        if field in expected and str(review[field]) != str(expected[field]):
+            problems.append(f"{field} is {review[field]!r}, expected {expected[field]!r}")
+    for field in ('review_content', 'owner_response'):
+        if field not in expected:
+            continue
+        if expected[field] is None:
+            if review[field] is not None:
+                problems.append(f"{field} is {review[field][:40]!r}, expected none")
+        elif not (review[field] or '').startswith(expected[field]):
+            problems.append(f"{field} is {(review[field] or '')[:40]!r}, expected {expected[field][:40]!r}...")
+    return problems
+
+
+def check_file(path):
+    # Problems found in one recorded body; empty when it decodes as expected
+    with open(path, encoding='utf-8') as file:
+        body = file.read()
+    try:
+        reviews, _ = decode_response(body)
+    except ValueError as e:
+        return [f"does not decode: {e}"]
+    data = json.loads(body[len(XSSI_PREFIX):] if body.startswith(XSSI_PREFIX) else body)
+    entries = _at(data, RESPONSE_REVIEWS) or []
+
+    problems = []
+    if not reviews:
+        problems.append("no reviews decoded")
+    if len(reviews) < len(entries):
+        problems.append(f"{len(entries) - len(reviews)} of {len(entries)} reviews could not be decoded")
+    problems += [f"review {index + 1} has no date" for index, review in enumerate(reviews)
+                 if review['review_time'] is None and not review['relative_time']]
+
+    if os.path.exists(expected_path(path)):
+        with open(expected_path(path), encoding='utf-8') as file:
+            expected_reviews = json.load(file)
+        if len(reviews) < len(expected_reviews):
+            problems.append(f"{len(reviews)} reviews decoded, expected at least {len(expected_reviews)}")
+        for index, (review, expected) in enumerate(zip(reviews, expected_reviews), start=1):
+            problems += [f"review {index}: {problem}" for problem in check_review(review, expected)]
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the review decoder against recorded Maps responses.")
+    parser.add_argument('files', nargs='*', help=f"recorded bodies (default: {RECORDED_DIR}/*.json)")
+    args = parser.parse_args()
+
+    paths = args.files or [path for path in sorted(glob.glob(os.path.join(RECORDED_DIR, '*.json')))
+                           if not path.endswith('.expected.json')]
+    if not paths:
+        print(f"No recorded responses in {RECORDED_DIR}. Record some with SCRAPE_EXTRACTION='network' and "
+              f"SCRAPE_CAPTURE_DIR set, then copy them there.")
+        sys.exit(1)
+
+    failed = 0
+    for path in paths:
+        problems = check_file(path)
+        checked = 'checked against expected reviews' if os.path.exists(expected_path(path)) else 'decoded'
+        print(f"{path}: {'FAILED' if problems else 'ok'} ({checked})")
+        for problem in problems:
+            print(f"  {problem}")
+        failed += bool(problems)
+    print(f"{len(paths) - failed}/{len(paths)} recorded responses ok")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
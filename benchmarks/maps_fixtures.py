@@ -0,0 +1,313 @@
+# Offline stand-in for a Google Maps place page. It reproduces the review panel markup the scraper
+# targets (review tab, overall rating, review cards with "More" buttons and owner responses) and
+# lazy-loads cards ten at a time as the panel is scrolled, the way Maps does: each page comes from
+# a listugcposts JSON response that the page renders into cards. Review text is taken from the
+# recorded scrapes in output_data, so card sizes match real ones.
+import csv
+import glob
+import html
+import json
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from network_capture import RESPONSE_NEXT_PAGE, RESPONSE_REVIEWS, REVIEW_PATHS, XSSI_PREFIX
+from review_dates import parse_relative
+from review_parser import STAR_IMAGE_SRC
+
+EMPTY_STAR_SRC = "//maps.gstatic.com/consumer/images/icons/2x/ic_star_rate_empty_14.png"
+PAGE_CARDS = 10
+MORE_CUTOFF = 120
+TIMES = ['2 days ago', 'a week ago', '3 weeks ago', 'a month ago', '4 months ago', '11 months ago', 'a year ago',
+         'Edited 2 years ago', '5 years ago']
+
+SIZES = [200, 2000, 10000]
+
+# Stand-ins for what a lean browser skips, with roughly the sizes Maps serves
+MAP_TILES = 16
+ASSET_BYTES = {'tiles': 25000, 'avatar': 4000, 'font.woff2': 60000}
+ASSET_TYPES = {'tiles': 'image/png', 'avatar': 'image/png', 'font.woff2': 'font/woff2'}
+
+
+class Fixture:
+    def __init__(self, count, responses=False, more=False, overall_rating=4.5):
+        self.count = count
+        # Every third card carries an owner response
+        self.responses = responses
+        # Long review text is cut off behind a "More" button
+        self.more = more
+        self.overall_rating = overall_rating
+
+    @property
+    def name(self):
+        return f"{self.count}-{'rich' if self.responses or self.more else 'plain'}"
+
+
+def fixtures(sizes=SIZES):
+    # Each size with bare cards, and with owner responses and "More" buttons
+    return [Fixture(count, responses, more) for count in sizes for responses, more in ((False, False), (True, True))]
+
+
+_recorded = []
+
+
+def recorded_rows():
+    if not _recorded:
+        for path in sorted(glob.glob('output_data/*.csv')):
+            with open(path, newline='', encoding='utf-8') as file:
+                _recorded.extend(csv.DictReader(file))
+        if not _recorded:
+            _recorded.append({'Reviewer': 'Reviewer', 'Rating': '4', 'Review Content': 'Nice place. ' * 20,
+                              'Owner Response': 'Thank you!'})
+    return _recorded
+
+
+def _put(data, path, value):
+    # Set data[path[0]][path[1]]..., growing nested lists as needed
+    for position, index in enumerate(path):
+        while len(data) <= index:
+            data.append(None)
+        if position == len(path) - 1:
+            data[index] = value
+        else:
+            if data[index] is None:
+                data[index] = []
+            data = data[index]
+
+
+def owner_response(fixture, index, row):
+    if not fixture.responses or index % 3:
+        return None
+    return row['Owner Response'] if row['Owner Response'] != 'None' else 'Thank you for your visit!'
+
+
+def review_entry(fixture, index, now):
+    # One review as it appears in a listugcposts response
+    row = recorded_rows()[index % len(recorded_rows())]
+    relative_time = TIMES[index % len(TIMES)]
+    entry = []
+    _put(entry, REVIEW_PATHS['review_key'], f"bench-{fixture.name}-{index}")
+    _put(entry, REVIEW_PATHS['reviewer'], row['Reviewer'])
+    _put(entry, REVIEW_PATHS['published'], int((now - parse_relative(relative_time)).timestamp() * 1_000_000))
+    _put(entry, REVIEW_PATHS['relative_time'], relative_time)
+    _put(entry, REVIEW_PATHS['rating'], int(row['Rating']))
+    _put(entry, REVIEW_PATHS['review_content'], row['Review Content'])
+    response = owner_response(fixture, index, row)
+    if response:
+        _put(entry, REVIEW_PATHS['owner_response'], response)
+    return entry
+
+
+def reviews_response(fixture, start):
+    stop = min(start + PAGE_CARDS, fixture.count)
+    now = datetime.now()
+    data = []
+    _put(data, RESPONSE_NEXT_PAGE, str(stop) if stop < fixture.count else None)
+    _put(data, RESPONSE_REVIEWS, [review_entry(fixture, index, now) for index in range(start, stop)])
+    return XSSI_PREFIX + '\n' + json.dumps(data)
+
+
+def render_card(fixture, index):
+    # The markup the page builds for a review; renderCard in PAGE_TEMPLATE does the same in the browser
+    row = recorded_rows()[index % len(recorded_rows())]
+    rating = int(row['Rating'])
+    stars = ''.join(f'<img class="hCCjke" src="{STAR_IMAGE_SRC if star < rating else EMPTY_STAR_SRC}">'
+                    for star in range(5))
+    content = row['Review Content']
+    if fixture.more and len(content) > MORE_CUTOFF:
+        # The full text rides along in an attribute, the page swaps it in when "More" is clicked
+        body = (f'<span class="wiI7pd" data-full="{html.escape(content)}">{html.escape(content[:MORE_CUTOFF])}…</span>'
+                f'<button class="w8nwRe kyuRq" aria-expanded="false">More</button>')
+    else:
+        body = f'<span class="wiI7pd">{html.escape(content)}</span>'
+    response = ''
+    text = owner_response(fixture, index, row)
+    if text:
+        response = (f'<div class="CDe7pd"><div class="nM6d2c"><span>Response from the owner</span></div>'
+                    f'<div class="wiI7pd">{html.escape(text)}</div></div>')
+    return (f'<div class="jftiEf fontBodyMedium " data-review-id="bench-{fixture.name}-{index}">'
+            f'<div class="WNxzHc"><img class="NBa7we" src="avatar/{index}.png"><div class="d4r55 ">{html.escape(row["Reviewer"])}</div></div>'
+            f'<div class="DU9Pgb"><span class="kvMYJc" role="img" aria-label="{rating} stars">{stars}</span>'
+            f'<span class="rsqaWe">{TIMES[index % len(TIMES)]}</span></div>'
+            f'<div class="MyEned">{body}</div>{response}</div>')
+
+
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Bench Place - Google Maps</title>
+<style>
+@font-face {{ font-family: 'Bench Sans'; src: url('{path}/font.woff2'); }}
+body {{ font-family: 'Bench Sans', sans-serif; }}
+#map img {{ width: 64px; height: 64px; }}
+#pane {{ height: 600px; overflow-y: auto; }}
+.loading {{ height: 800px; }}
+</style></head>
+<body>
+<div id="map">{tiles}</div>
+<button aria-label="Reviews for Bench Place" role="tab" id="tab">Reviews</button>
+<div id="summary"></div>
+<div id="pane"><div id="cards"></div><div class="loading"></div></div>
+<script>
+var paths = {paths};
+var more = {more};
+var next = '0';
+var loading = false;
+var pane = document.getElementById('pane');
+var cards = document.getElementById('cards');
+
+function at(data, path) {{
+    for (var i = 0; i < path.length; i++) {{
+        if (!Array.isArray(data) || path[i] >= data.length) {{
+            return null;
+        }}
+        data = data[path[i]];
+    }}
+    return data;
+}}
+
+function escapeHtml(text) {{
+    var div = document.createElement('div');
+    div.textContent = text;
+    return div.innerHTML.replace(/"/g, '&quot;');
+}}
+
+function renderCard(entry) {{
+    var rating = at(entry, paths.rating);
+    var stars = '';
+    for (var star = 0; star < 5; star++) {{
+        stars += '<img class="hCCjke" src="' + (star < rating ? '{star_src}' : '{empty_star_src}') + '">';
+    }}
+    var content = at(entry, paths.review_content);
+    var body;
+    if (more && content.length > {more_cutoff}) {{
+        body = '<span class="wiI7pd" data-full="' + escapeHtml(content) + '">' +
+            escapeHtml(content.substring(0, {more_cutoff})) + '\u2026</span>' +
+            '<button class="w8nwRe kyuRq" aria-expanded="false">More</button>';
+    }} else {{
+        body = '<span class="wiI7pd">' + escapeHtml(content) + '</span>';
+    }}
+    var response = at(entry, paths.owner_response);
+    response = response ? '<div class="CDe7pd"><div class="nM6d2c"><span>Response from the owner</span></div>' +
+        '<div class="wiI7pd">' + escapeHtml(response) + '</div></div>' : '';
+    return '<div class="jftiEf fontBodyMedium " data-review-id="' + at(entry, paths.review_key) + '">' +
+        '<div class="WNxzHc"><img class="NBa7we" src="{path}/avatar/' + at(entry, paths.review_key) + '.png">' +
+        '<div class="d4r55 ">' + escapeHtml(at(entry, paths.reviewer)) + '</div></div>' +
+        '<div class="DU9Pgb"><span class="kvMYJc" role="img" aria-label="' + rating + ' stars">' + stars + '</span>' +
+        '<span class="rsqaWe">' + at(entry, paths.relative_time) + '</span></div>' +
+        '<div class="MyEned">' + body + '</div>' + response + '</div>';
+}}
+
+function loadPage() {{
+    if (loading || next === null) {{
+        return;
+    }}
+    loading = true;
+    var xhr = new XMLHttpRequest();
+    xhr.open('GET', '{path}/listugcposts?start=' + next);
+    xhr.onload = function () {{
+        var data = JSON.parse(xhr.responseText.substring(xhr.responseText.indexOf('\\n') + 1));
+        var entries = at(data, {reviews_path}) || [];
+        cards.insertAdjacentHTML('beforeend', entries.map(renderCard).join(''));
+        next = at(data, {next_path});
+        loading = false;
+    }};
+    xhr.send();
+}}
+
+document.getElementById('tab').addEventListener('click', function () {{
+    setTimeout(function () {{
+        document.getElementById('summary').innerHTML =
+            '<div class="fontDisplayLarge">{overall_rating}</div><div class="fontBodySmall">{count_text} reviews</div>';
+        loadPage();
+    }}, 100);
+}});
+
+pane.addEventListener('scroll', function () {{
+    if (pane.scrollTop + pane.clientHeight >= pane.scrollHeight - 900) {{
+        loadPage();
+    }}
+}});
+
+cards.addEventListener('click', function (event) {{
+    var button = event.target;
+    if (button.tagName !== 'BUTTON' || button.textContent !== 'More') {{
+        return;
+    }}
+    var span = button.parentElement.querySelector('span.wiI7pd');
+    span.textContent = span.getAttribute('data-full');
+    button.remove();
+}});
+</script>
+</body></html>
+"""
+
+
+class FixtureServer:
+    # Serves every fixture at /place/<name> on localhost, in a background thread.
+    # latency adds a delay to each page of cards, like the round trip Maps makes on scroll.
+    def __init__(self, fixture_list, latency=0.05):
+        self.fixtures = {fixture.name: fixture for fixture in fixture_list}
+        self.latency = latency
+        self.requests = 0
+        # Bytes served by kind: page, listugcposts, tiles, avatar, font.woff2
+        self.bytes_sent = Counter()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests += 1
+                status, content_type, body = server.route(urlparse(self.path))
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def route(self, url):
+        parts = url.path.strip('/').split('/')
+        if len(parts) < 2 or parts[0] != 'place' or parts[1] not in self.fixtures:
+            return 404, 'text/plain', b'Not found'
+        fixture = self.fixtures[parts[1]]
+        kind = parts[2] if len(parts) > 2 else 'page'
+        content_type, body = self.content(fixture, kind, url)
+        if body is None:
+            return 404, 'text/plain', b'Not found'
+        self.bytes_sent[kind] += len(body)
+        return 200, content_type, body
+
+    def content(self, fixture, kind, url):
+        if kind == 'page':
+            tiles = ''.join(f'<img src="{url.path}/tiles/{tile}.png">' for tile in range(MAP_TILES))
+            return 'text/html; charset=utf-8', PAGE_TEMPLATE.format(
+                count_text=f'{fixture.count:,}', overall_rating=fixture.overall_rating, path=url.path, tiles=tiles,
+                paths=json.dumps({name: list(path) for name, path in REVIEW_PATHS.items()}),
+                reviews_path=json.dumps(list(RESPONSE_REVIEWS)), next_path=json.dumps(list(RESPONSE_NEXT_PAGE)),
+                more=json.dumps(fixture.more), more_cutoff=MORE_CUTOFF, star_src=STAR_IMAGE_SRC,
+                empty_star_src=EMPTY_STAR_SRC).encode('utf-8')
+        if kind == 'listugcposts':
+            time.sleep(self.latency)
+            start = int(parse_qs(url.query).get('start', ['0'])[0])
+            return 'application/json; charset=utf-8', reviews_response(fixture, start).encode('utf-8')
+        if kind in ASSET_BYTES:
+            return ASSET_TYPES[kind], bytes(ASSET_BYTES[kind])
+        return None, None
+
+    def url(self, fixture):
+        host, port = self.httpd.server_address
+        return f'http://{host}:{port}/place/{fixture.name}'
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,98 @@
+import json
+import time
+
+from sqlalchemy import delete
+from sqlalchemy.dialects.sqlite import insert
+
+from models import db, PlaceReview, ScrapeCheckpoint
+from storage import stored_review
+
+
+def load_checkpoint(place_id, user_id, max_age):
+    # The unfinished scrape of this place by this user, as a dict, unless it is older than max_age seconds
+    checkpoint = db.session.get(ScrapeCheckpoint, (place_id, user_id))
+    if checkpoint is None or time.time() - checkpoint.updated_at > max_age:
+        return None
+    return {'target': checkpoint.target, 'keys': json.loads(checkpoint.review_keys)}
+
+
+def load_reviews(place_id, keys):
+    # Saved reviews of a place in the order of keys, shaped like freshly scraped ones
+    found = {}
+    for start in range(0, len(keys), 500):
+        rows = db.session.execute(db.select(PlaceReview).where(PlaceReview.place_id == place_id,
+                                                                PlaceReview.review_key.in_(keys[start:start + 500])))
+        for review in rows.scalars():
+            found[review.review_key] = review
+    return [stored_review(index, found[key])
+            for index, key in enumerate((key for key in keys if key in found), start=1)]
+
+
+class Checkpointer:
+    # Saves a long scrape as it goes. Every `every` reviews the new ones go through the review
+    # writer, in the same transaction as the checkpoint row (count, last review key and all keys
+    # so far), so a crash loses at most one batch. A later scrape of the same place by the same
+    # user is given the state from load_checkpoint() and carries on from there.
+    def __init__(self, writer, place_id, place_name, user_id, target, every=200, state=None):
+        self.writer = writer
+        self.place_id = place_id
+        self.place_name = place_name
+        self.user_id = user_id
+        self.target = target
+        self.every = every
+        self.keys = list(state['keys']) if state else []
+        self.key_set = set(self.keys)
+        # Reviews saved by earlier runs; the scraper scrolls past these without reading them
+        self.resume_count = len(self.keys)
+        self.pending = []
+
+    def has(self, review_key):
+        return review_key in self.key_set
+
+    def add(self, review):
+        self.pending.append(review)
+        self.key_set.add(review['review_key'])
+        if len(self.pending) >= self.every:
+            self.flush()
+
+    def _upsert(self, keys):
+        table = ScrapeCheckpoint.__table__
+        statement = insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=[table.c.place_id, table.c.user_id],
+            set_={column: statement.excluded[column]
+                  for column in ('place_name', 'target', 'scraped_count', 'last_review_key', 'review_keys',
+                                 'updated_at')})
+        return statement, {
+            'place_id': self.place_id,
+            'user_id': self.user_id,
+            'place_name': self.place_name,
+            'target': self.target,
+            'scraped_count': len(keys),
+            'last_review_key': keys[-1] if keys else None,
+            'review_keys': json.dumps(keys),
+            'updated_at': time.time()
+        }
+
+    def flush(self):
+        # Commit the pending reviews and move the checkpoint past them
+        if not self.pending:
+            return
+        keys = self.keys + [review['review_key'] for review in self.pending]
+        self.writer.save(self.pending, self.place_name, self.user_id, also=[self._upsert(keys)],
+                         place_id=self.place_id)
+        self.keys = keys
+        self.pending = []
+
+    def finish(self, also=(), snapshot=None):
+        # The scrape completed: save the rest and forget the checkpoint
+        table = ScrapeCheckpoint.__table__
+        forget = delete(table).where(table.c.place_id == self.place_id, table.c.user_id == self.user_id)
+        self.writer.save(self.pending, self.place_name, self.user_id, also=[(forget, {}), *also],
+                         place_id=self.place_id, snapshot=snapshot)
+        self.keys += [review['review_key'] for review in self.pending]
+        self.pending = []
+
+    def resumed_reviews(self):
+        # What earlier runs saved, to put in front of this run's reviews
+        return load_reviews(self.place_id, self.keys[:self.resume_count])
@@ -0,0 +1,287 @@
+import atexit
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import quote
+
+from selenium import webdriver
+from selenium.common.exceptions import WebDriverException
+from selenium.webdriver.firefox.service import Service
+
+
+# Lean profile: requests that add nothing to reading review text. Map tiles, reviewer avatars and
+# review photos, and web fonts, matched against the full URL with PAC shell expressions.
+LEAN_BLOCKED_URLS = [
+    '*://*.googleusercontent.com/*',
+    '*://*.ggpht.com/*',
+    '*://khms*.google.com/*',
+    '*://*.google.com/maps/vt*',
+    '*://maps.googleapis.com/maps/vt*',
+    '*://streetviewpixels-pa.googleapis.com/*',
+    '*://fonts.googleapis.com/*',
+    '*://fonts.gstatic.com/*',
+]
+
+# Preferences that turn off whole resource types, wherever they are loaded from
+LEAN_PREFERENCES = {
+    # 2 = block all images, including the map canvas' raster tiles and star icons
+    'permissions.default.image': 2,
+    'browser.display.use_document_fonts': 0,
+    'gfx.downloadable_fonts.enabled': False,
+    'media.autoplay.default': 5,
+    'webgl.disabled': True,
+}
+
+
+def lean_pac_script(blocked_urls):
+    # Proxy auto-config that sends blocked URLs to a closed local port, so they fail right away
+    checks = ' || '.join(f'shExpMatch(url, "{pattern}")' for pattern in blocked_urls)
+    return ('function FindProxyForURL(url, host) { '
+            f'if ({checks}) {{ return "PROXY 127.0.0.1:9"; }} '
+            'return "DIRECT"; }')
+
+
+def _process_rss_mb(pid):
+    # Resident memory of a process and its children in MB, read from /proc; None where unavailable
+    try:
+        with open(f'/proc/{pid}/status') as status:
+            rss_kb = next(int(line.split()[1]) for line in status if line.startswith('VmRSS:'))
+    except (OSError, StopIteration, ValueError):
+        return None
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children') as children:
+            for child in children.read().split():
+                rss_kb += (_process_rss_mb(int(child)) or 0) * 1024
+    except OSError:
+        pass
+    return rss_kb / 1024
+
+
+class DriverPool:
+    # A bounded set of Firefox instances kept alive between scrapes. Instances are started ahead of
+    # time, checked before every checkout and replaced after max_uses scrapes or once they grow past
+    # max_memory_mb, so a scrape never pays for browser startup.
+    # With lean=True images, web fonts and the blocked URLs are never downloaded.
+    # When a browser fails to start, warming stops and isn't tried again for retry_delay seconds,
+    # doubling with every failure in a row up to max_retry_delay; the pool reports itself unhealthy
+    # until a browser starts again.
+    def __init__(self, size=2, headless=True, geckodriver_path=None, max_uses=20, max_memory_mb=1500,
+                 warm_url='https://www.google.com/maps', checkout_timeout=600, lean=False,
+                 blocked_urls=LEAN_BLOCKED_URLS, retry_delay=5, max_retry_delay=300):
+        self.size = size
+        self.headless = headless
+        self.lean = lean
+        self.blocked_urls = blocked_urls
+        self.geckodriver_path = geckodriver_path
+        self.max_uses = max_uses
+        self.max_memory_mb = max_memory_mb
+        self.warm_url = warm_url
+        self.checkout_timeout = checkout_timeout
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+
+        # LIFO so the most recently used, warmest browser goes out first
+        self._idle = queue.LifoQueue()
+        self._checkouts = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._total = 0
+        self._uses = {}
+        self._started = False
+        # Browser launches that failed in a row, the last error, and when warming may try again
+        self._failures = 0
+        self.last_error = None
+        self._retry_at = 0.0
+        atexit.register(self.shutdown)
+
+    def _create(self):
+        firefox_options = webdriver.FirefoxOptions()
+        if self.headless:
+            firefox_options.add_argument("--headless")
+
+        # Set the browser's zoom level to 50%
+        firefox_options.set_preference("layout.css.devPixelsPerPx", "0.5")
+
+        if self.lean:
+            for name, value in LEAN_PREFERENCES.items():
+                firefox_options.set_preference(name, value)
+            # 2 = proxy auto-config from a URL, here the script itself
+            firefox_options.set_preference('network.proxy.type', 2)
+            firefox_options.set_preference('network.proxy.autoconfig_url',
+                                           'data:text/javascript,' + quote(lean_pac_script(self.blocked_urls)))
+
+        # Without an explicit path Selenium looks geckodriver up on PATH
+        if self.geckodriver_path:
+            webdriver_service = Service(self.geckodriver_path)
+        else:
+            webdriver_service = Service()
+
+        driver = webdriver.Firefox(service=webdriver_service, options=firefox_options)
+        if self.warm_url:
+            # Prime the HTTP cache with the Maps application
+            driver.get(self.warm_url)
+        self._uses[id(driver)] = 0
+        return driver
+
+    def _reserve(self):
+        with self._lock:
+            if self._total >= self.size:
+                return False
+            self._total += 1
+            return True
+
+    def _create_reserved(self):
+        # Start a browser for an already reserved slot, giving the slot back if it fails
+        try:
+            driver = self._create()
+        except BaseException as e:
+            with self._lock:
+                self._total -= 1
+                if isinstance(e, WebDriverException):
+                    self._failures += 1
+                    self.last_error = str(e)
+                    delay = min(self.max_retry_delay, self.retry_delay * 2 ** (self._failures - 1))
+                    self._retry_at = time.monotonic() + delay
+            raise
+        with self._lock:
+            self._failures = 0
+            self.last_error = None
+        return driver
+
+    @property
+    def healthy(self):
+        # False while browsers are failing to start
+        return self._failures == 0
+
+    def _add_idle(self):
+        # Start a browser and keep it idle; False if it failed to start
+        try:
+            self._idle.put(self._create_reserved())
+            return True
+        except WebDriverException as e:
+            print(f"Could not start a browser for the pool, not retrying for "
+                  f"{self._retry_at - time.monotonic():.0f}s: {e}")
+            return False
+
+    def warm(self, background=True):
+        # Start browsers until the pool is full, stopping at the first one that fails to start
+        def fill():
+            while time.monotonic() >= self._retry_at and self._reserve():
+                if not self._add_idle():
+                    break
+
+        if background:
+            threading.Thread(target=fill, daemon=True).start()
+        else:
+            fill()
+
+    def start(self):
+        # Pre-warm the pool once; cheap enough to call on every request
+        if not self._started:
+            self._started = True
+            self.warm()
+
+    def _is_healthy(self, driver):
+        try:
+            return driver.execute_script('return 1;') == 1
+        except WebDriverException:
+            return False
+
+    def _memory_mb(self, driver):
+        pid = driver.capabilities.get('moz:processID')
+        return _process_rss_mb(pid) if pid else None
+
+    def _retire(self, driver, reason):
+        print(f"Recycling browser: {reason}")
+        self._uses.pop(id(driver), None)
+        try:
+            driver.quit()
+        except WebDriverException:
+            pass
+        with self._lock:
+            self._total -= 1
+        # Keep the pool warm by starting the replacement right away
+        self.warm()
+
+    def acquire(self, timeout=None):
+        timeout = self.checkout_timeout if timeout is None else timeout
+        if not self._checkouts.acquire(timeout=timeout):
+            raise TimeoutError("No browser became available in the driver pool.")
+        self.start()
+        try:
+            while True:
+                try:
+                    driver = self._idle.get_nowait()
+                except queue.Empty:
+                    if self._reserve():
+                        if time.monotonic() < self._retry_at:
+                            # Don't launch yet another browser per scrape while they keep failing
+                            with self._lock:
+                                self._total -= 1
+                            raise RuntimeError(f"Browsers are failing to start: {self.last_error}")
+                        driver = self._create_reserved()
+                    else:
+                        # Every slot is taken by a browser that is still starting up or being returned
+                        try:
+                            driver = self._idle.get(timeout=timeout)
+                        except queue.Empty:
+                            raise TimeoutError("No browser became available in the driver pool.") from None
+
+                if self._is_healthy(driver):
+                    return driver
+                self._retire(driver, "failed health check")
+        except BaseException:
+            self._checkouts.release()
+            raise
+
+    def release(self, driver):
+        try:
+            self._uses[id(driver)] = self._uses.get(id(driver), 0) + 1
+            memory = self._memory_mb(driver)
+            if self._uses[id(driver)] >= self.max_uses:
+                self._retire(driver, f"used for {self._uses[id(driver)]} scrapes")
+            elif memory is not None and memory > self.max_memory_mb:
+                self._retire(driver, f"using {memory:.0f} MB")
+            else:
+                try:
+                    # Drop the previous page's DOM but keep the browser and its cache
+                    driver.get('about:blank')
+                    self._idle.put(driver)
+                except WebDriverException:
+                    self._retire(driver, "failed to reset")
+        finally:
+            self._checkouts.release()
+
+    @contextmanager
+    def driver(self, timeout=None):
+        driver = self.acquire(timeout)
+        try:
+            yield driver
+        finally:
+            self.release(driver)
+
+    def shutdown(self):
+        while True:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                driver.quit()
+            except WebDriverException:
+                pass
+            with self._lock:
+                self._total -= 1
+
+
+def pool_from_config(config, **overrides):
+    # The app's pool settings; keyword arguments replace any of them
+    settings = dict(size=config['DRIVER_POOL_SIZE'],
+                    headless=config['DRIVER_POOL_HEADLESS'],
+                    geckodriver_path=os.environ.get('GECKODRIVER_PATH'),
+                    max_uses=config['DRIVER_POOL_MAX_USES'],
+                    max_memory_mb=config['DRIVER_POOL_MAX_MEMORY_MB'],
+                    lean=config['DRIVER_POOL_LEAN'])
+    settings.update(overrides)
+    return DriverPool(**settings)
@@ -0,0 +1,123 @@
+import csv
+import io
+import json
+
+from models import db, Reviews
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+CSV_HEADER = ["ID", "Reviewer", "Rating", "Review Time", "Review Content", "Owner Response"]
+CHUNK_ROWS = 1000
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'jsonl': ('application/x-ndjson; charset=utf-8', 'jsonl'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+
+def available_formats():
+    # Parquet needs the optional pyarrow package
+    return [name for name in EXPORT_FORMATS if name != 'parquet' or pa is not None]
+
+
+def iter_review_chunks(user_id, place_name=None, since=None, until=None, chunk_rows=CHUNK_ROWS):
+    # Lists of rows read from a server-side cursor, chunk_rows at a time, so only one chunk is in memory
+    query = db.select(Reviews.review_id, Reviews.place_name, Reviews.reviewer, Reviews.rating, Reviews.review_time,
+                      Reviews.review_content, Reviews.owner_response).where(Reviews.user_id == user_id)
+    if place_name:
+        query = query.where(Reviews.place_name == place_name)
+    # review_time is stored as YYYY-MM-DD, so dates compare as text
+    if since:
+        query = query.where(Reviews.review_time >= since)
+    if until:
+        query = query.where(Reviews.review_time <= until)
+    query = query.order_by(Reviews.place_name, Reviews.review_id)
+
+    result = db.session.execute(query.execution_options(yield_per=chunk_rows))
+    for partition in result.partitions():
+        yield partition
+
+
+def csv_stream(chunks):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_HEADER)
+    for rows in chunks:
+        for row in rows:
+            writer.writerow([
+                row.review_id,
+                row.reviewer,
+                row.rating,
+                row.review_time,
+                row.review_content,
+                row.owner_response if row.owner_response is not None else "None"
+            ])
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def jsonl_stream(chunks):
+    for rows in chunks:
+        yield ''.join(json.dumps(dict(row._mapping), ensure_ascii=False) + '\n' for row in rows).encode('utf-8')
+
+
+class _ChunkSink(io.RawIOBase):
+    # Write target for the Parquet writer that hands back whatever was written since the last drain
+    def __init__(self):
+        super().__init__()
+        self.parts = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+
+def parquet_stream(chunks):
+    # One zstd-compressed row group per chunk; each row group goes out as soon as it is written
+    schema = pa.schema([
+        ('review_id', pa.int64()),
+        ('place_name', pa.string()),
+        ('reviewer', pa.string()),
+        ('rating', pa.int8()),
+        ('review_time', pa.string()),
+        ('review_content', pa.string()),
+        ('owner_response', pa.string()),
+    ])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression='zstd')
+    for rows in chunks:
+        columns = list(zip(*rows))
+        writer.write_table(pa.Table.from_arrays([pa.array(column, type=field.type)
+                                                 for column, field in zip(columns, schema)], schema=schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+def export_stream(export_format, chunks):
+    if export_format == 'csv':
+        return csv_stream(chunks)
+    if export_format == 'jsonl':
+        return jsonl_stream(chunks)
+    return parquet_stream(chunks)
@@ -0,0 +1,44 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class UserCache:
+    # In-process LRU of logged-in users, so authenticated requests don't each query the users table.
+    # Entries expire after ttl seconds, which also bounds how long another process can serve a user
+    # whose account was changed elsewhere; this process calls invalidate() when it changes one.
+    # Users that were not found are not cached, so a new registration can log in right away.
+    def __init__(self, max_size=1024, ttl=300, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, username, load):
+        # The cached user, or load(username) stored for next time
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is not None:
+                user, loaded_at = entry
+                if self.clock() - loaded_at < self.ttl:
+                    self._entries.move_to_end(username)
+                    return user
+                del self._entries[username]
+
+        user = load(username)
+        if user is not None:
+            with self._lock:
+                self._entries[username] = (user, self.clock())
+                self._entries.move_to_end(username)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+        return user
+
+    def invalidate(self, username):
+        with self._lock:
+            self._entries.pop(username, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
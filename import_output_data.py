@@ -0,0 +1,115 @@
+import argparse
+import csv
+import glob
+import os
+import re
+import time
+from itertools import islice
+
+from app import app, find_user
+from models import db, Place, local_place_id, make_review_key
+from storage import write_reviews
+
+# format_filename() layout: <Place>_<rating>_<count>_Reviews.csv
+FILENAME_PATTERN = re.compile(r'^(?P<place>.+)_(?P<rating>\d+(?:\.\d+)?)_(?P<count>\d+)_Reviews\.csv$')
+
+# Settings for the import connection only: the data can be re-imported, so durability is traded for speed
+IMPORT_PRAGMAS = [
+    "PRAGMA synchronous = OFF",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -65536",
+]
+
+
+def parse_filename(path):
+    match = FILENAME_PATTERN.match(os.path.basename(path))
+    if not match:
+        return None
+    return match.group('place'), float(match.group('rating')), int(match.group('count'))
+
+
+def known_places():
+    # format_filename() strips spaces from place names; map them back to places already in the database
+    places = db.session.execute(db.select(Place.place_id, Place.name)).all()
+    return {''.join(name.split()): (place_id, name) for place_id, name in places}
+
+
+def read_rows(path):
+    with open(path, newline='', encoding='utf-8') as file:
+        for row in csv.DictReader(file):
+            owner_response = None if row['Owner Response'] == 'None' else row['Owner Response']
+            yield {
+                'id': int(row['ID']),
+                'reviewer': row['Reviewer'],
+                'rating': int(row['Rating']),
+                'review_time': row['Review Time'],
+                'review_content': row['Review Content'],
+                'owner_response': owner_response,
+                'review_key': make_review_key(row['Reviewer'], row['Review Content'], int(row['Rating']))
+            }
+
+
+def import_file(connection, path, place_id, place_name, user_id, batch_size):
+    # Returns (rows read, reviews added to the user's collection); reviews that are already stored
+    # for the place are not stored again
+    rows = read_rows(path)
+    read = inserted = 0
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        read += len(batch)
+        inserted += write_reviews(connection, batch, place_id, place_name, user_id)
+    return read, inserted
+
+
+def import_folder(folder, user_id, batch_size=5000):
+    paths = sorted(glob.glob(os.path.join(folder, '*_Reviews.csv')))
+    places = known_places()
+    total_read = total_inserted = 0
+    start = time.perf_counter()
+
+    with db.engine.connect() as connection:
+        for pragma in IMPORT_PRAGMAS:
+            connection.exec_driver_sql(pragma)
+        connection.commit()
+        for path in paths:
+            parsed = parse_filename(path)
+            if not parsed:
+                print(f"Skipping {path}: the name doesn't look like <Place>_<rating>_<count>_Reviews.csv")
+                continue
+            place, rating, count = parsed
+            place_id, place_name = places.get(place, (local_place_id(place), place))
+
+            file_start = time.perf_counter()
+            # One transaction per file
+            with connection.begin():
+                read, inserted = import_file(connection, path, place_id, place_name, user_id, batch_size)
+            elapsed = time.perf_counter() - file_start
+            total_read += read
+            total_inserted += inserted
+            note = f" (file name says {count})" if read != count else ""
+            print(f"{place_name} ({rating}): {read} rows read{note}, {inserted} new, "
+                  f"{read / elapsed if elapsed else 0:.0f} rows/s")
+
+    elapsed = time.perf_counter() - start
+    print(f"\nImported {total_inserted} new reviews from {total_read} rows in {len(paths)} files in {elapsed:.2f}s "
+          f"({total_read / elapsed if elapsed else 0:.0f} rows/s)")
+    return total_read, total_inserted
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load CSV files written by the scraper into the database.")
+    parser.add_argument('folder', nargs='?', default='output_data', help="folder with the CSV files")
+    parser.add_argument('--user', required=True, help="username that will own the imported reviews")
+    parser.add_argument('--batch-size', type=int, default=5000, help="rows per INSERT batch")
+    args = parser.parse_args()
+
+    with app.app_context():
+        if not find_user(args.user):
+            parser.error(f"User {args.user} does not exist.")
+        import_folder(args.folder, args.user, args.batch_size)
+
+
+if __name__ == '__main__':
+    main()
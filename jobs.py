@@ -0,0 +1,95 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Job:
+    def __init__(self, user_id, description):
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.description = description
+        self.status = 'queued'
+        self.scraped = 0
+        self.total = None
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        # Bumped on every change so listeners can wait for the next update
+        self.version = 0
+        self._changed = threading.Condition()
+
+    @property
+    def done(self):
+        return self.status in ('finished', 'failed')
+
+    def _update(self, **fields):
+        with self._changed:
+            for name, value in fields.items():
+                setattr(self, name, value)
+            self.version += 1
+            self._changed.notify_all()
+
+    def update_progress(self, scraped, total):
+        self._update(scraped=scraped, total=total)
+
+    def wait_for_change(self, version, timeout=15):
+        # Block until the job changes past `version` or the timeout passes; returns the current version
+        with self._changed:
+            self._changed.wait_for(lambda: self.version != version, timeout=timeout)
+            return self.version
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'description': self.description,
+            'status': self.status,
+            'scraped': self.scraped,
+            'total': self.total,
+            'error': self.error
+        }
+
+
+class JobManager:
+    # Runs scrapes on a small thread pool so requests return right away. Finished jobs are kept
+    # in memory, oldest evicted first, so their results can be viewed after the fact.
+    def __init__(self, max_workers=2, max_jobs=200):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='scrape-job')
+        self.max_jobs = max_jobs
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+
+    def submit(self, user_id, description, fn, *args):
+        # fn is called as fn(job, *args) and its return value becomes job.result
+        job = Job(user_id, description)
+        with self.lock:
+            self.jobs[job.id] = job
+            self._evict()
+        self.executor.submit(self._run, job, fn, args)
+        return job
+
+    def _run(self, job, fn, args):
+        job._update(status='running')
+        try:
+            result = fn(job, *args)
+            job._update(status='finished', result=result, finished_at=time.time())
+        except Exception as e:
+            print(f"Scrape job {job.id} failed: {e}")
+            job._update(status='failed', error=str(e), finished_at=time.time())
+
+    def _evict(self):
+        for job_id in list(self.jobs):
+            if len(self.jobs) <= self.max_jobs:
+                break
+            if self.jobs[job_id].done:
+                del self.jobs[job_id]
+
+    def get(self, job_id, user_id=None):
+        with self.lock:
+            job = self.jobs.get(job_id)
+        if job is None or (user_id is not None and job.user_id != user_id):
+            return None
+        return job
+
@@ -0,0 +1,186 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds in seconds, from a single WebDriver round trip up to a whole large scrape
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if value != float('inf') else '+Inf'
+
+
+class Counter:
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        # key -> [per-bucket counts, sum, count]; bucket counts are made cumulative when rendered
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][index] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self.lock:
+            for key, (counts, total, count) in sorted(self.values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    labels = _format_labels(self.labelnames, key, [('le', _format_value(bound))])
+                    lines.append(f'{self.name}_bucket{labels} {cumulative}')
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+                lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+
+class Gauge:
+    # A value read when the metrics are rendered
+    def __init__(self, name, help_text, read):
+        self.name = name
+        self.help_text = help_text
+        self.read = read
+
+    def render(self):
+        return [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} gauge',
+                f'{self.name} {_format_value(self.read())}']
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        # Prometheus text exposition format
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+PHASE_SECONDS = registry.register(Histogram(
+    'grs_phase_seconds', 'Time spent in each scraping phase, one observation per occurrence.', ['phase']))
+PHASE_ERRORS = registry.register(Counter(
+    'grs_phase_errors_total', 'Phases that ended with an exception.', ['phase']))
+REVIEW_ERRORS = registry.register(Counter(
+    'grs_review_errors_total', 'Review cards that could not be parsed.', ['parser']))
+REVIEWS_SCRAPED = registry.register(Counter(
+    'grs_reviews_scraped_total', 'Reviews returned by scrapes.', ['extraction']))
+STALLED_WAITS = registry.register(Counter(
+    'grs_stalled_waits_total', 'Waits for more reviews that timed out without new cards.'))
+PLACE_LOOKUPS = registry.register(Counter(
+    'grs_place_lookups_total', 'Place name lookups by outcome.', ['result']))
+SCRAPES = registry.register(Counter(
+    'grs_scrapes_total', 'Finished scrape jobs by outcome.', ['result']))
+
+
+class ScrapeTrace:
+    # Per-scrape log of every phase, written as JSON lines when the scrape ends
+    def __init__(self, path, **fields):
+        self.path = path
+        self.fields = fields
+        self.start = time.perf_counter()
+        self.events = []
+
+    def record(self, phase, started, seconds, error=None, **fields):
+        event = {'phase': phase, 'at': round(started - self.start, 4), 'seconds': round(seconds, 4)}
+        if error:
+            event['error'] = error
+        event.update(fields)
+        self.events.append(event)
+
+    def write(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with open(self.path, 'w', encoding='utf-8') as file:
+            file.write(json.dumps(dict(self.fields, phase='scrape', seconds=round(time.perf_counter() - self.start, 4)))
+                       + '\n')
+            for event in self.events:
+                file.write(json.dumps(event) + '\n')
+
+
+# The trace of the scrape running on the current thread, if tracing is on
+_current = threading.local()
+
+
+@contextmanager
+def tracing(path, **fields):
+    trace = ScrapeTrace(path, **fields)
+    _current.trace = trace
+    try:
+        yield trace
+    finally:
+        _current.trace = None
+        trace.write()
+
+
+def record(phase, seconds, started=None, error=None, **fields):
+    PHASE_SECONDS.observe(seconds, phase=phase)
+    if error:
+        PHASE_ERRORS.inc(phase=phase)
+    trace = getattr(_current, 'trace', None)
+    if trace is not None:
+        trace.record(phase, started if started is not None else time.perf_counter() - seconds, seconds, error,
+                     **fields)
+
+
+@contextmanager
+def timed(phase, **fields):
+    # Times the block as one occurrence of `phase`; fields end up in the trace only
+    started = time.perf_counter()
+    try:
+        yield fields
+    except Exception as e:
+        record(phase, time.perf_counter() - started, started, error=str(e), **fields)
+        raise
+    record(phase, time.perf_counter() - started, started, **fields)
@@ -1,3 +1,5 @@
+import hashlib
+
 from flask_sqlalchemy import SQLAlchemy
 
 db = SQLAlchemy()
@@ -5,6 +7,10 @@ db = SQLAlchemy()
 
 class DBUser(db.Model):
     __tablename__ = 'users'
+    __table_args__ = (
+        # Every request looks its user up by name
+        db.Index('ux_users_username', 'username', unique=True),
+    )
     id = db.Column(db.Integer(), primary_key=True, autoincrement=True)
     username = db.Column(db.Text(), nullable=False)
     email = db.Column(db.Text(), nullable=False)
@@ -12,19 +18,471 @@ class DBUser(db.Model):
     password = db.Column(db.Text(), nullable=False)
 
 
-class Reviews(db.Model):
-    __tablename__ = 'reviews'
+class Place(db.Model):
+    # One row per Google place, shared by every user who scraped or collected it
+    __tablename__ = 'places'
+    place_id = db.Column(db.Text(), primary_key=True)
+    name = db.Column(db.Text(), nullable=False)
+    overall_rating = db.Column(db.Float())
+    # When the place was last scraped, by anyone; NULL for places that were only imported or migrated
+    scraped_at = db.Column(db.Float())
+    # The last full scrape got as many reviews as the place lists, so it read all of them
+    complete = db.Column(db.Boolean(), nullable=False, default=False)
+
+
+class PlaceReview(db.Model):
+    # The one stored copy of a review, whoever scraped it
+    __tablename__ = 'place_reviews'
+    __table_args__ = (
+        # Bulk saves rely on it for ON CONFLICT
+        db.UniqueConstraint('place_id', 'review_key', name='ux_place_reviews_place_key'),
+    )
     id = db.Column(db.Integer(), primary_key=True)
-    review_id = db.Column(db.Integer(), nullable=False)
-    user_id = db.Column(db.Integer(), db.ForeignKey('users.id'), nullable=False)
-    place_name = db.Column(db.Text(), nullable=False)
+    place_id = db.Column(db.Text(), db.ForeignKey('places.place_id'), nullable=False)
+    # Stable identity of the review: Google's review ID, or a hash of its content (see make_review_key)
+    review_key = db.Column(db.Text(), nullable=False)
+    # Position in the list when the review was first scraped
+    position = db.Column(db.Integer(), nullable=False)
     reviewer = db.Column(db.Text(), nullable=False)
     rating = db.Column(db.Integer(), nullable=False)
     review_time = db.Column(db.Text(), nullable=False)
     review_content = db.Column(db.Text(), nullable=False)
     owner_response = db.Column(db.Text())
+    # Hash of what can change after a review is posted (see make_content_hash), for change detection
+    content_hash = db.Column(db.Text())
+    # The snapshot that first saw the review (NULL until one does), and the one that found it gone
+    snapshot_id = db.Column(db.Integer())
+    removed_snapshot_id = db.Column(db.Integer())
+
+
+db.Index('ix_place_reviews_place_position', PlaceReview.place_id, PlaceReview.position, PlaceReview.id)
+
+
+class UserReview(db.Model):
+    # A user's collection: which of the shared reviews show up in their lists, searches and exports.
+    # The review's sortable columns are copied in (see COLLECT_REVIEW in storage.py), so the review
+    # browser can page through one user's reviews in any order straight off an index; the
+    # SORT_COPY_TRIGGERS below keep the copies in step with place_reviews and places.
+    __tablename__ = 'user_reviews'
+    user_id = db.Column(db.Text(), primary_key=True)
+    review_id = db.Column(db.Integer(), db.ForeignKey('place_reviews.id'), primary_key=True)
+    place_name = db.Column(db.Text())
+    reviewer = db.Column(db.Text())
+    rating = db.Column(db.Integer())
+    review_time = db.Column(db.Text())
+    review_content = db.Column(db.Text())
+    # '' when the owner hasn't responded, so row-value seeks never meet a NULL
+    owner_response = db.Column(db.Text())
+
+
+db.Index('ix_user_reviews_review_id', UserReview.review_id)
+# Indexes for the review browser: every sort option can seek straight to a page within one user's
+# reviews (sorting by id uses the primary key)
+USER_REVIEW_SORT_COLUMNS = ('place_name', 'reviewer', 'rating', 'review_time', 'review_content', 'owner_response')
+for _column in USER_REVIEW_SORT_COLUMNS:
+    db.Index(f'ix_user_reviews_user_{_column}', UserReview.user_id, getattr(UserReview, _column),
+             UserReview.review_id)
+
+SORT_COPY_TRIGGERS = {
+    'user_reviews_sort_update': """CREATE TRIGGER user_reviews_sort_update
+    AFTER UPDATE OF reviewer, rating, review_time, review_content, owner_response ON place_reviews
+    WHEN new.reviewer IS NOT old.reviewer OR new.rating IS NOT old.rating OR new.review_time IS NOT old.review_time
+      OR new.review_content IS NOT old.review_content OR new.owner_response IS NOT old.owner_response BEGIN
+        UPDATE user_reviews SET reviewer = new.reviewer, rating = new.rating, review_time = new.review_time,
+                                review_content = new.review_content, owner_response = coalesce(new.owner_response, '')
+        WHERE review_id = new.id;
+    END""",
+    'user_reviews_place_name_update': """CREATE TRIGGER user_reviews_place_name_update
+    AFTER UPDATE OF name ON places WHEN new.name IS NOT old.name BEGIN
+        UPDATE user_reviews SET place_name = new.name
+        WHERE review_id IN (SELECT id FROM place_reviews WHERE place_id = new.place_id);
+    END""",
+}
+# Fills the copies of user_reviews rows saved before they existed
+BACKFILL_SORT_COPIES = """
+    UPDATE user_reviews SET (place_name, reviewer, rating, review_time, review_content, owner_response) = (
+        SELECT places.name, place_reviews.reviewer, place_reviews.rating, place_reviews.review_time,
+               place_reviews.review_content, coalesce(place_reviews.owner_response, '')
+        FROM place_reviews JOIN places ON places.place_id = place_reviews.place_id
+        WHERE place_reviews.id = user_reviews.review_id)
+    WHERE rating IS NULL"""
+
+
+# Every user's reviews, shaped like the per-user reviews table this schema replaced, so reading code
+# only filters on user_id. It is a view (see REVIEWS_VIEW), kept out of db.metadata so create_all()
+# leaves it alone; rows are added and removed through place_reviews and user_reviews. Its id and
+# sortable columns are user_reviews' own, so sorting and seeking on them use user_reviews' indexes.
+_views = db.MetaData()
+
+
+class Reviews(db.Model):
+    __table__ = db.Table(
+        'reviews', _views,
+        db.Column('id', db.Integer(), primary_key=True),
+        db.Column('user_id', db.Text(), primary_key=True),
+        db.Column('review_id', db.Integer()),
+        db.Column('place_id', db.Text()),
+        db.Column('place_name', db.Text()),
+        db.Column('reviewer', db.Text()),
+        db.Column('rating', db.Integer()),
+        db.Column('review_time', db.Text()),
+        db.Column('review_content', db.Text()),
+        db.Column('owner_response', db.Text()),
+        # owner_response with '' for none, to sort on
+        db.Column('response_sort', db.Text()),
+        db.Column('review_key', db.Text()))
+
+
+REVIEWS_VIEW = """CREATE VIEW reviews AS
+    SELECT user_reviews.review_id AS id, user_reviews.user_id AS user_id, place_reviews.position AS review_id,
+           place_reviews.place_id AS place_id, user_reviews.place_name AS place_name,
+           user_reviews.reviewer AS reviewer, user_reviews.rating AS rating, user_reviews.review_time AS review_time,
+           user_reviews.review_content AS review_content, place_reviews.owner_response AS owner_response,
+           user_reviews.owner_response AS response_sort, place_reviews.review_key AS review_key
+    FROM user_reviews
+    JOIN place_reviews ON place_reviews.id = user_reviews.review_id"""
+
+
+def local_place_id(place_name):
+    # Stand-in ID for places only known by name, such as CSV imports and reviews saved before places existed
+    return f"name:{place_name}"
+
+
+# Starts every content-derived review key
+CONTENT_KEY_PREFIX = 'h:'
+
+
+def make_review_key(reviewer, review_content, rating):
+    # Content-derived key for reviews without a Google review ID. Text is compared case- and
+    # whitespace-insensitively, and without the "…" Maps adds to truncated reviews.
+    text = ' '.join((review_content or '').casefold().split()).rstrip('…').rstrip()
+    digest = hashlib.sha1(f"{reviewer}\x1f{text}\x1f{rating}".encode('utf-8')).hexdigest()
+    return f"{CONTENT_KEY_PREFIX}{digest}"
+
+
+def make_content_hash(rating, review_content, owner_response):
+    # Changes when the reviewer edits the text or rating, or the owner responds or edits a response.
+    # Whitespace is normalized so a re-render of the same text is not an edit.
+    text = ' '.join((review_content or '').split())
+    response = ' '.join(owner_response.split()) if owner_response is not None else '\x00'
+    return hashlib.sha1(f"{rating}\x1f{text}\x1f{response}".encode('utf-8')).hexdigest()
+
+
+class ScrapeSnapshot(db.Model):
+    # One scrape of a place, compared with what was stored before it (see snapshots.py)
+    __tablename__ = 'scrape_snapshots'
+    id = db.Column(db.Integer(), primary_key=True)
+    place_id = db.Column(db.Text(), db.ForeignKey('places.place_id'), nullable=False)
+    taken_at = db.Column(db.Float(), nullable=False)
+    # The scrape read every review, so reviews it did not see were removed
+    complete = db.Column(db.Boolean(), nullable=False)
+    # First snapshot of the place: everything it saw is the starting point, not a change
+    baseline = db.Column(db.Boolean(), nullable=False)
+    review_count = db.Column(db.Integer(), nullable=False)
+    added = db.Column(db.Integer(), nullable=False)
+    edited = db.Column(db.Integer(), nullable=False)
+    removed = db.Column(db.Integer(), nullable=False)
+
+
+db.Index('ix_scrape_snapshots_place_taken_at', ScrapeSnapshot.place_id, ScrapeSnapshot.taken_at)
+
+
+class ReviewVersion(db.Model):
+    # A change a snapshot found. place_reviews always holds the latest content, so an edit keeps the
+    # content it replaced here; additions and removals only record when they happened.
+    __tablename__ = 'review_versions'
+    id = db.Column(db.Integer(), primary_key=True)
+    snapshot_id = db.Column(db.Integer(), db.ForeignKey('scrape_snapshots.id'), nullable=False)
+    review_id = db.Column(db.Integer(), db.ForeignKey('place_reviews.id'), nullable=False)
+    # 'added', 'edited' or 'removed'
+    change = db.Column(db.Text(), nullable=False)
+    rating = db.Column(db.Integer())
+    review_content = db.Column(db.Text())
+    owner_response = db.Column(db.Text())
+    content_hash = db.Column(db.Text())
+
+
+db.Index('ix_review_versions_snapshot_id', ReviewVersion.snapshot_id)
+db.Index('ix_review_versions_review_id', ReviewVersion.review_id)
+
+
+class ReviewAnalysis(db.Model):
+    # Language, sentiment and keywords of a review, written by analyze_reviews.py. content_hash and
+    # version say what was analyzed, so only new, edited or outdated results are redone.
+    __tablename__ = 'review_analysis'
+    review_id = db.Column(db.Integer(), db.ForeignKey('place_reviews.id'), primary_key=True)
+    content_hash = db.Column(db.Text(), nullable=False)
+    version = db.Column(db.Integer(), nullable=False)
+    # 'en', 'fr' or 'unknown'
+    language = db.Column(db.Text(), nullable=False)
+    # -1 (negative) to 1 (positive)
+    sentiment = db.Column(db.Float(), nullable=False)
+    response_sentiment = db.Column(db.Float())
+    # JSON list of the review's top words and two-word phrases
+    keywords = db.Column(db.Text(), nullable=False)
+    token_count = db.Column(db.Integer(), nullable=False)
+    analyzed_at = db.Column(db.Float(), nullable=False)
+
+
+db.Index('ix_review_analysis_language_sentiment', ReviewAnalysis.language, ReviewAnalysis.sentiment)
+
+
+class PlaceLookup(db.Model):
+    # Cached Places text search results; place_id is NULL when no place was found
+    __tablename__ = 'place_lookups'
+    query_key = db.Column(db.Text(), primary_key=True)
+    place_id = db.Column(db.Text())
+    official_name = db.Column(db.Text())
+    fetched_at = db.Column(db.Float(), nullable=False)
+
+
+class ScrapeCheckpoint(db.Model):
+    # Progress of an unfinished scrape, saved together with its reviews (see checkpoints.py)
+    __tablename__ = 'scrape_checkpoints'
+    place_id = db.Column(db.Text(), primary_key=True)
+    user_id = db.Column(db.Text(), primary_key=True)
+    place_name = db.Column(db.Text(), nullable=False)
+    target = db.Column(db.Integer(), nullable=False)
+    scraped_count = db.Column(db.Integer(), nullable=False)
+    last_review_key = db.Column(db.Text())
+    # JSON list of the keys of every review saved so far, in scrape order
+    review_keys = db.Column(db.Text(), nullable=False)
+    updated_at = db.Column(db.Float(), nullable=False)
+
+
+class ReviewSummary(db.Model):
+    # Review counts per user, place, month and rating, kept up to date by the SUMMARY_TRIGGERS below.
+    # Histograms, monthly averages, response rates and volume trends are all sums over these rows.
+    __tablename__ = 'review_summary'
+    user_id = db.Column(db.Text(), primary_key=True)
+    place_name = db.Column(db.Text(), primary_key=True)
+    month = db.Column(db.Text(), primary_key=True)
+    rating = db.Column(db.Integer(), primary_key=True)
+    review_count = db.Column(db.Integer(), nullable=False, default=0)
+    response_count = db.Column(db.Integer(), nullable=False, default=0)
+
+
+# Month bucket of a review; review_time is stored as YYYY-MM-DD
+_MONTH = "coalesce(substr({row}.review_time, 1, 7), 'unknown')"
+# Summary keys of one review: a row per user whose collection holds it, with the columns
+# user_id, place_name, month, rating and response (1 when the owner answered)
+_COLLECTED_REVIEW = f"""SELECT {{row}}.user_id AS user_id, places.name AS place_name,
+            {_MONTH.format(row='place_reviews')} AS month, place_reviews.rating AS rating,
+            place_reviews.owner_response IS NOT NULL AS response
+        FROM place_reviews JOIN places ON places.place_id = place_reviews.place_id
+        WHERE place_reviews.id = {{row}}.review_id"""
+_SHARED_REVIEW = f"""SELECT user_reviews.user_id AS user_id, places.name AS place_name,
+            {_MONTH.format(row='{row}')} AS month, {{row}}.rating AS rating,
+            {{row}}.owner_response IS NOT NULL AS response
+        FROM user_reviews JOIN places ON places.place_id = {{row}}.place_id
+        WHERE user_reviews.review_id = {{row}}.id"""
+_ADD_SUMMARY = """
+        INSERT INTO review_summary(user_id, place_name, month, rating, review_count, response_count)
+        SELECT user_id, place_name, month, rating, 1, response FROM ({keys}) WHERE true
+        ON CONFLICT(user_id, place_name, month, rating) DO UPDATE SET
+            review_count = review_count + 1, response_count = response_count + excluded.response_count;"""
+_REMOVE_SUMMARY = """
+        UPDATE review_summary SET review_count = review_count - 1, response_count = response_count - (
+            SELECT response FROM ({keys}) LIMIT 1)
+        WHERE (user_id, place_name, month, rating) IN (SELECT user_id, place_name, month, rating FROM ({keys}));
+        DELETE FROM review_summary
+        WHERE review_count <= 0
+          AND (user_id, place_name, month, rating) IN (SELECT user_id, place_name, month, rating FROM ({keys}));"""
+# Adding a review to a collection or taking it out changes that user's counts; editing a shared
+# review changes the counts of every user who has it
+SUMMARY_TRIGGERS = {
+    'review_summary_insert': f"""CREATE TRIGGER review_summary_insert AFTER INSERT ON user_reviews BEGIN{
+        _ADD_SUMMARY.format(keys=_COLLECTED_REVIEW.format(row='new'))}
+    END""",
+    'review_summary_delete': f"""CREATE TRIGGER review_summary_delete AFTER DELETE ON user_reviews BEGIN{
+        _REMOVE_SUMMARY.format(keys=_COLLECTED_REVIEW.format(row='old'))}
+    END""",
+    'review_summary_update': f"""CREATE TRIGGER review_summary_update
+    AFTER UPDATE OF review_time, rating, owner_response ON place_reviews BEGIN{
+        _REMOVE_SUMMARY.format(keys=_SHARED_REVIEW.format(row='old'))}{
+        _ADD_SUMMARY.format(keys=_SHARED_REVIEW.format(row='new'))}
+    END""",
+}
+
+
+def rebuild_review_summary(user_id=None, place_name=None):
+    # Set-based recompute for backfills: one GROUP BY over reviews replaces the summary rows in scope
+    conditions = []
+    params = {}
+    if user_id is not None:
+        conditions.append("user_id = :user_id")
+        params['user_id'] = user_id
+    if place_name is not None:
+        conditions.append("place_name = :place_name")
+        params['place_name'] = place_name
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    db.session.execute(db.text(f"DELETE FROM review_summary{where}"), params)
+    db.session.execute(db.text(f"""
+        INSERT INTO review_summary(user_id, place_name, month, rating, review_count, response_count)
+        SELECT user_id, place_name, {_MONTH.format(row='reviews')}, rating, COUNT(*), COUNT(owner_response)
+        FROM reviews{where}
+        GROUP BY 1, 2, 3, 4"""), params)
+    db.session.commit()
+
+
+# Full-text index over review text and owner responses. It is an external-content FTS5 table,
+# so the text is not stored twice, and the triggers keep it in step with every write to place_reviews.
+# Words are stemmed (porter), so "washroom" also finds "washrooms".
+FTS_SCHEMA = [
+    """CREATE VIRTUAL TABLE reviews_fts USING fts5(
+        review_content, owner_response, content='place_reviews', content_rowid='id',
+        tokenize='porter unicode61 remove_diacritics 2')""",
+    """CREATE TRIGGER IF NOT EXISTS reviews_fts_insert AFTER INSERT ON place_reviews BEGIN
+        INSERT INTO reviews_fts(rowid, review_content, owner_response)
+        VALUES (new.id, new.review_content, new.owner_response);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS reviews_fts_delete AFTER DELETE ON place_reviews BEGIN
+        INSERT INTO reviews_fts(reviews_fts, rowid, review_content, owner_response)
+        VALUES ('delete', old.id, old.review_content, old.owner_response);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS reviews_fts_update AFTER UPDATE OF review_content, owner_response
+    ON place_reviews BEGIN
+        INSERT INTO reviews_fts(reviews_fts, rowid, review_content, owner_response)
+        VALUES ('delete', old.id, old.review_content, old.owner_response);
+        INSERT INTO reviews_fts(rowid, review_content, owner_response)
+        VALUES (new.id, new.review_content, new.owner_response);
+    END""",
+]
 
 
 def create_all(app):
     with app.app_context():
-        db.create_all()
\ No newline at end of file
+        db.create_all()
+        upgrade_schema()
+
+
+def upgrade_legacy_reviews():
+    # Bring a per-user reviews table from before review keys up to the last layout it had
+    columns = {column['name'] for column in db.inspect(db.engine).get_columns('reviews')}
+    if 'review_key' not in columns:
+        db.session.execute(db.text("ALTER TABLE reviews ADD COLUMN review_key TEXT"))
+
+    rows = db.session.execute(db.text(
+        "SELECT id, reviewer, review_content, rating FROM reviews WHERE review_key IS NULL")).all()
+    if rows:
+        db.session.execute(db.text("UPDATE reviews SET review_key = :key WHERE id = :id"),
+                           [{'key': make_review_key(row.reviewer, row.review_content, row.rating), 'id': row.id}
+                            for row in rows])
+
+
+def migrate_legacy_reviews():
+    # Move a users.sqlite from the per-user reviews table to places, place_reviews and user_reviews.
+    # Each place's review is kept once, under its first id, and every user who had a copy gets it in
+    # their collection. Places are identified by the place ID of a cached lookup with the same name,
+    # or by local_place_id(). Runs in one transaction, so a failure leaves the old table as it was.
+    upgrade_legacy_reviews()
+    names = db.session.execute(db.text("SELECT DISTINCT place_name FROM reviews")).scalars().all()
+    looked_up = dict(db.session.execute(db.text(
+        "SELECT official_name, place_id FROM place_lookups WHERE place_id IS NOT NULL")).all())
+    db.session.execute(db.text("CREATE TEMP TABLE legacy_places (place_name TEXT PRIMARY KEY, place_id TEXT)"))
+    db.session.execute(db.text("INSERT INTO legacy_places VALUES (:place_name, :place_id)"),
+                       [{'place_name': name, 'place_id': looked_up.get(name) or local_place_id(name)}
+                        for name in names])
+    db.session.execute(db.text("""
+        INSERT INTO places(place_id, name, complete)
+        SELECT place_id, MIN(place_name), 0 FROM legacy_places WHERE true GROUP BY place_id
+        ON CONFLICT(place_id) DO NOTHING"""))
+    db.session.execute(db.text("""
+        INSERT INTO place_reviews(id, place_id, review_key, position, reviewer, rating, review_time, review_content,
+                                  owner_response)
+        SELECT reviews.id, legacy_places.place_id, reviews.review_key, reviews.review_id, reviews.reviewer,
+               reviews.rating, reviews.review_time, reviews.review_content, reviews.owner_response
+        FROM reviews JOIN legacy_places ON legacy_places.place_name = reviews.place_name
+        WHERE true ORDER BY reviews.id
+        ON CONFLICT(place_id, review_key) DO NOTHING"""))
+    db.session.execute(db.text("""
+        INSERT INTO user_reviews(user_id, review_id, place_name, reviewer, rating, review_time, review_content,
+                                 owner_response)
+        SELECT reviews.user_id, place_reviews.id, places.name, place_reviews.reviewer, place_reviews.rating,
+               place_reviews.review_time, place_reviews.review_content, coalesce(place_reviews.owner_response, '')
+        FROM reviews JOIN legacy_places ON legacy_places.place_name = reviews.place_name
+        JOIN place_reviews ON place_reviews.place_id = legacy_places.place_id
+                          AND place_reviews.review_key = reviews.review_key
+        JOIN places ON places.place_id = place_reviews.place_id
+        WHERE true
+        ON CONFLICT(user_id, review_id) DO NOTHING"""))
+    print(f"Moved {db.session.execute(db.text('SELECT COUNT(*) FROM reviews')).scalar()} reviews of "
+          f"{len(names)} places to the shared store.")
+    # The old search index and summary triggers belong to the old table; both are rebuilt below
+    db.session.execute(db.text("DROP TABLE IF EXISTS reviews_fts"))
+    db.session.execute(db.text("DROP TABLE reviews"))
+    db.session.execute(db.text("DROP TABLE legacy_places"))
+    db.session.execute(db.text("DELETE FROM review_summary"))
+    db.session.commit()
+
+
+def upgrade_schema():
+    # create_all() skips tables that already exist, so bring older databases up to date here
+    columns = {column['name'] for column in db.inspect(db.engine).get_columns('user_reviews')}
+    missing = [name for name in USER_REVIEW_SORT_COLUMNS if name not in columns]
+    for name in missing:
+        column_type = 'INTEGER' if name == 'rating' else 'TEXT'
+        db.session.execute(db.text(f"ALTER TABLE user_reviews ADD COLUMN {name} {column_type}"))
+    if missing:
+        db.session.execute(db.text(BACKFILL_SORT_COPIES))
+        db.session.commit()
+
+    reviews = db.session.execute(db.text("SELECT type, sql FROM sqlite_master WHERE name = 'reviews'")).first()
+    if reviews is not None and reviews.type == 'table':
+        migrate_legacy_reviews()
+    elif reviews is not None and reviews.sql != REVIEWS_VIEW:
+        # The view as an earlier version defined it
+        db.session.execute(db.text("DROP VIEW reviews"))
+    if reviews is None or reviews.sql != REVIEWS_VIEW:
+        db.session.execute(db.text(REVIEWS_VIEW))
+        db.session.commit()
+
+    columns = {column['name'] for column in db.inspect(db.engine).get_columns('place_reviews')}
+    for name, column_type in (('content_hash', 'TEXT'), ('snapshot_id', 'INTEGER'), ('removed_snapshot_id', 'INTEGER')):
+        if name not in columns:
+            db.session.execute(db.text(f"ALTER TABLE place_reviews ADD COLUMN {name} {column_type}"))
+    rows = db.session.execute(db.text(
+        "SELECT id, rating, review_content, owner_response FROM place_reviews WHERE content_hash IS NULL")).all()
+    if rows:
+        db.session.execute(db.text("UPDATE place_reviews SET content_hash = :hash WHERE id = :id"),
+                           [{'hash': make_content_hash(row.rating, row.review_content, row.owner_response),
+                             'id': row.id} for row in rows])
+    db.session.commit()
+
+    # Read index names straight from SQLite; reflection skips expression indexes
+    existing = set(db.session.execute(db.text("SELECT name FROM sqlite_master WHERE type = 'index'")).scalars())
+    if 'ux_users_username' not in existing:
+        duplicates = db.session.execute(db.text(
+            "SELECT username FROM users GROUP BY username HAVING COUNT(*) > 1")).scalars().all()
+        if duplicates:
+            # Can't pick which account to keep; the unique index waits until they are sorted out
+            print(f"Not indexing users.username, these usernames are taken more than once: {', '.join(duplicates)}")
+            existing.add('ux_users_username')
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(bind=db.engine)
+
+    fts = db.session.execute(db.text("SELECT sql FROM sqlite_master WHERE name = 'reviews_fts'")).scalar()
+    if fts != FTS_SCHEMA[0]:
+        if fts is not None:
+            # Made with an earlier tokenizer; its triggers stay and write to the new table
+            db.session.execute(db.text("DROP TABLE reviews_fts"))
+        for statement in FTS_SCHEMA:
+            db.session.execute(db.text(statement))
+        # Index the reviews that were saved before the search table existed, or before it stemmed words
+        db.session.execute(db.text("INSERT INTO reviews_fts(reviews_fts) VALUES ('rebuild')"))
+        db.session.commit()
+
+    triggers = set(db.session.execute(db.text("SELECT name FROM sqlite_master WHERE type = 'trigger'")).scalars())
+    for name, statement in SORT_COPY_TRIGGERS.items():
+        if name not in triggers:
+            db.session.execute(db.text(statement))
+    db.session.commit()
+    if not SUMMARY_TRIGGERS.keys() <= triggers:
+        for name, statement in SUMMARY_TRIGGERS.items():
+            if name not in triggers:
+                db.session.execute(db.text(statement))
+        # Summarize the reviews that were saved before the triggers existed
+        rebuild_review_summary()
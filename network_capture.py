@@ -0,0 +1,186 @@
+import glob
+import json
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+from metrics import REVIEW_ERRORS
+
+# Requests the review panel makes for each page of reviews
+REVIEWS_URL_PATTERN = 'listugcposts'
+# Google prefixes its JSON responses with this to stop them being evaluated as scripts
+XSSI_PREFIX = ")]}'"
+
+# Where things sit in a listugcposts response. Google moves these around from time to time;
+# when it does, only these paths need updating.
+RESPONSE_NEXT_PAGE = (1,)
+RESPONSE_REVIEWS = (2,)
+REVIEW_PATHS = {
+    'review_key': (0, 0),
+    'reviewer': (0, 1, 4, 5, 0),
+    # Microseconds since the epoch
+    'published': (0, 1, 2),
+    # The same text the page shows, used when the timestamp is missing
+    'relative_time': (0, 1, 6),
+    'rating': (0, 2, 0, 0),
+    'review_content': (0, 2, 15, 0, 0),
+    'owner_response': (0, 3, 14, 0, 0),
+}
+
+# Wraps XMLHttpRequest and fetch so the bodies of review page responses are kept in window.__grsCapture.
+# Has to run before the Reviews tab is opened, since that fetches the first page.
+INSTALL_CAPTURE_SCRIPT = """
+var pattern = arguments[0];
+if (!window.__grsCapture) {
+    window.__grsCapture = [];
+    var open = XMLHttpRequest.prototype.open;
+    XMLHttpRequest.prototype.open = function (method, url) {
+        this.__grsUrl = String(url);
+        return open.apply(this, arguments);
+    };
+    var send = XMLHttpRequest.prototype.send;
+    XMLHttpRequest.prototype.send = function () {
+        var xhr = this;
+        if (xhr.__grsUrl && xhr.__grsUrl.indexOf(pattern) !== -1) {
+            xhr.addEventListener('load', function () {
+                window.__grsCapture.push(xhr.responseText);
+            });
+        }
+        return send.apply(this, arguments);
+    };
+    if (window.fetch) {
+        var originalFetch = window.fetch;
+        window.fetch = function (input) {
+            var url = typeof input === 'string' ? input : (input && input.url) || '';
+            var promise = originalFetch.apply(this, arguments);
+            if (String(url).indexOf(pattern) !== -1) {
+                promise.then(function (response) {
+                    return response.clone().text();
+                }).then(function (text) {
+                    window.__grsCapture.push(text);
+                });
+            }
+            return promise;
+        };
+    }
+}
+return true;
+"""
+
+# Hands over the bodies captured since the last call, and drops every rendered card but the last
+# (which is still needed to scroll to) since their data is in the bodies already
+COLLECT_CAPTURE_SCRIPT = """
+var bodies = window.__grsCapture || [];
+window.__grsCapture = [];
+var cards = document.querySelectorAll(arguments[0]);
+for (var i = 0; i < cards.length - 1; i++) {
+    cards[i].remove();
+}
+return bodies;
+"""
+
+
+def install_capture(driver):
+    return driver.execute_script(INSTALL_CAPTURE_SCRIPT, REVIEWS_URL_PATTERN)
+
+
+def collect_captured(driver, selector):
+    return driver.execute_script(COLLECT_CAPTURE_SCRIPT, selector)
+
+
+def _at(data, path):
+    for index in path:
+        if not isinstance(data, list) or index >= len(data):
+            return None
+        data = data[index]
+    return data
+
+
+def decode_review(entry):
+    # Same fields as review_parser.parse_review_card, with review_time already an exact date when
+    # the response carries a timestamp, and relative_time as the fallback
+    reviewer = _at(entry, REVIEW_PATHS['reviewer'])
+    rating = _at(entry, REVIEW_PATHS['rating'])
+    if not isinstance(reviewer, str) or not isinstance(rating, int):
+        return None
+
+    published = _at(entry, REVIEW_PATHS['published'])
+    review_time = None
+    if isinstance(published, int):
+        review_time = datetime.fromtimestamp(published / 1_000_000, tz=timezone.utc).date()
+
+    return {
+        'review_key': _at(entry, REVIEW_PATHS['review_key']),
+        'reviewer': reviewer,
+        'rating': rating,
+        'review_time': review_time,
+        'relative_time': _at(entry, REVIEW_PATHS['relative_time']),
+        'review_content': _at(entry, REVIEW_PATHS['review_content']) or "No review text provided.",
+        'owner_response': _at(entry, REVIEW_PATHS['owner_response'])
+    }
+
+
+def decode_response(body):
+    # Returns (reviews, next page token) for one captured response body. Raises ValueError for a
+    # body that isn't a JSON response, such as an error page.
+    if not isinstance(body, str):
+        raise ValueError(f"expected a text response, got {type(body).__name__}")
+    if body.startswith(XSSI_PREFIX):
+        body = body[len(XSSI_PREFIX):]
+    data = json.loads(body)
+
+    reviews = []
+    for entry in _at(data, RESPONSE_REVIEWS) or []:
+        review = decode_review(entry)
+        if review is None:
+            REVIEW_ERRORS.inc(parser='network')
+            print("Problem occurred while decoding a review.")
+            continue
+        reviews.append(review)
+    return reviews, _at(data, RESPONSE_NEXT_PAGE)
+
+
+def decode_bodies(bodies):
+    # Reviews of every body that decodes; a body that doesn't is counted as a review error and skipped
+    reviews = []
+    for body in bodies:
+        try:
+            reviews.extend(decode_response(body)[0])
+        except ValueError as e:
+            REVIEW_ERRORS.inc(parser='network')
+            print(f"Problem occurred while decoding a review response: {e}")
+    return reviews
+
+
+def record_bodies(folder, bodies):
+    # Keep raw response bodies as fixtures for the decoder
+    os.makedirs(folder, exist_ok=True)
+    stamp = time.strftime('%Y%m%d-%H%M%S')
+    for body in bodies:
+        path = os.path.join(folder, f"{stamp}_{time.perf_counter_ns()}.json")
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(body)
+
+
+def main():
+    # Decode recorded response bodies and show what came out:
+    #   python network_capture.py recorded/*.json
+    paths = [path for pattern in sys.argv[1:] for path in glob.glob(pattern)]
+    if not paths:
+        print("Usage: python network_capture.py <recorded response files>")
+        return
+    total = 0
+    for path in sorted(paths):
+        with open(path, encoding='utf-8') as file:
+            reviews, next_page = decode_response(file.read())
+        total += len(reviews)
+        print(f"{path}: {len(reviews)} reviews, next page: {next_page!r}")
+        for review in reviews[:3]:
+            print(f"  {review['review_time']} {review['rating']}* {review['reviewer']}: "
+                  f"{review['review_content'][:60]!r}")
+    print(f"{total} reviews in {len(paths)} files")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+
+from models import PlaceLookup
+
+
+def normalize_query(place_name):
+    # "  Centre  BELL " and "centre bell" are the same lookup
+    return ' '.join(place_name.casefold().split())
+
+
+class PlaceCache:
+    # Two-level cache in front of the Places text search: an in-process LRU backed by the
+    # place_lookups table. "No place found" answers are cached too, for a shorter time.
+    # Lookup errors are never cached.
+    def __init__(self, client, engine, ttl=30 * 24 * 3600, negative_ttl=24 * 3600, lru_size=1024,
+                 lookup_workers=4, clock=time.time):
+        self.client = client
+        self.engine = engine
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.lru_size = lru_size
+        self.lookup_workers = lookup_workers
+        self.clock = clock
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self.table = PlaceLookup.__table__
+
+    def _is_fresh(self, place_id, fetched_at):
+        ttl = self.ttl if place_id else self.negative_ttl
+        return self.clock() - fetched_at < ttl
+
+    def _lru_get(self, key):
+        with self._lock:
+            entry = self._lru.get(key)
+            if entry is None:
+                return None
+            if not self._is_fresh(entry[0], entry[2]):
+                del self._lru[key]
+                return None
+            self._lru.move_to_end(key)
+            return entry
+
+    def _lru_put(self, key, entry):
+        with self._lock:
+            self._lru[key] = entry
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.lru_size:
+                self._lru.popitem(last=False)
+
+    def _load(self, keys):
+        # Fresh rows from the persistent table for the given keys, in chunks to stay under SQLite's variable limit
+        found = {}
+        keys = list(keys)
+        with self.engine.connect() as connection:
+            for start in range(0, len(keys), 500):
+                rows = connection.execute(select(self.table).where(self.table.c.query_key.in_(keys[start:start + 500])))
+                for row in rows:
+                    if self._is_fresh(row.place_id, row.fetched_at):
+                        found[row.query_key] = (row.place_id, row.official_name, row.fetched_at)
+        return found
+
+    def _store(self, entries):
+        if not entries:
+            return
+        rows = [{'query_key': key, 'place_id': place_id, 'official_name': official_name, 'fetched_at': fetched_at}
+                for key, (place_id, official_name, fetched_at) in entries.items()]
+        statement = insert(self.table)
+        statement = statement.on_conflict_do_update(
+            index_elements=[self.table.c.query_key],
+            set_={'place_id': statement.excluded.place_id,
+                  'official_name': statement.excluded.official_name,
+                  'fetched_at': statement.excluded.fetched_at})
+        with self.engine.begin() as connection:
+            connection.execute(statement, rows)
+
+    def _fetch(self, place_name):
+        place_result = self.client.places(place_name)
+        if place_result and 'results' in place_result and place_result['results']:
+            return place_result['results'][0]['place_id'], place_result['results'][0]['name'], self.clock()
+        return None, None, self.clock()
+
+    def resolve_many(self, place_names, limiter=None):
+        # Returns {place_name: (place_id, official_name)}; place_id is None when no place was found.
+        # Raises the client's exception if any lookup that had to go to the API failed.
+        # With a limiter, limiter.acquire() is called before every API request.
+        keys = {name: normalize_query(name) for name in place_names}
+        entries = {}
+        for key in set(keys.values()):
+            entry = self._lru_get(key)
+            if entry is not None:
+                entries[key] = entry
+
+        missing = set(keys.values()) - entries.keys()
+        if missing:
+            stored = self._load(missing)
+            entries.update(stored)
+            missing -= stored.keys()
+
+        if missing:
+            originals = {}
+            for name, key in keys.items():
+                originals.setdefault(key, name)
+            missing = sorted(missing)
+
+            def fetch(key):
+                if limiter is not None:
+                    limiter.acquire()
+                return self._fetch(originals[key])
+
+            with ThreadPoolExecutor(max_workers=self.lookup_workers) as executor:
+                fetched = dict(zip(missing, executor.map(fetch, missing)))
+            self._store(fetched)
+            entries.update(fetched)
+
+        for key, entry in entries.items():
+            self._lru_put(key, entry)
+
+        results = {}
+        for name, key in keys.items():
+            place_id, official_name, _ = entries[key]
+            results[name] = (place_id, official_name if place_id else name)
+        return results
+
+    def resolve(self, place_name, limiter=None):
+        return self.resolve_many([place_name], limiter)[place_name]
+
+    def clear(self):
+        with self._lock:
+            self._lru.clear()
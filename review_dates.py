@@ -0,0 +1,79 @@
+import re
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+# Months and years are approximate, as they always were
+UNIT_DAYS = {
+    'second': 1 / 86400,
+    'minute': 1 / 1440,
+    'hour': 1 / 24,
+    'day': 1,
+    'week': 7,
+    'month': 30,
+    'year': 365,
+}
+
+# Unit words of every supported Maps UI language, mapped to the units above
+UNIT_WORDS = {
+    # English
+    'second': 'second', 'minute': 'minute', 'hour': 'hour', 'day': 'day', 'week': 'week', 'month': 'month',
+    'year': 'year',
+    # French
+    'seconde': 'second', 'heure': 'hour', 'jour': 'day', 'semaine': 'week', 'mois': 'month', 'an': 'year',
+    'année': 'year',
+}
+
+# Words that stand for "one" ("a month ago", "il y a un mois")
+ONE_WORDS = {'a', 'an', 'one', 'un', 'une'}
+
+# "Edited 2 weeks ago" / "Modifié il y a 2 semaines" date the edit, which is the best date Maps shows
+EDITED_PREFIX = re.compile(r'^(?:edited|modifiée?)\s+')
+
+# One compiled pattern per locale; each captures the amount and the unit word
+PHRASES = [
+    re.compile(r'\b(\d+|an?|one)\s+(second|minute|hour|day|week|month|year)s?\s+ago'),
+    re.compile(r'\bil\s+y\s+a\s+(\d+|une?)\s+(seconde|minute|heure|jour|semaine|mois|années?|ans?)'),
+]
+
+# Phrases with no amount
+FIXED_PHRASES = {
+    'just now': timedelta(0), 'today': timedelta(0), 'yesterday': timedelta(days=1),
+    "à l'instant": timedelta(0), "aujourd'hui": timedelta(0), 'hier': timedelta(days=1),
+}
+
+
+@lru_cache(maxsize=4096)
+def parse_relative(text):
+    # How long ago a relative date string is, or None if it isn't one we understand.
+    # Cached: a scrape only ever sees a few dozen distinct strings.
+    text = ' '.join(text.replace('’', "'").casefold().split())
+    text = EDITED_PREFIX.sub('', text)
+    if text in FIXED_PHRASES:
+        return FIXED_PHRASES[text]
+    for phrase in PHRASES:
+        match = phrase.search(text)
+        if match is None:
+            continue
+        amount, word = match.groups()
+        number = 1 if amount in ONE_WORDS else int(amount)
+        unit = UNIT_WORDS.get(word) or UNIT_WORDS[word[:-1]]  # plural: "ans", "années"
+        return timedelta(days=UNIT_DAYS[unit] * number)
+    return None
+
+
+class DateNormalizer:
+    # Turns the relative review times Maps shows into dates, all anchored to one reference time
+    # (the start of the scrape) so reviews scraped at 23:59 and 00:01 don't land on different days.
+    def __init__(self, reference=None):
+        self.reference = reference or datetime.now()
+
+    def normalize(self, relative_date_str):
+        if not relative_date_str:
+            return None
+        offset = parse_relative(relative_date_str)
+        if offset is None:
+            return None
+        return (self.reference - offset).date()
+
+    def normalize_many(self, relative_date_strs):
+        return [self.normalize(relative_date_str) for relative_date_str in relative_date_strs]
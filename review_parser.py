@@ -0,0 +1,179 @@
+import re
+
+from lxml import html as lxml_html
+
+from metrics import REVIEW_ERRORS
+
+REVIEW_CARD_CSS = "div.jftiEf.fontBodyMedium"
+STAR_IMAGE_SRC = "//maps.gstatic.com/consumer/images/icons/2x/ic_star_rate_14.png"
+# The star rating's aria-label, "4 stars" / "4 étoiles"
+RATING_LABEL = re.compile(r'(\d+)')
+
+# Clicks every "More" button inside the loaded review cards in a single round trip
+EXPAND_MORE_SCRIPT = """
+var buttons = document.querySelectorAll(arguments[0] + ' button');
+var clicked = 0;
+for (var i = 0; i < buttons.length; i++) {
+    if (buttons[i].textContent.trim() === 'More') {
+        buttons[i].click();
+        clicked++;
+    }
+}
+return clicked;
+"""
+
+# Returns the markup of all loaded review cards at once
+REVIEW_CARDS_HTML_SCRIPT = """
+var cards = document.querySelectorAll(arguments[0]);
+var parts = [];
+for (var i = 0; i < cards.length; i++) {
+    parts.push(cards[i].outerHTML);
+}
+return parts.join('');
+"""
+
+
+def expand_all_reviews(driver):
+    return driver.execute_script(EXPAND_MORE_SCRIPT, REVIEW_CARD_CSS)
+
+
+def fetch_review_cards_html(driver):
+    return driver.execute_script(REVIEW_CARDS_HTML_SCRIPT, REVIEW_CARD_CSS)
+
+
+def _text(element):
+    # Mimic WebDriver's rendered text: line breaks for <br> and trimmed whitespace
+    for br in element.iter('br'):
+        br.tail = '\n' + (br.tail or '')
+    return ''.join(element.itertext()).strip()
+
+
+def _is_inside(element, container):
+    return any(ancestor is container for ancestor in element.iterancestors())
+
+
+def rating_from_label(label):
+    match = RATING_LABEL.search(label or '')
+    return int(match.group(1)) if match else None
+
+
+def parse_review_card(card):
+    reviewer = _text(card.xpath(".//div[contains(@class, 'd4r55 ')]")[0])
+
+    rating_span = card.xpath(".//span[contains(@class, 'kvMYJc')]")[0]
+    # The label works without images; counting star icons is the fallback
+    rating = rating_from_label(rating_span.get('aria-label'))
+    if rating is None:
+        rating = len(rating_span.xpath(".//img[@src=$src]", src=STAR_IMAGE_SRC))
+
+    review_time = _text(card.xpath(".//span[contains(@class, 'rsqaWe')]")[0])
+
+    content = card.xpath(".//span[contains(@class, 'wiI7pd')]")
+    review_content = _text(content[0]) if content else "No review text provided."
+
+    # The owner's response follows its label; make sure we don't pick up the next card's text
+    owner_response = None
+    response = card.xpath(".//span[text()='Response from the owner']/following::div[@class='wiI7pd'][1]")
+    if response and _is_inside(response[0], card):
+        owner_response = _text(response[0])
+
+    return {
+        # Google's own review ID, when the card carries one
+        'review_key': card.get('data-review-id'),
+        'reviewer': reviewer,
+        'rating': rating,
+        'review_time': review_time,
+        'review_content': review_content,
+        'owner_response': owner_response
+    }
+
+
+def parse_review_cards(cards_html):
+    # Parse all review cards in one pass; review_time is left as the relative text shown by Maps
+    if not cards_html:
+        return []
+
+    root = lxml_html.fragment_fromstring(cards_html, create_parent='div')
+    parsed = []
+    for card in root.xpath("./div[contains(@class, 'jftiEf fontBodyMedium ')]"):
+        try:
+            parsed.append(parse_review_card(card))
+        except Exception as e:
+            REVIEW_ERRORS.inc(parser='lxml')
+            print("Problem occurred while processing a review.")
+            print(f"Exception: {e}")
+            continue
+    return parsed
+
+
+# Expands and returns the cards loaded since the last call, then prunes harvested cards from the DOM.
+# The newest card stays in place (marked as harvested) so there is still something to scroll to.
+HARVEST_SCRIPT = """
+var selector = arguments[0];
+var fresh = document.querySelectorAll(selector + ':not([data-grs-harvested])');
+if (fresh.length === 0) {
+    return '';
+}
+var parts = [];
+for (var i = 0; i < fresh.length; i++) {
+    var buttons = fresh[i].querySelectorAll('button');
+    for (var j = 0; j < buttons.length; j++) {
+        if (buttons[j].textContent.trim() === 'More') {
+            buttons[j].click();
+        }
+    }
+    parts.push(fresh[i].outerHTML);
+}
+var old = document.querySelectorAll(selector + '[data-grs-harvested]');
+for (var i = 0; i < old.length; i++) {
+    old[i].remove();
+}
+for (var i = 0; i < fresh.length - 1; i++) {
+    fresh[i].remove();
+}
+fresh[fresh.length - 1].setAttribute('data-grs-harvested', '1');
+return parts.join('');
+"""
+
+# Scrolls the last loaded card and its scrollable container to the bottom to load the next page
+SCROLL_LAST_CARD_SCRIPT = """
+var cards = document.querySelectorAll(arguments[0]);
+if (cards.length === 0) {
+    return false;
+}
+var anchor = cards[cards.length - 1];
+anchor.scrollIntoView(false);
+var el = anchor.parentElement;
+while (el && el.scrollHeight <= el.clientHeight) {
+    el = el.parentElement;
+}
+if (el) {
+    el.scrollTop = el.scrollHeight;
+}
+return true;
+"""
+
+
+# Drops the loaded cards without reading them, keeping the newest one (marked as harvested) to scroll from
+SKIP_CARDS_SCRIPT = """
+var cards = document.querySelectorAll(arguments[0]);
+for (var i = 0; i < cards.length - 1; i++) {
+    cards[i].remove();
+}
+if (cards.length) {
+    cards[cards.length - 1].setAttribute('data-grs-harvested', '1');
+}
+return cards.length;
+"""
+
+
+def harvest_review_cards(driver):
+    return driver.execute_script(HARVEST_SCRIPT, REVIEW_CARD_CSS)
+
+
+def skip_review_cards(driver):
+    return driver.execute_script(SKIP_CARDS_SCRIPT, REVIEW_CARD_CSS)
+
+
+def scroll_to_last_card(driver):
+    return driver.execute_script(SCROLL_LAST_CARD_SCRIPT, REVIEW_CARD_CSS)
@@ -0,0 +1,155 @@
+import time
+
+from sqlalchemy import insert, text
+
+from models import db, PlaceReview, ReviewVersion, ScrapeSnapshot, make_content_hash
+
+# Everything the diff needs to know about a stored review, without its text
+INDEX_QUERY = text("""
+    SELECT id, review_key, content_hash, snapshot_id, removed_snapshot_id
+    FROM place_reviews WHERE place_id = :place_id""")
+
+# An edit keeps the content it replaces, so the review's history can be read back
+KEEP_VERSION = text("""
+    INSERT INTO review_versions(snapshot_id, review_id, change, rating, review_content, owner_response, content_hash)
+    SELECT :snapshot_id, id, 'edited', rating, review_content, owner_response, content_hash
+    FROM place_reviews WHERE id = :review_id""")
+APPLY_EDIT = text("""
+    UPDATE place_reviews SET rating = :rating, review_content = :review_content, owner_response = :owner_response,
+                             content_hash = :content_hash
+    WHERE id = :review_id""")
+
+
+def content_hash(review):
+    return make_content_hash(review['rating'], review['review_content'], review['owner_response'])
+
+
+def review_index(connection, place_id):
+    # review_key -> stored row, for hash lookups while diffing
+    return {row.review_key: row for row in connection.execute(INDEX_QUERY, {'place_id': place_id})}
+
+
+def diff_snapshot(index, reviews, complete):
+    # Compares a scrape with the stored reviews of its place in one pass over each. Returns
+    # (added, edited, removed): the ids of reviews no snapshot has seen yet (or that had been
+    # removed), (id, review, hash) for reviews whose content changed, and the ids of reviews a
+    # complete scrape no longer found. A partial scrape can't tell removed reviews from unread ones.
+    added = []
+    edited = []
+    seen = set()
+    for review in reviews:
+        key = review['review_key']
+        row = index.get(key)
+        if row is None or key in seen:
+            continue
+        seen.add(key)
+        if row.snapshot_id is None or row.removed_snapshot_id is not None:
+            added.append(row.id)
+            continue
+        review_hash = content_hash(review)
+        if review_hash != row.content_hash:
+            edited.append((row.id, review, review_hash))
+
+    removed = []
+    if complete:
+        removed = [row.id for key, row in index.items()
+                   if key not in seen and row.snapshot_id is not None and row.removed_snapshot_id is None]
+    return added, edited, removed
+
+
+def record_snapshot(connection, place_id, reviews, complete):
+    # Diff a scrape against what is stored and write only what changed, in the caller's transaction.
+    # The reviews themselves must already be saved. Returns the ScrapeSnapshot id.
+    index = review_index(connection, place_id)
+    baseline = connection.execute(db.select(ScrapeSnapshot.id).where(ScrapeSnapshot.place_id == place_id)
+                                  .limit(1)).first() is None
+    added, edited, removed = diff_snapshot(index, reviews, complete)
+    snapshot_id = connection.execute(insert(ScrapeSnapshot.__table__).values(
+        place_id=place_id, taken_at=time.time(), complete=complete, baseline=baseline, review_count=len(reviews),
+        added=0 if baseline else len(added), edited=len(edited), removed=len(removed))).inserted_primary_key[0]
+
+    table = PlaceReview.__table__
+    if baseline:
+        # Everything stored so far is the starting point, including reviews this scrape didn't reach
+        connection.execute(table.update().where(table.c.place_id == place_id, table.c.snapshot_id.is_(None))
+                           .values(snapshot_id=snapshot_id))
+    elif added:
+        connection.execute(insert(ReviewVersion.__table__), [
+            {'snapshot_id': snapshot_id, 'review_id': review_id, 'change': 'added'} for review_id in added])
+        for start in range(0, len(added), 500):
+            connection.execute(table.update().where(table.c.id.in_(added[start:start + 500]))
+                               .values(snapshot_id=snapshot_id, removed_snapshot_id=None))
+    if edited:
+        connection.execute(KEEP_VERSION, [{'snapshot_id': snapshot_id, 'review_id': review_id}
+                                          for review_id, _, _ in edited])
+        connection.execute(APPLY_EDIT, [{
+            'review_id': review_id,
+            'rating': review['rating'],
+            'review_content': review['review_content'],
+            'owner_response': review['owner_response'],
+            'content_hash': review_hash
+        } for review_id, review, review_hash in edited])
+    if removed:
+        connection.execute(insert(ReviewVersion.__table__), [
+            {'snapshot_id': snapshot_id, 'review_id': review_id, 'change': 'removed'} for review_id in removed])
+        for start in range(0, len(removed), 500):
+            connection.execute(table.update().where(table.c.id.in_(removed[start:start + 500]))
+                               .values(removed_snapshot_id=snapshot_id))
+    print(f"Snapshot of {place_id}: {len(reviews)} reviews, "
+          + ("baseline" if baseline else f"{len(added)} added, {len(edited)} edited, {len(removed)} removed"))
+    return snapshot_id
+
+
+def changes_since(place_id, since):
+    # What changed at the place in snapshots taken after `since` (a timestamp), netted per review:
+    # a review added and then removed in the period is left out, and an edited one is shown as it
+    # was before the first edit and as it is now. One pass over the period's versions.
+    snapshots = db.session.execute(db.select(ScrapeSnapshot).where(ScrapeSnapshot.place_id == place_id,
+                                                                   ScrapeSnapshot.taken_at > since)
+                                   .order_by(ScrapeSnapshot.taken_at)).scalars().all()
+    if not snapshots:
+        return {'snapshots': [], 'added': [], 'edited': [], 'removed': []}
+
+    versions = db.session.execute(
+        db.select(ReviewVersion, PlaceReview)
+        .join(PlaceReview, PlaceReview.id == ReviewVersion.review_id)
+        .where(ReviewVersion.snapshot_id.in_([snapshot.id for snapshot in snapshots]))
+        .order_by(ReviewVersion.snapshot_id, ReviewVersion.id)).all()
+    history = {}
+    for version, review in versions:
+        entry = history.setdefault(review.id, {'review': review, 'changes': [], 'before': None})
+        entry['changes'].append(version.change)
+        if version.change == 'edited' and entry['before'] is None:
+            entry['before'] = version
+
+    added, edited, removed = [], [], []
+    for entry in history.values():
+        changes = entry['changes']
+        if 'added' in changes:
+            if changes[-1] != 'removed':
+                added.append(entry['review'])
+        elif changes[-1] == 'removed':
+            removed.append(entry['review'])
+        elif entry['before'] is not None:
+            edited.append({'before': entry['before'], 'after': entry['review']})
+    return {'snapshots': snapshots, 'added': added, 'edited': edited, 'removed': removed}
+
+
+def _review_dict(review):
+    return {'id': review.id, 'reviewer': review.reviewer, 'rating': review.rating, 'review_time': review.review_time,
+            'review_content': review.review_content, 'owner_response': review.owner_response}
+
+
+def report_dict(report):
+    # changes_since() as plain data, for JSON
+    return {
+        'snapshots': [{'taken_at': snapshot.taken_at, 'review_count': snapshot.review_count,
+                       'complete': snapshot.complete, 'baseline': snapshot.baseline, 'added': snapshot.added,
+                       'edited': snapshot.edited, 'removed': snapshot.removed} for snapshot in report['snapshots']],
+        'added': [_review_dict(review) for review in report['added']],
+        'edited': [dict(_review_dict(edit['after']), before={'rating': edit['before'].rating,
+                                                             'review_content': edit['before'].review_content,
+                                                             'owner_response': edit['before'].owner_response})
+                   for edit in report['edited']],
+        'removed': [_review_dict(review) for review in report['removed']],
+    }
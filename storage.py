@@ -0,0 +1,555 @@
+import atexit
+import base64
+import json
+import queue
+import re
+import sqlite3
+import threading
+import time
+
+from sqlalchemy import event, literal, text, tuple_
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+
+from metrics import REVIEW_ERRORS
+from models import CONTENT_KEY_PREFIX, db, Place, PlaceReview, Reviews, ReviewSummary, UserReview, local_place_id, \
+    make_content_hash, make_review_key
+from snapshots import record_snapshot
+
+# Sortable columns of the review browser
+SORT_COLUMNS = {
+    'id': Reviews.id,
+    'place_name': Reviews.place_name,
+    'reviewer': Reviews.reviewer,
+    'rating': Reviews.rating,
+    'review_time': Reviews.review_time,
+    'review_content': Reviews.review_content,
+    'owner_response': Reviews.response_sort
+}
+
+
+# Set on every new SQLite connection. WAL lets readers carry on while a scrape is being written,
+# and the busy timeout makes a second writer wait its turn instead of failing with "database is locked".
+SQLITE_PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA busy_timeout=10000',
+    'PRAGMA temp_store=MEMORY',
+)
+
+
+@event.listens_for(Engine, 'connect')
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    for pragma in SQLITE_PRAGMAS:
+        cursor.execute(pragma)
+    cursor.close()
+
+
+def dated_reviews(reviews):
+    # review_time is required, and one review without it would fail the whole multi-row insert.
+    # Reviews whose date could not be read are left out and counted as review errors instead.
+    dated = [review_data for review_data in reviews if review_data['review_time'] is not None]
+    if len(dated) < len(reviews):
+        REVIEW_ERRORS.inc(len(reviews) - len(dated), parser='date')
+        print(f"Skipped {len(reviews) - len(dated)} reviews without a readable date.")
+    return dated
+
+
+def review_rows(reviews, place_id):
+    return [{
+        'place_id': place_id,
+        'review_key': review_data['review_key'],
+        'position': review_data['id'],
+        'reviewer': review_data['reviewer'],
+        'rating': review_data['rating'],
+        'review_time': review_data['review_time'],
+        'review_content': review_data['review_content'],
+        'owner_response': review_data['owner_response'],
+        'content_hash': make_content_hash(review_data['rating'], review_data['review_content'],
+                                          review_data['owner_response'])
+    } for review_data in reviews]
+
+
+def upsert_reviews_statement(update=False):
+    # INSERT into the shared store that skips, or with update=True overwrites, reviews already stored for the place
+    table = PlaceReview.__table__
+    statement = insert(table)
+    conflict_target = [table.c.place_id, table.c.review_key]
+    if update:
+        return statement.on_conflict_do_update(
+            index_elements=conflict_target,
+            set_={column: statement.excluded[column]
+                  for column in ('reviewer', 'rating', 'review_time', 'review_content', 'owner_response',
+                                 'content_hash')})
+    return statement.on_conflict_do_nothing(index_elements=conflict_target)
+
+
+def add_place_statement():
+    table = Place.__table__
+    return insert(table).on_conflict_do_nothing(index_elements=[table.c.place_id])
+
+
+# Whether the place has reviews stored under content-derived keys (migrated, imported, or scraped
+# without a Google review ID); a range scan of the unique index
+HAS_CONTENT_KEYS = text(f"""
+    SELECT 1 FROM place_reviews
+    WHERE place_id = :place_id AND review_key GLOB '{CONTENT_KEY_PREFIX}*'
+    LIMIT 1""")
+# Moves a review stored under its content key to the Google review ID a scrape found for it, so the
+# upsert that follows sees the same review instead of storing it twice
+ADOPT_REVIEW_KEY = text("""
+    UPDATE place_reviews SET review_key = :review_key
+    WHERE place_id = :place_id AND review_key = :content_key
+      AND NOT EXISTS (SELECT 1 FROM place_reviews WHERE place_id = :place_id AND review_key = :review_key)""")
+
+# Puts a stored review in a user's collection, with the copies of its sortable columns; run once per review
+COLLECT_REVIEW = text("""
+    INSERT INTO user_reviews(user_id, review_id, place_name, reviewer, rating, review_time, review_content,
+                             owner_response)
+    SELECT :user_id, place_reviews.id, places.name, place_reviews.reviewer, place_reviews.rating,
+           place_reviews.review_time, place_reviews.review_content, coalesce(place_reviews.owner_response, '')
+    FROM place_reviews JOIN places ON places.place_id = place_reviews.place_id
+    WHERE place_reviews.place_id = :place_id AND place_reviews.review_key = :review_key
+    ON CONFLICT(user_id, review_id) DO NOTHING""")
+
+
+# Moving a place saved under local_place_id() to its Google place ID (see adopt_local_place)
+PLACE_REVIEW_KEYS = text("""
+    SELECT id, review_key, reviewer, review_content, rating FROM place_reviews WHERE place_id = :place_id""")
+COPY_LOCAL_PLACE = text("""
+    INSERT INTO places(place_id, name, overall_rating, scraped_at, complete)
+    SELECT :place_id, name, overall_rating, scraped_at, complete FROM places WHERE place_id = :local_id
+    ON CONFLICT(place_id) DO NOTHING""")
+# Gives everyone who collected a duplicate the review it duplicates
+MERGE_COLLECTIONS = text("""
+    INSERT INTO user_reviews(user_id, review_id, place_name, reviewer, rating, review_time, review_content,
+                             owner_response)
+    SELECT user_reviews.user_id, place_reviews.id, places.name, place_reviews.reviewer, place_reviews.rating,
+           place_reviews.review_time, place_reviews.review_content, coalesce(place_reviews.owner_response, '')
+    FROM user_reviews JOIN place_reviews ON place_reviews.id = :review_id
+    JOIN places ON places.place_id = place_reviews.place_id
+    WHERE user_reviews.review_id = :duplicate_id
+    ON CONFLICT(user_id, review_id) DO NOTHING""")
+DROP_DUPLICATE_REVIEW = [text(f"DELETE FROM {table} WHERE review_id = :duplicate_id")
+                         for table in ('user_reviews', 'review_versions', 'review_analysis')] + [
+    text("DELETE FROM place_reviews WHERE id = :duplicate_id")]
+MOVE_LOCAL_PLACE = [
+    text("UPDATE place_reviews SET place_id = :place_id WHERE place_id = :local_id"),
+    text("UPDATE scrape_snapshots SET place_id = :place_id WHERE place_id = :local_id"),
+    text("DELETE FROM scrape_checkpoints WHERE place_id = :local_id"),
+    text("DELETE FROM places WHERE place_id = :local_id"),
+]
+
+
+def adopt_local_place(connection, place_id, place_name):
+    # Migrated and imported places are stored under local_place_id() until a scrape finds their
+    # Google place ID. Moves such a place, with its reviews and the collections holding them, to
+    # place_id, so its reviews aren't stored a second time. A review the place already has under
+    # place_id, by review key or content key, is merged into that one.
+    local_id = local_place_id(place_name)
+    if place_id == local_id or connection.execute(
+            text("SELECT 1 FROM places WHERE place_id = :local_id"), {'local_id': local_id}).first() is None:
+        return
+    stored = {}
+    for row in connection.execute(PLACE_REVIEW_KEYS, {'place_id': place_id}):
+        stored[row.review_key] = row.id
+        stored.setdefault(make_review_key(row.reviewer, row.review_content, row.rating), row.id)
+    duplicates = []
+    for row in connection.execute(PLACE_REVIEW_KEYS, {'place_id': local_id}).all():
+        review_id = stored.get(row.review_key) or stored.get(
+            make_review_key(row.reviewer, row.review_content, row.rating))
+        if review_id is not None:
+            duplicates.append({'review_id': review_id, 'duplicate_id': row.id})
+
+    parameters = {'place_id': place_id, 'local_id': local_id}
+    connection.execute(COPY_LOCAL_PLACE, parameters)
+    if duplicates:
+        connection.execute(MERGE_COLLECTIONS, duplicates)
+        for statement in DROP_DUPLICATE_REVIEW:
+            connection.execute(statement, duplicates)
+    for statement in MOVE_LOCAL_PLACE:
+        connection.execute(statement, parameters)
+    print(f"Moved {place_name} from {local_id} to {place_id}, merging {len(duplicates)} duplicate reviews.")
+
+
+def adopt_review_keys(connection, reviews, place_id):
+    # Reviews saved before they had a Google review ID are found by their content key
+    identified = [review_data for review_data in reviews
+                  if not review_data['review_key'].startswith(CONTENT_KEY_PREFIX)]
+    if not identified or connection.execute(HAS_CONTENT_KEYS, {'place_id': place_id}).first() is None:
+        return
+    connection.execute(ADOPT_REVIEW_KEY, [{
+        'place_id': place_id,
+        'review_key': review_data['review_key'],
+        'content_key': make_review_key(review_data['reviewer'], review_data['review_content'], review_data['rating'])
+    } for review_data in identified])
+
+
+def write_reviews(connection, reviews, place_id, place_name, user_id, update=False):
+    # One save: the place, its reviews in the shared store and the user's collection of them, on a
+    # session or connection whose transaction the caller commits. Returns the number of reviews
+    # that are new to the user's collection.
+    reviews = dated_reviews(reviews)
+    if not reviews:
+        return 0
+    adopt_local_place(connection, place_id, place_name)
+    connection.execute(add_place_statement(), {'place_id': place_id, 'name': place_name, 'complete': False})
+    adopt_review_keys(connection, reviews, place_id)
+    connection.execute(upsert_reviews_statement(update), review_rows(reviews, place_id))
+    return connection.execute(COLLECT_REVIEW, [
+        {'user_id': user_id, 'place_id': place_id, 'review_key': review_data['review_key']}
+        for review_data in reviews]).rowcount
+
+
+def mark_place_scraped(place_id, place_name, overall_rating, complete=None):
+    # (statement, parameters) recording a finished scrape of the place, for a save's `also`.
+    # complete=None keeps what the place had, for refreshes that only read the newest reviews.
+    table = Place.__table__
+    statement = insert(table)
+    updates = {'overall_rating': statement.excluded.overall_rating, 'scraped_at': statement.excluded.scraped_at}
+    if complete is not None:
+        updates['complete'] = statement.excluded.complete
+    return statement.on_conflict_do_update(index_elements=[table.c.place_id], set_=updates), {
+        'place_id': place_id,
+        'name': place_name,
+        'overall_rating': overall_rating,
+        'scraped_at': time.time(),
+        'complete': bool(complete)
+    }
+
+
+def bulk_save_reviews(reviews, place_name, user_id, update=False, place_id=None):
+    # Write a whole scrape in one transaction. Reviews whose review_key already exists for the place
+    # are skipped, or overwritten with update=True. Returns the number of reviews new to the user.
+    saved = write_reviews(db.session, reviews, place_id or local_place_id(place_name), place_name, user_id, update)
+    db.session.commit()
+    return saved
+
+
+class SaveRequest:
+    def __init__(self, reviews, place_name, user_id, update=False, also=(), place_id=None, snapshot=None):
+        self.reviews = reviews
+        self.place_id = place_id or local_place_id(place_name)
+        self.place_name = place_name
+        self.user_id = user_id
+        self.update = update
+        # (statement, parameters) pairs executed in the same transaction as the reviews
+        self.also = also
+        # (all reviews of the scrape, whether it read every review) to diff against the stored ones,
+        # when the save ends a scrape
+        self.snapshot = snapshot
+        self.saved = None
+        self.error = None
+        self.done = threading.Event()
+
+    def finish(self, saved=None, error=None):
+        self.saved = saved
+        self.error = error
+        self.done.set()
+
+    def wait(self, timeout=None):
+        # Number of reviews new to the user's collection, once the transaction holding them has committed
+        if not self.done.wait(timeout):
+            raise TimeoutError("Reviews were not saved in time.")
+        if self.error is not None:
+            raise self.error
+        return self.saved
+
+
+class ReviewWriter:
+    # Write-behind queue in front of the review tables. One thread does every review write, so
+    # concurrent scrapes never compete for SQLite's write lock; saves that queue up while a
+    # transaction runs are written together in the next one. At most max_pending saves wait in
+    # the queue, after that submit() blocks the scraper until the writer catches up.
+    def __init__(self, app, max_pending=32, max_batch_rows=5000, retries=5):
+        self.app = app
+        self.max_batch_rows = max_batch_rows
+        self.retries = retries
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.thread = None
+        self.lock = threading.Lock()
+        atexit.register(self.close)
+
+    def start(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name='review-writer', daemon=True)
+                self.thread.start()
+
+    def submit(self, reviews, place_name, user_id, update=False, also=(), place_id=None, snapshot=None):
+        self.start()
+        request = SaveRequest(reviews, place_name, user_id, update, also, place_id, snapshot)
+        self.queue.put(request)
+        return request
+
+    def save(self, reviews, place_name, user_id, update=False, also=(), timeout=None, place_id=None, snapshot=None):
+        return self.submit(reviews, place_name, user_id, update, also, place_id, snapshot).wait(timeout)
+
+    def flush(self):
+        # Wait until everything submitted so far is committed
+        if self.thread is not None:
+            self.queue.join()
+
+    def close(self):
+        # Write out what is still queued and stop the thread; called at exit
+        with self.lock:
+            thread, self.thread = self.thread, None
+        if thread is not None:
+            self.queue.put(None)
+            thread.join()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            request = self.queue.get()
+            if request is None:
+                self.queue.task_done()
+                break
+            batch = [request]
+            rows = len(request.reviews)
+            while rows < self.max_batch_rows:
+                try:
+                    request = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if request is None:
+                    stopping = True
+                    self.queue.task_done()
+                    break
+                batch.append(request)
+                rows += len(request.reviews)
+
+            try:
+                self._write(batch)
+            except Exception as e:
+                if len(batch) == 1:
+                    batch[0].finish(error=e)
+                else:
+                    # Don't let one bad scrape fail the others it was batched with
+                    for request in batch:
+                        try:
+                            self._write([request])
+                        except Exception as request_error:
+                            request.finish(error=request_error)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def _write(self, batch):
+        with self.app.app_context():
+            for attempt in range(self.retries + 1):
+                try:
+                    saved = []
+                    for request in batch:
+                        saved.append(write_reviews(db.session, request.reviews, request.place_id, request.place_name,
+                                                   request.user_id, request.update))
+                        if request.snapshot is not None:
+                            record_snapshot(db.session, request.place_id, *request.snapshot)
+                        for statement, parameters in request.also:
+                            db.session.execute(statement, parameters)
+                    db.session.commit()
+                    break
+                except OperationalError as e:
+                    db.session.rollback()
+                    if 'locked' not in str(e) or attempt == self.retries:
+                        raise
+                    time.sleep(0.1 * 2 ** attempt)
+                except Exception:
+                    db.session.rollback()
+                    raise
+        for request, count in zip(batch, saved):
+            request.finish(saved=count)
+
+
+def known_review_keys(place_id, place_name, user_id):
+    # Keys of the place's reviews in the user's collection, for a refresh to stop at. Reviews other
+    # users saved don't count: the refresh has to reach past them to add them to this user's list.
+    # A place not scraped since it was migrated or imported is still under local_place_id().
+    rows = db.session.execute(
+        db.select(PlaceReview.review_key).join(UserReview, UserReview.review_id == PlaceReview.id)
+        .where(UserReview.user_id == user_id,
+               PlaceReview.place_id.in_([place_id, local_place_id(place_name)])))
+    return {row.review_key for row in rows}
+
+
+def stored_review(index, review):
+    # A stored review shaped like a freshly scraped one
+    return {
+        'id': index,
+        'reviewer': review.reviewer,
+        'rating': review.rating,
+        'review_time': review.review_time,
+        'review_content': review.review_content,
+        'owner_response': review.owner_response,
+        'review_key': review.review_key
+    }
+
+
+def fresh_place(place_id, max_age):
+    # The place, if anyone scraped it in the last max_age seconds
+    place = db.session.get(Place, place_id)
+    if place is None or place.scraped_at is None or time.time() - place.scraped_at > max_age:
+        return None
+    return place
+
+
+def shared_reviews(place_id, limit):
+    # The first `limit` stored reviews of the place that are still on Google Maps, in list order, or
+    # None when fewer are stored and the last scrape did not read every review the place has
+    rows = db.session.execute(db.select(PlaceReview).where(PlaceReview.place_id == place_id,
+                                                           PlaceReview.removed_snapshot_id.is_(None))
+                              .order_by(PlaceReview.position, PlaceReview.id).limit(limit)).scalars().all()
+    if len(rows) < limit and not db.session.get(Place, place_id).complete:
+        return None
+    return [stored_review(index, review) for index, review in enumerate(rows, start=1)]
+
+
+def encode_cursor(sort_value, review_id):
+    return base64.urlsafe_b64encode(json.dumps([sort_value, review_id]).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        sort_value, review_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return sort_value, int(review_id)
+    except (ValueError, TypeError):
+        return None
+
+
+def review_page(user_id, option='id', order='asc', after=None, before=None, size=50):
+    # Keyset pagination: seek past the (sort value, id) of the last row shown instead of counting
+    # rows with OFFSET, so every page costs the same however many reviews the user has.
+    # Returns (reviews, next_cursor, previous_cursor); cursors are None at either end.
+    column = SORT_COLUMNS.get(option, Reviews.id)
+    descending = order == 'desc'
+    backwards = before is not None
+    cursor = decode_cursor(before if backwards else after) if (before or after) else None
+
+    query = db.select(Reviews, column.label('sort_value')).where(Reviews.user_id == user_id)
+    if cursor:
+        key = tuple_(column, Reviews.id)
+        boundary = tuple_(literal(cursor[0]), literal(cursor[1]))
+        # Moving forward through an ascending list, or backward through a descending one, means larger keys
+        query = query.where(key > boundary if descending == backwards else key < boundary)
+
+    if descending == backwards:
+        query = query.order_by(column.asc(), Reviews.id.asc())
+    else:
+        query = query.order_by(column.desc(), Reviews.id.desc())
+
+    rows = db.session.execute(query.limit(size + 1)).all()
+    has_more = len(rows) > size
+    rows = rows[:size]
+    if backwards:
+        rows.reverse()
+
+    next_cursor = previous_cursor = None
+    if rows:
+        if has_more or backwards:
+            next_cursor = encode_cursor(rows[-1].sort_value, rows[-1].Reviews.id)
+        if cursor and (has_more or not backwards):
+            previous_cursor = encode_cursor(rows[0].sort_value, rows[0].Reviews.id)
+    return [row.Reviews for row in rows], next_cursor, previous_cursor
+
+
+# Marks the matched terms in search snippets; replaced with <mark> after the text is HTML-escaped
+HIGHLIGHT_START = '\x02'
+HIGHLIGHT_END = '\x03'
+
+
+def fts_query(text):
+    # Turn what a user types into an FTS5 query: words and "quoted phrases" are matched literally,
+    # OR/AND/NOT work as operators, and a trailing * keeps prefix matching
+    terms = []
+    for token in re.findall(r'"[^"]*"|\S+', text):
+        if token in ('OR', 'AND', 'NOT'):
+            terms.append(token)
+            continue
+        prefix = token.endswith('*') and not token.startswith('"')
+        word = token.strip('"*').replace('"', '')
+        if word:
+            terms.append(f'"{word}"' + ('*' if prefix else ''))
+    # A query can't start or end with an operator
+    while terms and terms[0] in ('OR', 'AND', 'NOT'):
+        terms.pop(0)
+    while terms and terms[-1] in ('OR', 'AND', 'NOT'):
+        terms.pop()
+    return ' '.join(terms)
+
+
+def search_reviews(user_id, text, place_name=None, min_rating=None, max_rating=None, limit=50):
+    # Best matches first (bm25), with snippets around the matched terms in the review and the response
+    query = fts_query(text)
+    if not query:
+        return []
+
+    sql = f"""
+        SELECT reviews.*,
+               snippet(reviews_fts, 0, '{HIGHLIGHT_START}', '{HIGHLIGHT_END}', '…', 16) AS content_snippet,
+               snippet(reviews_fts, 1, '{HIGHLIGHT_START}', '{HIGHLIGHT_END}', '…', 16) AS response_snippet
+        FROM reviews_fts JOIN reviews ON reviews.id = reviews_fts.rowid
+        WHERE reviews_fts MATCH :query AND reviews.user_id = :user_id
+    """
+    params = {'query': query, 'user_id': user_id, 'limit': limit}
+    if place_name:
+        sql += " AND reviews.place_name = :place_name"
+        params['place_name'] = place_name
+    if min_rating is not None:
+        sql += " AND reviews.rating >= :min_rating"
+        params['min_rating'] = min_rating
+    if max_rating is not None:
+        sql += " AND reviews.rating <= :max_rating"
+        params['max_rating'] = max_rating
+    sql += " ORDER BY bm25(reviews_fts) LIMIT :limit"
+    return db.session.execute(db.text(sql), params).all()
+
+
+def user_place_names(user_id):
+    rows = db.session.execute(db.select(Reviews.place_name).where(Reviews.user_id == user_id)
+                              .distinct().order_by(Reviews.place_name))
+    return [row.place_name for row in rows]
+
+
+def user_place_id(user_id, place_name):
+    return db.session.execute(db.select(Reviews.place_id).where(Reviews.user_id == user_id,
+                                                                Reviews.place_name == place_name).limit(1)).scalar()
+
+
+def review_analytics(user_id, place_name=None):
+    # Per-place rating histogram, average rating, owner response rate and monthly trend, read from
+    # review_summary, so the cost grows with places and months rather than with reviews
+    query = db.select(ReviewSummary).where(ReviewSummary.user_id == user_id)
+    if place_name:
+        query = query.where(ReviewSummary.place_name == place_name)
+
+    places = {}
+    for row in db.session.execute(query.order_by(ReviewSummary.place_name, ReviewSummary.month)).scalars():
+        place = places.setdefault(row.place_name, {
+            'place_name': row.place_name, 'reviews': 0, 'rating_total': 0, 'responses': 0,
+            'histogram': {rating: 0 for rating in range(1, 6)}, 'months': {}})
+        place['reviews'] += row.review_count
+        place['rating_total'] += row.rating * row.review_count
+        place['responses'] += row.response_count
+        place['histogram'][row.rating] = place['histogram'].get(row.rating, 0) + row.review_count
+        month = place['months'].setdefault(row.month, {'month': row.month, 'reviews': 0, 'rating_total': 0,
+                                                       'responses': 0})
+        month['reviews'] += row.review_count
+        month['rating_total'] += row.rating * row.review_count
+        month['responses'] += row.response_count
+
+    results = []
+    for place in places.values():
+        months = []
+        for month in place['months'].values():
+            months.append({'month': month['month'], 'reviews': month['reviews'],
+                           'average_rating': round(month['rating_total'] / month['reviews'], 2),
+                           'response_rate': round(month['responses'] / month['reviews'], 3)})
+        results.append({'place_name': place['place_name'], 'reviews': place['reviews'],
+                        'average_rating': round(place['rating_total'] / place['reviews'], 2),
+                        'response_rate': round(place['responses'] / place['reviews'], 3),
+                        'histogram': place['histogram'], 'months': months})
+    return results
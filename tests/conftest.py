@@ -0,0 +1,36 @@
+import os
+import shutil
+
+import pytest
+from flask import Flask
+
+from models import db, create_all
+
+BASELINE_DB = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'instance', 'users.sqlite')
+
+
+def make_app(path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    db.init_app(app)
+    create_all(app)
+    return app
+
+
+@pytest.fixture
+def app(tmp_path):
+    # An empty database with the current schema
+    app = make_app(tmp_path / 'users.sqlite')
+    with app.app_context():
+        yield app
+
+
+@pytest.fixture
+def baseline_app(tmp_path):
+    # A copy of the checked-in users.sqlite (the per-user reviews table of 1130 Parc Jean-Drapeau
+    # reviews), migrated to the shared store
+    path = tmp_path / 'users.sqlite'
+    shutil.copy(BASELINE_DB, path)
+    app = make_app(path)
+    with app.app_context():
+        yield app
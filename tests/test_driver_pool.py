@@ -0,0 +1,15 @@
+import pytest
+
+from driver_pool import DriverPool
+
+
+def test_acquire_times_out_with_timeout_error_while_browsers_start():
+    pool = DriverPool(size=1)
+    pool._started = True
+    # The pool's only browser is still starting up, so a checkout waits for it to go idle
+    pool._total = 1
+
+    with pytest.raises(TimeoutError):
+        pool.acquire(timeout=0.05)
+    # The checkout slot was given back
+    assert pool._checkouts.acquire(blocking=False)
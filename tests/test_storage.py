@@ -0,0 +1,144 @@
+from sqlalchemy import text
+
+from models import db, FTS_SCHEMA, PlaceReview, local_place_id, upgrade_schema
+from snapshots import record_snapshot
+from storage import COLLECT_REVIEW, add_place_statement, known_review_keys, mark_place_scraped, review_rows, \
+    search_reviews, shared_reviews, stored_review, upsert_reviews_statement, write_reviews
+
+PLACE_NAME = 'Parc Jean-Drapeau'
+PLACE_ID = 'ChIJ-parc-jean-drapeau'
+
+
+def scraped(rows):
+    # Stored reviews as a scrape would find them again, under their Google review IDs
+    return [dict(stored_review(index, row), review_key=f'g{row.id}') for index, row in enumerate(rows, start=1)]
+
+
+def new_reviews(number):
+    return [{'id': index, 'reviewer': f'Reviewer {index}', 'rating': 4, 'review_time': '2024-05-01',
+             'review_content': f'Review {index}', 'owner_response': None, 'review_key': f'g{index}'}
+            for index in range(1, number + 1)]
+
+
+def scrape(reviews, complete, user_id='someone'):
+    # Saves a full scrape of PLACE_ID the way the review writer does
+    write_reviews(db.session, reviews, PLACE_ID, PLACE_NAME, user_id)
+    record_snapshot(db.session, PLACE_ID, reviews, complete)
+    statement, parameters = mark_place_scraped(PLACE_ID, PLACE_NAME, 4.5, complete)
+    db.session.execute(statement, parameters)
+    db.session.commit()
+
+
+def count(sql, **parameters):
+    return db.session.execute(text(sql), parameters).scalar()
+
+
+def migrated_reviews():
+    return db.session.execute(db.select(PlaceReview).order_by(PlaceReview.position)).scalars().all()
+
+
+def test_scrape_of_migrated_place_adopts_its_reviews(baseline_app):
+    rows = migrated_reviews()
+    user_id = count("SELECT user_id FROM user_reviews LIMIT 1")
+    assert {row.place_id for row in rows} == {local_place_id(PLACE_NAME)}
+
+    new_review = dict(scraped(rows[:1])[0], review_key='g-new', reviewer='Someone new', review_content='New text')
+    write_reviews(db.session, scraped(rows[:100]) + [new_review], PLACE_ID, PLACE_NAME, user_id)
+    db.session.commit()
+
+    assert count("SELECT COUNT(*) FROM places") == 1
+    assert count("SELECT COUNT(*) FROM place_reviews WHERE place_id = :place_id", place_id=PLACE_ID) == len(rows) + 1
+    assert count("SELECT COUNT(*) FROM place_reviews") == len(rows) + 1
+    assert count("SELECT COUNT(*) FROM user_reviews WHERE user_id = :user_id", user_id=user_id) == len(rows) + 1
+    assert count("SELECT SUM(review_count) FROM review_summary WHERE user_id = :user_id",
+                 user_id=user_id) == len(rows) + 1
+    # The 100 reviews the scrape found again now carry their Google review IDs
+    assert count("SELECT COUNT(*) FROM place_reviews WHERE review_key GLOB 'h:*'") == len(rows) - 100
+
+
+def test_migrated_place_merges_into_reviews_already_stored_under_its_place_id(baseline_app):
+    # Before migrated places were moved, scraping one stored its reviews a second time
+    rows = migrated_reviews()
+    user_id = count("SELECT user_id FROM user_reviews LIMIT 1")
+    db.session.execute(add_place_statement(), {'place_id': PLACE_ID, 'name': PLACE_NAME, 'complete': False})
+    db.session.execute(upsert_reviews_statement(), review_rows(scraped(rows[:50]), PLACE_ID))
+    db.session.execute(COLLECT_REVIEW, [{'user_id': 'other', 'place_id': PLACE_ID, 'review_key': f'g{row.id}'}
+                                        for row in rows[:50]])
+    db.session.commit()
+
+    write_reviews(db.session, scraped(rows[50:60]), PLACE_ID, PLACE_NAME, user_id)
+    db.session.commit()
+
+    assert count("SELECT COUNT(*) FROM places") == 1
+    assert count("SELECT COUNT(*) FROM place_reviews") == len(rows)
+    assert count("SELECT COUNT(*) FROM user_reviews WHERE user_id = :user_id", user_id=user_id) == len(rows)
+    assert count("SELECT COUNT(*) FROM user_reviews WHERE user_id = 'other'") == 50
+    assert count("SELECT COUNT(*) FROM reviews WHERE user_id = :user_id AND place_id != :place_id",
+                 user_id=user_id, place_id=PLACE_ID) == 0
+
+
+def test_shared_reviews_leave_out_removed_reviews(app):
+    reviews = new_reviews(30)
+    scrape(reviews, True)
+    # A complete rescrape that no longer finds the first 10 reviews
+    scrape(reviews[10:], True)
+
+    served = shared_reviews(PLACE_ID, 20)
+    assert [review['review_key'] for review in served] == [review['review_key'] for review in reviews[10:]]
+    assert len(shared_reviews(PLACE_ID, 25)) == 20
+
+
+def test_shared_reviews_need_enough_live_reviews_unless_complete(app):
+    reviews = new_reviews(30)
+    scrape(reviews, True)
+    scrape(reviews[10:], True)
+    # A partial scrape leaves the place incomplete, and the 10 removed reviews don't count towards 25
+    scrape(reviews[10:15], False)
+
+    assert shared_reviews(PLACE_ID, 25) is None
+    assert len(shared_reviews(PLACE_ID, 20)) == 20
+
+
+def save_texts(*texts):
+    reviews = [dict(review, review_content=review_text) for review, review_text in zip(new_reviews(len(texts)), texts)]
+    write_reviews(db.session, reviews, PLACE_ID, PLACE_NAME, 'someone')
+    db.session.commit()
+
+
+def found(query):
+    return sorted(row.review_content for row in search_reviews('someone', query))
+
+
+def test_search_matches_singular_and_plural(app):
+    save_texts('The washrooms were clean', 'One washroom for the whole park', 'Long lines at the entrance')
+
+    assert found('washroom') == ['One washroom for the whole park', 'The washrooms were clean']
+    assert found('washrooms') == ['One washroom for the whole park', 'The washrooms were clean']
+    assert found('line') == ['Long lines at the entrance']
+
+
+def test_upgrade_rebuilds_an_index_without_stemming(app):
+    save_texts('The washrooms were clean')
+    db.session.execute(text("DROP TABLE reviews_fts"))
+    db.session.execute(text(FTS_SCHEMA[0].replace("porter ", "")))
+    db.session.execute(text("INSERT INTO reviews_fts(reviews_fts) VALUES ('rebuild')"))
+    db.session.commit()
+    assert found('washroom') == []
+
+    upgrade_schema()
+    assert found('washroom') == ['The washrooms were clean']
+
+
+def test_refresh_only_knows_the_users_own_reviews(app):
+    reviews = new_reviews(30)
+    scrape(reviews, True, user_id='someone')
+    scrape(reviews[:5], False, user_id='other')
+
+    assert known_review_keys(PLACE_ID, PLACE_NAME, 'someone') == {review['review_key'] for review in reviews}
+    assert known_review_keys(PLACE_ID, PLACE_NAME, 'other') == {review['review_key'] for review in reviews[:5]}
+    assert known_review_keys(PLACE_ID, PLACE_NAME, 'nobody') == set()
+
+
+def test_refresh_knows_reviews_of_a_place_not_yet_moved_from_its_local_id(baseline_app):
+    user_id = count("SELECT user_id FROM user_reviews LIMIT 1")
+    assert len(known_review_keys(PLACE_ID, PLACE_NAME, user_id)) == len(migrated_reviews())
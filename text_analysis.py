@@ -0,0 +1,162 @@
+import math
+import re
+from collections import Counter
+
+# Bump when the tokenizer or the word lists change, so stored results are redone on the next run
+ANALYSIS_VERSION = 1
+
+# Words, and the punctuation that ends a clause
+TOKEN_PATTERN = re.compile(r"[^\W\d_]+(?:'[^\W\d_]+)*|[.!?,;:()]+")
+# Stands in for clause-ending punctuation: negations and phrases don't reach across it
+BREAK = '.'
+# French elided articles and pronouns: l'hôtel, d'attente, qu'il, n'est...
+ELISION = re.compile(r"^(l|d|j|m|n|s|t|c|qu|jusqu|lorsqu|puisqu)'(.+)$")
+
+STOPWORDS = {
+    'en': frozenset("""
+        a about above after again all also am an and any are as at be because been before being below between both
+        but by can could did do does doing down during each even few for from further get got had has have having he
+        her here hers him his how i if in into is it its itself just me more most my no nor not now of off on once
+        only or other our out over own same she should so some such than that the their them then there these they
+        this those through to too under until up us very was we were what when where which while who why will with
+        would you your go went one there's it's i'm i've we're they're that's don't didn't isn't wasn't can't
+        won't though although however still back well much many lot""".split()),
+    'fr': frozenset("""
+        à au aux avec ce ces cet cette dans de des du elle elles en et eux il ils je la le les leur leurs lui ma mais
+        me même mes moi mon ne nos notre nous on ou où par pas pour qu que qui sa se ses son sur ta te tes toi ton
+        tu un une vos votre vous c d j l m n s t y été était être avoir ai as avons avez ont est sont fait faire
+        comme plus très bien tout tous toute toutes aussi si alors donc car quand chez peu ici là ça cela ceci
+        sans sous entre vers lors dont""".split()),
+}
+
+# Word scores from -3 to 3, in the spirit of AFINN, limited to words that come up in place reviews
+LEXICON = {
+    'en': {
+        'amazing': 3, 'awesome': 3, 'excellent': 3, 'fantastic': 3, 'outstanding': 3, 'perfect': 3, 'superb': 3,
+        'wonderful': 3, 'love': 3, 'loved': 3, 'best': 3, 'incredible': 3, 'delicious': 3,
+        'great': 2, 'beautiful': 2, 'friendly': 2, 'helpful': 2, 'clean': 2, 'enjoyed': 2, 'fun': 2, 'nice': 2,
+        'recommend': 2, 'recommended': 2, 'good': 2, 'lovely': 2, 'tasty': 2, 'fresh': 2, 'pleasant': 2,
+        'welcoming': 2, 'happy': 2, 'impressive': 2, 'worth': 2, 'cozy': 2, 'kind': 2,
+        'fine': 1, 'ok': 1, 'okay': 1, 'decent': 1, 'quick': 1, 'fast': 1, 'cheap': 1, 'easy': 1, 'liked': 1,
+        'cool': 1, 'reasonable': 1, 'thanks': 1, 'thank': 1,
+        'slow': -1, 'expensive': -1, 'overpriced': -2, 'crowded': -1, 'noisy': -1, 'small': -1, 'wait': -1,
+        'average': -1, 'meh': -1, 'bland': -1, 'cold': -1, 'closed': -1, 'confusing': -1,
+        'bad': -2, 'poor': -2, 'dirty': -2, 'rude': -2, 'disappointing': -2, 'disappointed': -2, 'worse': -2,
+        'broken': -2, 'unfriendly': -2, 'mediocre': -2, 'problem': -2, 'sad': -2, 'annoying': -2, 'unhelpful': -2,
+        'terrible': -3, 'horrible': -3, 'awful': -3, 'worst': -3, 'disgusting': -3, 'hate': -3, 'scam': -3,
+        'avoid': -2,
+    },
+    'fr': {
+        'excellent': 3, 'excellente': 3, 'magnifique': 3, 'parfait': 3, 'parfaite': 3, 'superbe': 3,
+        'merveilleux': 3, 'extraordinaire': 3, 'incroyable': 3, 'délicieux': 3, 'délicieuse': 3, 'adore': 3,
+        'adoré': 3, 'meilleur': 3, 'meilleure': 3, 'génial': 3, 'géniale': 3,
+        'bon': 2, 'bonne': 2, 'beau': 2, 'belle': 2, 'agréable': 2, 'sympathique': 2, 'sympa': 2, 'accueillant': 2,
+        'accueillante': 2, 'propre': 2, 'recommande': 2, 'aimable': 2, 'chaleureux': 2, 'chaleureuse': 2,
+        'joli': 2, 'jolie': 2, 'frais': 2, 'fraîche': 2, 'plaisir': 2, 'serviable': 2, 'top': 2, 'content': 2,
+        'contente': 2, 'aimé': 2,
+        'correct': 1, 'correcte': 1, 'rapide': 1, 'abordable': 1, 'intéressant': 1, 'intéressante': 1, 'merci': 1,
+        'lent': -1, 'lente': -1, 'cher': -1, 'chère': -1, 'bruyant': -1, 'bruyante': -1, 'attente': -1,
+        'moyen': -1, 'moyenne': -1, 'fade': -1, 'froid': -1, 'froide': -1, 'fermé': -1,
+        'mauvais': -2, 'mauvaise': -2, 'sale': -2, 'impoli': -2, 'impolie': -2, 'décevant': -2, 'décevante': -2,
+        'déçu': -2, 'déçue': -2, 'pire': -2, 'médiocre': -2, 'problème': -2, 'triste': -2,
+        'horrible': -3, 'affreux': -3, 'affreuse': -3, 'dégoûtant': -3, 'dégueulasse': -3, 'nul': -3, 'nulle': -3,
+        'arnaque': -3, 'éviter': -2,
+    },
+}
+NEGATIONS = frozenset("not no never nothing none nobody neither nor isn't wasn't don't didn't can't won't "
+                      "ne pas jamais rien aucun aucune sans ni".split())
+INTENSIFIERS = frozenset("very really so extremely super too quite truly absolutely "
+                         "très vraiment trop tellement super extrêmement assez".split())
+# Words after a negation whose score is flipped
+NEGATION_SCOPE = 3
+# Left out of keywords
+ALL_STOPWORDS = STOPWORDS['en'] | STOPWORDS['fr'] | NEGATIONS | INTENSIFIERS
+# What the scraper stores for reviews that only have a rating
+NO_TEXT = "No review text provided."
+
+
+def tokenize(text):
+    # Lowercased words and BREAKs; French elisions are split off (l'hôtel -> hôtel, n'est -> ne est)
+    tokens = []
+    for word in TOKEN_PATTERN.findall((text or '').replace('’', "'").casefold()):
+        if not word[0].isalpha():
+            if tokens and tokens[-1] != BREAK:
+                tokens.append(BREAK)
+            continue
+        match = ELISION.match(word)
+        if match:
+            prefix, word = match.groups()
+            if prefix == 'n':
+                tokens.append('ne')
+        tokens.append(word)
+    return tokens
+
+
+def detect_language(tokens):
+    # 'en' or 'fr' by which language's stopwords the text uses more, 'unknown' for too little to go on
+    english = sum(1 for token in tokens if token in STOPWORDS['en'])
+    french = sum(1 for token in tokens if token in STOPWORDS['fr'])
+    if max(english, french) < 2 or english == french:
+        return 'unknown'
+    return 'en' if english > french else 'fr'
+
+
+def sentiment(tokens, language):
+    # -1 (negative) to 1 (positive). Negations flip the next few words and intensifiers strengthen the next one.
+    # Unknown languages are scored with both word lists.
+    lexicons = [LEXICON[language]] if language in LEXICON else list(LEXICON.values())
+    total = 0.0
+    negated_until = -1
+    boost = 1.0
+    for index, token in enumerate(tokens):
+        if token == BREAK:
+            negated_until = -1
+            boost = 1.0
+            continue
+        if token in NEGATIONS:
+            negated_until = index + NEGATION_SCOPE
+            continue
+        if token in INTENSIFIERS:
+            boost = 1.5
+            continue
+        score = next((lexicon[token] for lexicon in lexicons if token in lexicon), 0)
+        if score:
+            if index <= negated_until:
+                score = -score * 0.75
+            total += score * boost
+        boost = 1.0
+    # Same normalization as VADER, so long reviews don't run off the scale
+    return round(total / math.sqrt(total * total + 15), 4)
+
+
+def keywords(tokens, limit=10):
+    # The review's most frequent words and two-word phrases within a clause, leaving out stopwords and
+    # very short words (BREAKs included)
+    content = [token if token not in ALL_STOPWORDS and len(token) > 2 else None for token in tokens]
+    counts = Counter(token for token in content if token)
+    counts.update(f"{first} {second}" for first, second in zip(content, content[1:]) if first and second)
+    # Counter keeps first-seen order among equal counts
+    return [term for term, _ in counts.most_common(limit)]
+
+
+def analyze_text(review_content, owner_response):
+    tokens = tokenize(review_content) if review_content != NO_TEXT else []
+    language = detect_language(tokens)
+    result = {
+        'language': language,
+        'sentiment': sentiment(tokens, language),
+        'keywords': keywords(tokens),
+        'token_count': sum(1 for token in tokens if token != BREAK),
+        'response_sentiment': None,
+    }
+    if owner_response:
+        response_tokens = tokenize(owner_response)
+        result['response_sentiment'] = sentiment(response_tokens, detect_language(response_tokens))
+    return result
+
+
+def analyze_chunk(rows):
+    # Runs in a worker process: (review id, content hash, review text, owner response) rows in,
+    # one result dict per row out
+    return [dict(analyze_text(review_content, owner_response), review_id=review_id, content_hash=content_hash)
+            for review_id, content_hash, review_content, owner_response in rows]
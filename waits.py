@@ -0,0 +1,126 @@
+import time
+
+from selenium.common.exceptions import TimeoutException
+from selenium.webdriver.support.ui import WebDriverWait
+
+from review_parser import REVIEW_CARD_CSS
+
+# Counts every review card ever added to the page, including cards that were pruned afterwards
+INSTALL_OBSERVER_SCRIPT = """
+var selector = arguments[0];
+if (!window.__grsObserver) {
+    window.__grsAdded = document.querySelectorAll(selector).length;
+    window.__grsObserver = new MutationObserver(function (mutations) {
+        for (var i = 0; i < mutations.length; i++) {
+            var nodes = mutations[i].addedNodes;
+            for (var j = 0; j < nodes.length; j++) {
+                var node = nodes[j];
+                if (node.nodeType !== 1) {
+                    continue;
+                }
+                if (node.matches(selector)) {
+                    window.__grsAdded++;
+                }
+                window.__grsAdded += node.querySelectorAll(selector).length;
+            }
+        }
+    });
+    window.__grsObserver.observe(document.body, {childList: true, subtree: true});
+}
+return window.__grsAdded;
+"""
+
+CARD_COUNT_SCRIPT = """
+if (window.__grsObserver) {
+    return window.__grsAdded;
+}
+return document.querySelectorAll(arguments[0]).length;
+"""
+
+
+class StallPolicy:
+    def __init__(self, wait_timeout=2.0, max_stalled_waits=5, poll_interval=0.05):
+        # How long a single wait for new cards may take before it counts as a stall
+        self.wait_timeout = wait_timeout
+        # Consecutive stalled waits after which the scrape gives up
+        self.max_stalled_waits = max_stalled_waits
+        self.poll_interval = poll_interval
+
+
+class WaitStats:
+    def __init__(self):
+        self.wait_time = 0.0
+        self.work_time = 0.0
+        self.waits = 0
+        self.stalled_waits = 0
+
+    def __str__(self):
+        total = self.wait_time + self.work_time
+        share = 100 * self.wait_time / total if total else 0
+        return (f"Waited {self.wait_time:.2f}s over {self.waits} waits ({self.stalled_waits} stalled), "
+                f"worked {self.work_time:.2f}s, {share:.0f}% of the time spent waiting")
+
+
+class ReviewWaiter:
+    # Replaces fixed sleeps: every wait returns as soon as its condition holds, and the time
+    # between waits is booked as work so the stats show where a scrape's wall-clock time went
+    def __init__(self, driver, policy=None, selector=REVIEW_CARD_CSS):
+        self.driver = driver
+        self.policy = policy or StallPolicy()
+        self.selector = selector
+        self.stats = WaitStats()
+        self.stalled = 0
+        self._mark = time.perf_counter()
+
+    def _book_work(self):
+        now = time.perf_counter()
+        self.stats.work_time += now - self._mark
+        self._mark = now
+
+    def _book_wait(self):
+        now = time.perf_counter()
+        self.stats.wait_time += now - self._mark
+        self.stats.waits += 1
+        self._mark = now
+
+    def install(self):
+        return self.driver.execute_script(INSTALL_OBSERVER_SCRIPT, self.selector)
+
+    def count(self):
+        return self.driver.execute_script(CARD_COUNT_SCRIPT, self.selector)
+
+    def until(self, condition, timeout):
+        # Wait for an arbitrary expected condition; raises TimeoutException like WebDriverWait
+        self._book_work()
+        try:
+            return WebDriverWait(self.driver, timeout, poll_frequency=self.policy.poll_interval).until(condition)
+        finally:
+            self._book_wait()
+
+    def wait_for_more(self, previous_count):
+        # Returns the new card count as soon as it exceeds previous_count, or previous_count on a stall
+        self._book_work()
+        try:
+            count = WebDriverWait(self.driver, self.policy.wait_timeout,
+                                  poll_frequency=self.policy.poll_interval).until(
+                lambda driver: self._more_than(previous_count))
+            self.stalled = 0
+            return count
+        except TimeoutException:
+            self.stalled += 1
+            self.stats.stalled_waits += 1
+            return previous_count
+        finally:
+            self._book_wait()
+
+    def _more_than(self, previous_count):
+        count = self.count()
+        return count if count > previous_count else False
+
+    @property
+    def is_stalled(self):
+        return self.stalled >= self.policy.max_stalled_waits
+
+    def finish(self):
+        self._book_work()
+        return self.stats